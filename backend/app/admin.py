@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from app.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from app.shopping_cart import restore_recipe, withdraw_recipe
 
 
 class TegAdmin(admin.ModelAdmin):
@@ -27,10 +28,22 @@ class IngredientRecipe(admin.TabularInline):
 
 class RecipeAdmin(admin.ModelAdmin):
     inlines = [IngredientRecipe, ]
-    list_display = ('author', 'name', 'cooking_time', 'ingredient')
-    search_fields = ('name', 'author', 'tags')
+    list_display = ('name', 'author', 'cooking_time', 'favorites_count',
+                    'shopping_cart_count')
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username', 'tags__name')
+
+    def save_related(self, request, form, formsets, change):
+        # Строки состава меняются формсетом без помощников списка покупок:
+        # состав рецепта вычитается из сумм до сохранения и
+        # возвращается после, в транзакции страницы админки.
+        if change:
+            withdraw_recipe(form.instance.id)
+        super().save_related(request, form, formsets, change)
+        if change:
+            restore_recipe(form.instance.id)
 
 
 admin.site.register(Tag)
 admin.site.register(Ingredient)
-admin.site.register(Recipe)
+admin.site.register(Recipe, RecipeAdmin)
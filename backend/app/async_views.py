@@ -0,0 +1,85 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.urls import URLPattern
+
+# Маршруты, которые в режиме ASGI обслуживаются асинхронными
+# представлениями: частые запросы и ответы, долго уходящие клиенту.
+HOT_ROUTES = frozenset((
+    'recipes-list',
+    'recipes-detail',
+    'recipes-favorite',
+    'recipes-shopping-cart',
+    'recipes-download-shopping-cart',
+    'ingredient-list',
+))
+# Порции потокового ответа склеиваются до такого размера: меньше
+# сообщений ASGI и переключений цикла событий на одну выгрузку.
+STREAM_CHUNK = 64 * 1024
+
+
+def _coalesce(chunks, size=STREAM_CHUNK):
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def async_view(view):
+    """
+    Асинхронное представление поверх синхронного представления DRF.
+    Диспетчеризация, запросы к базе, сериализация и рендеринг идут
+    одним переходом в поток thread_sensitive, которому принадлежат
+    соединения с базой; в цикле событий остаются только ожидание и
+    отдача ответа. В Django 3.2 нет ThreadSensitiveContext, и все такие
+    переходы воркера идут в один общий поток: работа с базой в процессе
+    последовательна, как и у синхронного воркера, а выигрыш режима
+    ASGI - в чтении тел и отдаче ответов медленным клиентам в цикле
+    событий.
+
+    Потоковый ответ в этом же переходе собирается в память. Это
+    ограничение Django 3.2: ASGIHandler перебирает тело синхронным
+    циклом прямо в цикле событий, где ORM недоступен, а соединение
+    общего потока закрывается в конце каждого запроса, так что ленивый
+    генератор по базе потерял бы курсор между порциями. Выгрузка корзины
+    ограничена размером каталога ингредиентов. Начиная с Django 4.2
+    StreamingHttpResponse принимает асинхронный итератор, и выгрузку
+    можно будет отдавать порциями без сборки.
+    """
+
+    def respond(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.streaming:
+            response.streaming_content = list(
+                _coalesce(response.streaming_content))
+        elif hasattr(response, 'render'):
+            response.render()
+        return response
+
+    respond = sync_to_async(respond, thread_sensitive=True)
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await respond(request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_patterns(patterns, names=HOT_ROUTES):
+    """
+    Маршруты роутера DRF в прежнем порядке, у маршрутов из names -
+    асинхронные представления: шаблоны и имена те же, поэтому reverse и
+    метрики по маршрутам не меняются.
+    """
+    return [
+        URLPattern(pattern.pattern, async_view(pattern.callback),
+                   pattern.default_args, pattern.name)
+        if isinstance(pattern, URLPattern) and pattern.name in names
+        else pattern
+        for pattern in patterns
+    ]
@@ -0,0 +1,420 @@
+import base64
+import io
+import json
+import statistics
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.urls import URLResolver
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from app.catalog import invalidate_snapshot
+from app.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from app.response_cache import bump_data_version
+from app.seeding import PASSWORD, seed_database
+from users.models import Profile
+
+User = get_user_model()
+
+Scenario = namedtuple(
+    'Scenario',
+    ('key', 'route', 'method', 'path', 'role', 'data', 'status', 'capture',
+     'headers'),
+    defaults=(None, 200, None, None),
+)
+Measurement = namedtuple(
+    'Measurement', ('key', 'status', 'queries', 'time_ms', 'bytes'))
+METRICS = ('queries', 'time_ms', 'bytes')
+
+# Маршруты, отправляющие письма или меняющие учётные данные по ссылке
+# из письма. В бенчмарке они не участвуют, но должны быть перечислены,
+# чтобы проверка покрытия маршрутов не пропускала новые эндпоинты.
+SKIPPED_ROUTES = frozenset((
+    'user-activation',
+    'user-resend-activation',
+    'user-reset-password',
+    'user-reset-password-confirm',
+    'user-reset-username',
+    'user-reset-username-confirm',
+    'user-set-username',
+))
+
+LATER_THAN_ANY_CHANGE = 'Fri, 01 Jan 2100 00:00:00 GMT'
+
+
+def _image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), '#E26C2D').save(buffer, 'JPEG')
+    return ('data:image/jpeg;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def _recipe_payload(context):
+    return {
+        'name': 'Бенчмарк пирог',
+        'text': 'Смешайте всё и запекайте сорок минут.',
+        'cooking_time': 40,
+        'image': context['image'],
+        'tags': context['tags'][:2],
+        'ingredients': [{'id': ingredient, 'amount': 10 + i}
+                        for i, ingredient in enumerate(
+                            context['ingredients'][:12])],
+    }
+
+
+def _recipe_update_payload(context):
+    payload = _recipe_payload(context)
+    payload['tags'] = context['tags'][1:3]
+    payload['ingredients'] = [{'id': ingredient, 'amount': 20}
+                              for ingredient in context['ingredients'][6:18]]
+    return payload
+
+
+SCENARIOS = (
+    Scenario('api-root', 'api-root', 'get', '/api/', 'anon'),
+    Scenario('recipes-list:anon', 'recipes-list', 'get',
+             '/api/recipes/', 'anon'),
+    Scenario('recipes-list:anon-limit-100', 'recipes-list', 'get',
+             '/api/recipes/?limit=100', 'anon'),
+    Scenario('recipes-list:anon-cached', 'recipes-list', 'get',
+             '/api/recipes/', 'anon'),
+    Scenario('recipes-list:anon-not-modified', 'recipes-list', 'get',
+             '/api/recipes/', 'anon', status=304,
+             headers={'HTTP_IF_MODIFIED_SINCE': LATER_THAN_ANY_CHANGE}),
+    Scenario('recipes-list:user', 'recipes-list', 'get',
+             '/api/recipes/', 'user'),
+    Scenario('recipes-list:user-limit-100', 'recipes-list', 'get',
+             '/api/recipes/?limit=100', 'user'),
+    Scenario('recipes-list:user-deep-page', 'recipes-list', 'get',
+             '/api/recipes/?page=300', 'user'),
+    Scenario('recipes-list:cursor', 'recipes-list', 'get',
+             '/api/recipes/?cursor=', 'user'),
+    Scenario('recipes-list:favorited', 'recipes-list', 'get',
+             '/api/recipes/?is_favorited=1', 'user'),
+    Scenario('recipes-list:in-cart', 'recipes-list', 'get',
+             '/api/recipes/?is_in_shopping_cart=1', 'user'),
+    Scenario('recipes-list:tags', 'recipes-list', 'get',
+             '/api/recipes/?tags=breakfast&tags=dinner', 'user'),
+    Scenario('recipes-list:tags-all', 'recipes-list', 'get',
+             '/api/recipes/?tags_all=breakfast&tags_all=dinner', 'user'),
+    Scenario('recipes-list:combined', 'recipes-list', 'get',
+             '/api/recipes/?is_favorited=1&is_in_shopping_cart=0'
+             '&tags=breakfast&tags=lunch&tags=dinner'
+             '&cooking_time_min=10&cooking_time_max=90', 'user'),
+    Scenario('recipes-list:author', 'recipes-list', 'get',
+             '/api/recipes/?author={author}', 'user'),
+    Scenario('recipes-list:search', 'recipes-list', 'get',
+             '/api/recipes/?search=грибной борщ', 'anon'),
+    Scenario('recipes-list:popular', 'recipes-list', 'get',
+             '/api/recipes/?ordering=popular', 'user'),
+    Scenario('recipes-list:trending-cursor', 'recipes-list', 'get',
+             '/api/recipes/?ordering=trending&tags=lunch&cursor=', 'user'),
+    Scenario('recipes-feed', 'recipes-feed', 'get',
+             '/api/recipes/feed/', 'user'),
+    Scenario('recipes-feed:limit-100', 'recipes-feed', 'get',
+             '/api/recipes/feed/?limit=100', 'user'),
+    Scenario('recipes-pantry', 'recipes-pantry', 'post',
+             '/api/recipes/pantry/', 'user',
+             lambda context: {'ingredients': context['pantry']}),
+    Scenario('recipes-pantry:tags', 'recipes-pantry', 'post',
+             '/api/recipes/pantry/?tags=lunch&tags=dinner', 'anon',
+             lambda context: {'ingredients': context['pantry']}),
+    Scenario('recipes-detail:anon', 'recipes-detail', 'get',
+             '/api/recipes/{recipe}/', 'anon'),
+    Scenario('recipes-detail:user', 'recipes-detail', 'get',
+             '/api/recipes/{recipe}/', 'user'),
+    Scenario('recipes-create', 'recipes-list', 'post',
+             '/api/recipes/', 'user', _recipe_payload, 201,
+             ('id', 'own_recipe')),
+    Scenario('recipes-update', 'recipes-detail', 'patch',
+             '/api/recipes/{own_recipe}/', 'user', _recipe_update_payload),
+    Scenario('recipes-favorite:add', 'recipes-favorite', 'post',
+             '/api/recipes/{own_recipe}/favorite/', 'user', status=201),
+    Scenario('recipes-favorite:remove', 'recipes-favorite', 'delete',
+             '/api/recipes/{own_recipe}/favorite/', 'user', status=204),
+    Scenario('recipes-shopping-cart:add', 'recipes-shopping-cart', 'post',
+             '/api/recipes/{own_recipe}/shopping_cart/', 'user', status=201),
+    Scenario('recipes-download-shopping-cart',
+             'recipes-download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/', 'user'),
+    Scenario('recipes-download-shopping-cart:csv',
+             'recipes-download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/?format=csv', 'user'),
+    Scenario('recipes-download-shopping-cart:json',
+             'recipes-download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/?format=json', 'user'),
+    Scenario('recipes-shopping-cart:remove', 'recipes-shopping-cart',
+             'delete', '/api/recipes/{own_recipe}/shopping_cart/', 'user',
+             status=204),
+    Scenario('recipes-delete', 'recipes-detail', 'delete',
+             '/api/recipes/{own_recipe}/', 'user', status=204),
+    Scenario('tag-list', 'tag-list', 'get', '/api/tags/', 'anon'),
+    Scenario('tag-detail', 'tag-detail', 'get',
+             '/api/tags/{tag}/', 'anon'),
+    Scenario('ingredient-list:all', 'ingredient-list', 'get',
+             '/api/ingredients/', 'anon'),
+    Scenario('ingredient-list:compressed', 'ingredient-list', 'get',
+             '/api/ingredients/', 'anon',
+             headers={'HTTP_ACCEPT_ENCODING': 'gzip, deflate, br'}),
+    Scenario('ingredient-list:user', 'ingredient-list', 'get',
+             '/api/ingredients/', 'user'),
+    Scenario('ingredient-list:search', 'ingredient-list', 'get',
+             '/api/ingredients/?name=мол', 'anon'),
+    Scenario('ingredient-detail', 'ingredient-detail', 'get',
+             '/api/ingredients/{ingredient}/', 'anon'),
+    Scenario('user-list:anon', 'user-list', 'get', '/api/users/', 'anon'),
+    Scenario('user-list:user', 'user-list', 'get',
+             '/api/users/?limit=100', 'user'),
+    Scenario('user-create', 'user-list', 'post', '/api/users/', 'anon',
+             lambda context: {
+                 'email': f'bench_new_{context["iteration"]}@example.com',
+                 'username': f'bench_new_{context["iteration"]}',
+                 'first_name': 'Новый', 'last_name': 'Пользователь',
+                 'password': PASSWORD}, 201),
+    Scenario('user-detail', 'user-detail', 'get',
+             '/api/users/{author}/', 'user'),
+    Scenario('user-me', 'user-me', 'get', '/api/users/me/', 'user'),
+    Scenario('user-subscriptions', 'user-subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3', 'user'),
+    Scenario('user-subscriptions:cursor', 'user-subscriptions', 'get',
+             '/api/users/subscriptions/?cursor=&recipes_limit=3', 'user'),
+    Scenario('user-subscriptions:limit-100', 'user-subscriptions', 'get',
+             '/api/users/subscriptions/?limit=100', 'user'),
+    Scenario('user-subscribe:add', 'user-subscribe', 'post',
+             '/api/users/{guest}/subscribe/', 'user', status=201),
+    Scenario('user-subscribe:remove', 'user-subscribe', 'delete',
+             '/api/users/{guest}/subscribe/', 'user', status=204),
+    Scenario('login', 'login', 'post', '/api/auth/token/login/', 'anon',
+             lambda context: {'email': context['guest_email'],
+                              'password': PASSWORD},
+             capture=('auth_token', 'guest_token')),
+    Scenario('user-set-password', 'user-set-password', 'post',
+             '/api/users/set_password/', 'guest',
+             lambda context: {'current_password': PASSWORD,
+                              'new_password': PASSWORD}, 204),
+    Scenario('logout', 'logout', 'post', '/api/auth/token/logout/', 'guest',
+             status=204),
+)
+
+
+@contextmanager
+def seeded_test_database(users, recipes, seed=0, keepdb=False, stdout=None):
+    """
+    Тестовая база, наполненная seed_database, и временный MEDIA_ROOT.
+    Отдаёт основного пользователя сценариев и гостя.
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media):
+            if not User.objects.filter(username='bench_user_0').exists():
+                seed_database(users, recipes, seed, stdout=stdout)
+            # Кэш мог пережить прошлую тестовую базу (например, файловый).
+            bump_data_version()
+            invalidate_snapshot()
+            principal = User.objects.get(username='bench_user_0')
+            guest = User.objects.filter(
+                username__startswith='bench_user_').order_by('-id').first()
+            yield principal, guest
+    finally:
+        connection.creation.destroy_test_db(
+            old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def registered_routes(*urlconfs):
+    """ Имена маршрутов, объявленных в переданных модулях urls """
+    names = set()
+
+    def walk(patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                walk(pattern.url_patterns)
+            elif pattern.name:
+                names.add(pattern.name)
+
+    for urlconf in urlconfs:
+        walk(urlconf.urlpatterns)
+    return names
+
+
+def uncovered_routes(*urlconfs):
+    covered = {scenario.route for scenario in SCENARIOS}
+    return sorted(registered_routes(*urlconfs) - covered - SKIPPED_ROUTES)
+
+
+def build_context(principal, guest):
+    # Авторы наполнены с перекосом Ципфа: берётся автор с медианным
+    # числом рецептов, а не самый плодовитый.
+    authors = Profile.objects.filter(recipes_count__gt=0).exclude(
+        user=principal).order_by('recipes_count', 'user_id')
+    author = authors.values_list('user_id', flat=True)[authors.count() // 2]
+    recipe = Recipe.objects.filter(author=author).order_by('id').first()
+    return {
+        'image': _image(),
+        'recipe': recipe.id,
+        'author': recipe.author_id,
+        'tag': Tag.objects.order_by('id').values_list('id', flat=True)[0],
+        'tags': list(Tag.objects.order_by('id').values_list('id', flat=True)),
+        'ingredient': Ingredient.objects.order_by('id').values_list(
+            'id', flat=True)[0],
+        'ingredients': list(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True)[:18]),
+        'pantry': list(IngredientInRecipe.objects.values_list(
+            'ingredient').annotate(uses=Count('id')).order_by(
+                '-uses').values_list('ingredient', flat=True)[:15]),
+        'guest': guest.id,
+        'guest_email': guest.email,
+        'guest_token': Token.objects.get_or_create(user=guest)[0].key,
+        'iteration': 0,
+    }
+
+
+def _client(role, context, principal):
+    client = APIClient()
+    if role == 'user':
+        token = Token.objects.get_or_create(user=principal)[0].key
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+    elif role == 'guest':
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Token {context["guest_token"]}')
+    return client
+
+
+def _payload_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def prepare(scenario, context, principal):
+    """
+    Запрос сценария, готовый к отправке: функция без аргументов,
+    которая отправляет его и возвращает ответ и размер тела. Клиент и
+    данные готовятся заранее, чтобы не попасть в замер.
+    """
+    client = _client(scenario.role, context, principal)
+    data = scenario.data(context) if callable(scenario.data) else None
+    path = scenario.path.format(**context)
+    request = getattr(client, scenario.method)
+    headers = scenario.headers or {}
+
+    def send():
+        if data is None:
+            response = request(path, **headers)
+        else:
+            response = request(path, data, format='json', **headers)
+        return response, _payload_size(response)
+
+    return send
+
+
+def remember(scenario, response, context):
+    """ Сохраняет в контекст поле ответа, нужное следующим сценариям """
+    if scenario.capture and response.status_code == scenario.status:
+        field, name = scenario.capture
+        context[name] = response.json()[field]
+
+
+def run_scenario(scenario, context, principal):
+    send = prepare(scenario, context, principal)
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response, size = send()
+        elapsed = (time.perf_counter() - started) * 1000
+    remember(scenario, response, context)
+    return Measurement(scenario.key, response.status_code,
+                       len(queries.captured_queries), elapsed, size)
+
+
+def run(principal, guest, repeat=5):
+    """
+    Прогоняет все сценарии repeat раз подряд.
+
+    Количество запросов и размер ответа берутся из последнего прогона,
+    время — медиана по всем прогонам.
+    """
+    context = build_context(principal, guest)
+    samples = {}
+    for iteration in range(repeat):
+        context['iteration'] = iteration
+        for scenario in SCENARIOS:
+            samples.setdefault(scenario.key, []).append(
+                run_scenario(scenario, context, principal))
+    results = []
+    for scenario in SCENARIOS:
+        runs = samples[scenario.key]
+        last = runs[-1]
+        results.append(last._replace(
+            time_ms=statistics.median(run.time_ms for run in runs)))
+    return results
+
+
+def check_budgets(results, budgets, metrics=METRICS):
+    """
+    Список нарушений бюджета по метрикам metrics и неожиданных кодов
+    ответа; budgets - бюджеты сценариев из файла.
+    """
+    expected = {scenario.key: scenario.status for scenario in SCENARIOS}
+    failures = []
+    for result in results:
+        if result.status != expected[result.key]:
+            failures.append(
+                f'{result.key}: статус {result.status}, '
+                f'ожидался {expected[result.key]}')
+        budget = budgets.get(result.key)
+        if budget is None:
+            failures.append(f'{result.key}: бюджет не задан')
+            continue
+        for metric in metrics:
+            value = getattr(result, metric)
+            if value > budget[metric]:
+                failures.append(
+                    f'{result.key}: {metric} {value:.0f} > {budget[metric]}')
+    return failures
+
+
+def make_budgets(results, dataset, time_factor=3, min_time_ms=50,
+                 bytes_factor=1.2):
+    """
+    Бюджеты по результатам прогона: число запросов фиксируется точно,
+    время и размер ответа — с запасом на разброс между машинами. Время
+    и размер зависят от объёма данных, поэтому вместе с бюджетами
+    записываются параметры наполнения базы dataset.
+    """
+    return {
+        'dataset': dataset,
+        'scenarios': {
+            result.key: {
+                'queries': result.queries,
+                'time_ms': max(min_time_ms,
+                               round(result.time_ms * time_factor)),
+                'bytes': round(result.bytes * bytes_factor),
+            }
+            for result in results
+        },
+    }
+
+
+def load_budgets(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def dump_json(data, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from app.models import Ingredient, Tag
+from app.serializers import IngredientSerializer, TagSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Каталоги меняются редко, а при изменении ETag другой, поэтому шлюз и
+# браузер могут держать ответ долго и затем перепроверять его по ETag.
+CACHE_CONTROL = 'public, max-age=3600, stale-while-revalidate=86400'
+
+# Сигналы сбрасывают слепок только в кэше своего процесса, если кэш не
+# общий (LocMemCache по умолчанию): через этот срок (в секундах) слепок
+# собирается заново и подхватывает изменения из других процессов.
+SNAPSHOT_TIMEOUT = 60
+
+CATALOGS = {
+    'tags': (Tag, TagSerializer),
+    'ingredients': (Ingredient, IngredientSerializer),
+}
+
+Snapshot = namedtuple('Snapshot', ('etag', 'bodies'))
+
+
+def _cache_key(name):
+    return f'catalog:{name}'
+
+
+def build_snapshot(name):
+    """ Сериализует каталог целиком и сжимает его gzip и brotli """
+    model, serializer_class = CATALOGS[name]
+    body = JSONRenderer().render(
+        serializer_class(model.objects.all(), many=True).data)
+    bodies = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+    if brotli is not None:
+        bodies['br'] = brotli.compress(body, mode=brotli.MODE_TEXT)
+    etag = 'W/"{}"'.format(hashlib.sha256(body).hexdigest()[:32])
+    return Snapshot(etag, bodies)
+
+
+def get_snapshot(name):
+    snapshot = cache.get(_cache_key(name))
+    if snapshot is None:
+        snapshot = build_snapshot(name)
+        cache.set(_cache_key(name), snapshot, SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def invalidate_snapshot(*names):
+    cache.delete_many([_cache_key(name) for name in names or CATALOGS])
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        quality = next((param[2:] for param in params
+                        if param.startswith('q=')), '1')
+        try:
+            if float(quality) > 0:
+                accepted.add(coding.lower())
+        except ValueError:
+            pass
+    return accepted
+
+
+def _opaque(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def snapshot_response(request, snapshot):
+    """ Ответ из слепка с подходящим сжатием или 304 по If-None-Match """
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if '*' in etags or _opaque(snapshot.etag) in map(_opaque, etags):
+        response = HttpResponseNotModified()
+    else:
+        accepted = _accepted_encodings(request)
+        encoding = next((encoding for encoding in ('br', 'gzip')
+                         if encoding in accepted
+                         and encoding in snapshot.bodies), None)
+        response = HttpResponse(
+            snapshot.bodies[encoding or 'identity'],
+            content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = snapshot.etag
+    response['Cache-Control'] = CACHE_CONTROL
+    response['Vary'] = 'Accept, Accept-Encoding'
+    return response
+
+
+class CatalogSnapshotMixin:
+    """
+    Список без параметров отдаётся из готового слепка каталога
+    snapshot_name: без сериализации и без запросов к базе.
+    """
+
+    snapshot_name = None
+
+    def perform_authentication(self, request):
+        # Пользователь нужен только правам на запись, поэтому токен
+        # проверяется лениво и чтение каталога не обращается к базе.
+        pass
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params or request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        return snapshot_response(request, get_snapshot(self.snapshot_name))
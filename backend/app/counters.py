@@ -0,0 +1,104 @@
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from app.models import Favorite, Recipe, ShoppingList
+from users.models import Profile, Subscriptions
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+# Счётчик: (модель со столбцом, столбец, что считаем, ссылка на владельца).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingList, 'recipe'),
+    (Profile, 'recipes_count', Recipe, 'author'),
+    (Profile, 'followers_count', Subscriptions, 'author'),
+)
+
+
+def _shift(queryset, field, delta):
+    return queryset.update(**{field: F(field) + delta})
+
+
+def shift_recipe(recipe_id, field, delta):
+    _shift(Recipe.objects.filter(pk=recipe_id), field, delta)
+
+
+def shift_profile(user_id, field, delta):
+    _shift(Profile.objects.filter(pk=user_id), field, delta)
+
+
+def add_favorite(user, recipe):
+    """
+    Добавляет рецепт в избранное. Счётчик рецепта меняет сигнал, в той
+    же транзакции.
+    """
+    with transaction.atomic():
+        Favorite.objects.create(user=user, recipe=recipe)
+
+
+def remove_favorite(favorite):
+    """ Убирает рецепт из избранного, счётчик уменьшает сигнал """
+    with transaction.atomic():
+        favorite.delete()
+
+
+def subscribe(user, author):
+    """
+    Создаёт подписку. Число подписчиков и ленту меняют сигналы, в той
+    же транзакции.
+    """
+    with transaction.atomic():
+        Subscriptions.objects.create(user=user, author=author)
+
+
+def unsubscribe(subscription):
+    """ Удаляет подписку, счётчик и ленту поправляют сигналы """
+    with transaction.atomic():
+        subscription.delete()
+
+
+def add_recipes(author_ids):
+    """ Учитывает рецепты, созданные bulk_create, у их авторов """
+    for author_id, total in Counter(author_ids).items():
+        shift_profile(author_id, 'recipes_count', total)
+
+
+def _actual(model, owner):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{owner: OuterRef('pk')}
+        ).order_by().values(owner).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def sync_counters(fix=True):
+    """
+    Сверяет счётчики с данными и, если fix, пересчитывает неверные
+    одним UPDATE на столбец. Возвращает число созданных профилей и
+    словарь {столбец: число расхождений}.
+    """
+    missing = list(User.objects.filter(
+        profile__isnull=True).values_list('pk', flat=True))
+    stale = {}
+    with transaction.atomic():
+        if fix:
+            Profile.objects.bulk_create(
+                [Profile(user_id=pk) for pk in missing],
+                batch_size=BATCH_SIZE, ignore_conflicts=True)
+        for owner, field, model, reference in COUNTERS:
+            actual = _actual(model, reference)
+            rows = owner.objects.annotate(actual=actual).exclude(
+                **{field: F('actual')})
+            stale[f'{owner._meta.model_name}.{field}'] = rows.count()
+            if fix:
+                owner.objects.filter(
+                    pk__in=rows.values('pk')).update(**{field: actual})
+    return len(missing), stale
@@ -0,0 +1,124 @@
+import itertools
+import threading
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+
+from app.models import Recipe, TimelineEntry
+from users.models import Subscriptions
+
+FEED_LENGTH = 500
+FANOUT_BATCH = 1000
+# Сколько пачек подписчиков обходится прямо в запросе на публикацию.
+REQUEST_FANOUT_BATCHES = 1
+
+
+def trim(user_ids, length=FEED_LENGTH):
+    """ Оставляет в лентах пользователей только length новых рецептов """
+    oldest_kept = TimelineEntry.objects.filter(
+        user_id=OuterRef('user_id')
+    ).order_by('-recipe_id').values('recipe_id')[length - 1:length]
+    TimelineEntry.objects.filter(
+        user_id__in=user_ids, recipe_id__lt=Subquery(oldest_kept)).delete()
+
+
+def push_recipes(recipes, after=0, batches=None):
+    """
+    Раскладывает новые рецепты по лентам подписчиков их авторов.
+    recipes - пары (id рецепта, id автора). Подписчики читаются и
+    записываются пачками по FANOUT_BATCH начиная с подписки после
+    after, после каждой пачки их ленты обрезаются до FEED_LENGTH.
+    Если обойдено batches пачек, а подписчики ещё остались, возвращает
+    id последней обработанной подписки, иначе None.
+    """
+    by_author = defaultdict(list)
+    for recipe_id, author_id in recipes:
+        by_author[author_id].append(recipe_id)
+    last = after
+    for number in itertools.count(1):
+        batch = list(Subscriptions.objects.filter(
+            author_id__in=by_author, id__gt=last
+        ).order_by('id').values_list('id', 'user_id', 'author_id')[
+            :FANOUT_BATCH])
+        if not batch:
+            return None
+        last = batch[-1][0]
+        with transaction.atomic():
+            TimelineEntry.objects.bulk_create([
+                TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+                for _, user_id, author_id in batch
+                for recipe_id in by_author[author_id]
+            ], batch_size=FANOUT_BATCH, ignore_conflicts=True)
+            trim({user_id for _, user_id, _ in batch})
+        if len(batch) < FANOUT_BATCH:
+            return None
+        if number == batches:
+            return last
+
+
+def publish(recipe_id, author_id):
+    """
+    Раскладывает опубликованный рецепт по лентам. В запросе обходятся
+    только первые REQUEST_FANOUT_BATCHES пачек подписчиков, остальные
+    дописываются в отдельном потоке, чтобы время ответа не росло с
+    числом подписчиков автора. Возвращает этот поток или None.
+    """
+    recipes = [(recipe_id, author_id)]
+    last = push_recipes(recipes, batches=REQUEST_FANOUT_BATCHES)
+    if last is None:
+        return None
+    pusher = threading.Thread(
+        target=_push_rest, args=(recipes, last),
+        name='feed-fanout', daemon=True)
+    pusher.start()
+    return pusher
+
+
+def _push_rest(recipes, after):
+    try:
+        push_recipes(recipes, after)
+    finally:
+        connection.close()
+
+
+def follow(user_id, author_id, length=FEED_LENGTH):
+    """ Добавляет в ленту новые рецепты автора, на которого подписались """
+    recipe_ids = Recipe.objects.filter(author_id=author_id).order_by(
+        '-id').values_list('id', flat=True)[:length]
+    TimelineEntry.objects.bulk_create([
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+        for recipe_id in recipe_ids
+    ], batch_size=FANOUT_BATCH, ignore_conflicts=True)
+    trim([user_id], length)
+
+
+def unfollow(user_id, author_id):
+    """ Убирает из ленты рецепты автора после отписки """
+    TimelineEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
+
+
+@transaction.atomic
+def rebuild_feeds(length=FEED_LENGTH):
+    """
+    Собирает ленты всех подписчиков заново по подпискам: для
+    первоначального заполнения и после массовой загрузки данных.
+    Возвращает число лент и записей в них.
+    """
+    TimelineEntry.objects.all().delete()
+    followers = Subscriptions.objects.order_by('user_id').values_list(
+        'user_id', 'author_id')
+    authors_of = defaultdict(list)
+    for user_id, author_id in followers.iterator(chunk_size=FANOUT_BATCH):
+        authors_of[user_id].append(author_id)
+    entries = 0
+    for user_id, authors in authors_of.items():
+        recipe_ids = Recipe.objects.filter(author_id__in=authors).order_by(
+            '-id').values_list('id', flat=True)[:length]
+        created = TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in recipe_ids
+        ], batch_size=FANOUT_BATCH)
+        entries += len(created)
+    return len(authors_of), entries
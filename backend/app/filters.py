@@ -1,27 +1,117 @@
+from django import forms
+from django.db.models import Exists, OuterRef, Q
 from django_filters import rest_framework as filters
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
 
-from app.models import Recipe, Ingredient
+from app.models import Favorite, Ingredient, Recipe, ShoppingList, Tag
+from app.pagination import CustomLimitPagination
+from app.recipe_search import search_recipes
+from app.tag_masks import mask_of, tag_bits, with_tag_bits
+
+
+class ValueListField(forms.Field):
+    """ Все значения повторяющегося параметра запроса списком """
+
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [str(item) for item in value or ()]
+
+
+class MultipleValueFilter(filters.Filter):
+    field_class = ValueListField
 
 
 class RecipeFilter(filters.FilterSet):
-    """ Фильтры для страницы рецепта"""
+    """
+    Фильтры для страницы рецепта. Теги проверяются побитово по маске
+    в строке рецепта, остальные связанные таблицы - подзапросами
+    EXISTS, а не JOIN: строки рецептов не размножаются и DISTINCT не
+    нужен.
+    """
 
     author = filters.CharFilter(field_name='author__id')
     is_favorited = filters.NumberFilter(
         method='favorite')
     is_in_shopping_cart = filters.NumberFilter(
         method='shopping_cart')
-    tags = filters.CharFilter(field_name='tags__slug')
+    tags = MultipleValueFilter(method='any_tags')
+    tags_all = MultipleValueFilter(method='all_tags')
+    cooking_time = filters.RangeFilter(field_name='cooking_time')
+    search = filters.CharFilter(method='text_search')
 
     class Meta:
         model = Recipe
-        fields = ['author', 'is_favorited', 'is_in_shopping_cart', 'tags']
+        fields = ['author', 'is_favorited', 'is_in_shopping_cart', 'tags',
+                  'tags_all', 'cooking_time', 'search']
+
+    def _marked(self, queryset, model, value):
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none() if value else queryset
+        marked = model.objects.filter(user=user)
+        if value:
+            # Отметок у пользователя немного: рецепты выбираются по ним,
+            # а не перебором всех рецептов с проверкой EXISTS.
+            return queryset.filter(pk__in=marked.values('recipe'))
+        return queryset.filter(~Exists(marked.filter(recipe=OuterRef('pk'))))
 
     def favorite(self, queryset, name, value):
-        return queryset.filter(favorites__user=self.request.user)
+        return self._marked(queryset, Favorite, value)
 
     def shopping_cart(self, queryset, name, value):
-        return queryset.filter(recipe_shopping__user=self.request.user)
+        return self._marked(queryset, ShoppingList, value)
+
+    @staticmethod
+    def _tagged(slugs):
+        return Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__in=Tag.objects.filter(slug__in=slugs).values('id')))
+
+    @staticmethod
+    def _tag_bits(slugs):
+        """
+        Маска известных тегов, слаги тегов, которым бит не достался,
+        и есть ли среди слагов неизвестные.
+        """
+        slugs = set(slugs)
+        bits = tag_bits(slugs)
+        known = slugs & bits.keys()
+        return (mask_of(bits[slug] for slug in known),
+                [slug for slug in known if bits[slug] is None],
+                known != slugs)
+
+    def any_tags(self, queryset, name, value):
+        mask, unmasked, _ = self._tag_bits(value)
+        if not (mask or unmasked):
+            return queryset.none()
+        condition = Q(any_tag_bits__gt=0)
+        if unmasked:
+            condition |= Q(self._tagged(unmasked))
+        return with_tag_bits(queryset, mask, 'any_tag_bits').filter(condition)
+
+    def all_tags(self, queryset, name, value):
+        mask, unmasked, unknown = self._tag_bits(value)
+        if unknown:
+            return queryset.none()
+        queryset = with_tag_bits(queryset, mask, 'all_tag_bits').filter(
+            all_tag_bits=mask)
+        for slug in unmasked:
+            queryset = queryset.filter(self._tagged([slug]))
+        return queryset
+
+    def text_search(self, queryset, name, value):
+        # Курсор листает по id или по месту из ordering, порядок по
+        # релевантности он бы отбросил.
+        params = self.request.query_params
+        cursor = CustomLimitPagination.cursor_query_param
+        ordering = params.get(RecipeOrderingFilter.ordering_param)
+        if (cursor in params
+                and ordering not in RecipeOrderingFilter.orderings):
+            raise ValidationError({
+                cursor: 'Поиск по тексту листается по page, без курсора.'})
+        return search_recipes(queryset, value)
 
 
 class IngredientFilter(filters.FilterSet):
@@ -34,3 +124,29 @@ class IngredientFilter(filters.FilterSet):
     class Meta:
         model = Ingredient
         fields = ('name',)
+
+
+class RecipeOrderingFilter(BaseFilterBackend):
+    """
+    ordering=popular|trending: порядок по местам, которые считает
+    команда update_recipe_scores. Место уникально, поэтому порядок
+    годится и для пагинации по курсору.
+    """
+
+    ordering_param = 'ordering'
+    orderings = {
+        'popular': 'popular_rank',
+        'trending': 'trending_rank',
+    }
+
+    def get_ordering(self, request, queryset, view):
+        field = self.orderings.get(
+            request.query_params.get(self.ordering_param))
+        return (field,) if field else None
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if ordering is None:
+            return queryset
+        return queryset.filter(
+            **{f'{ordering[0]}__isnull': False}).order_by(*ordering)
@@ -0,0 +1,118 @@
+import io
+import logging
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from app.response_cache import bump_data_version
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'recipes/derivatives'
+
+# Размер и способ уменьшения: crop — обрезка по центру до точного
+# размера (сетки карточек), иначе вписывание с сохранением пропорций.
+DERIVATIVES = {
+    'thumbnail': ((160, 160), True),
+    'card': ((600, 400), True),
+    'detail': ((1200, 1200), False),
+}
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True,
+                             'progressive': True}),
+}
+
+
+def derivative_name(name, size, fmt):
+    """ Путь производного изображения в хранилище по имени оригинала """
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    return f'{DERIVATIVES_DIR}/{stem}_{size}.{FORMATS[fmt][1]}'
+
+
+def render_derivatives(name, storage=default_storage):
+    """ Уменьшенные копии оригинала во всех размерах и форматах """
+    with storage.open(name) as file, Image.open(file) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode != 'RGB':
+            background = Image.new('RGB', image.size, 'white')
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        rendered = {}
+        for size, (box, crop) in DERIVATIVES.items():
+            if crop:
+                resized = ImageOps.fit(image, box, Image.LANCZOS)
+            else:
+                resized = image.copy()
+                resized.thumbnail(box, Image.LANCZOS)
+            for fmt, (pil_format, _, options) in FORMATS.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, pil_format, **options)
+                rendered[derivative_name(name, size, fmt)] = buffer.getvalue()
+    return rendered
+
+
+def build_derivatives(name, storage=default_storage):
+    """
+    Сохраняет производные изображения оригинала name. Возвращает
+    False, если оригинал не удалось прочитать.
+    """
+    try:
+        rendered = render_derivatives(name, storage)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        logger.warning('Не удалось обработать %s: %s', name, error)
+        return False
+    for path, content in rendered.items():
+        storage.delete(path)
+        storage.save(path, ContentFile(content))
+    return True
+
+
+def refresh_recipe_derivatives(recipe):
+    """ Строит производные изображения рецепта, если их ещё нет """
+    name = recipe.image.name
+    if not name or recipe.image_derivatives_for == name:
+        return
+    if build_derivatives(name):
+        recipe.image_derivatives_for = name
+        type(recipe).objects.filter(id=recipe.id, image=name).update(
+            image_derivatives_for=name)
+        bump_data_version()
+
+
+def derivative_urls(recipe, storage=default_storage):
+    """
+    Ссылки на производные изображения рецепта. Пока они не построены,
+    во всех размерах отдаётся оригинал.
+    """
+    name = recipe.image.name
+    if not name:
+        return None
+    if recipe.image_derivatives_for != name:
+        url = storage.url(name)
+        return {size: {fmt: url for fmt in FORMATS} for size in DERIVATIVES}
+    return {size: {fmt: storage.url(derivative_name(name, size, fmt))
+                   for fmt in FORMATS}
+            for size in DERIVATIVES}
+
+
+class RecipeImagesField(serializers.Field):
+    """ Ссылки на уменьшенные копии изображения рецепта в WebP и JPEG """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        urls = derivative_urls(recipe)
+        request = self.context.get('request')
+        if urls is None or request is None:
+            return urls
+        return {size: {fmt: request.build_absolute_uri(url)
+                       for fmt, url in formats.items()}
+                for size, formats in urls.items()}
@@ -0,0 +1,224 @@
+import bisect
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.db import connection
+from django.db.models import Count
+
+from app.models import Ingredient, IngredientInRecipe
+
+# Индекс пересобирается в фоне не реже этого интервала (в секундах),
+# чтобы подхватывать изменения из других процессов и новую популярность.
+REFRESH_INTERVAL = 300
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+FUZZY_MIN_LENGTH = 4
+
+# Ранги совпадений: меньше — выше в выдаче.
+NAME_PREFIX, WORD_PREFIX, SUBSTRING, FUZZY_NAME, FUZZY_WORD = range(5)
+
+WORD_SEPARATORS = re.compile(r'[^\w]+')
+
+
+def normalize(text):
+    """ Нижний регистр, ё -> е, одиночные пробелы """
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+def _ngrams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def _prefix_distance_within(query, word, max_distance):
+    """
+    Есть ли начало слова word на расстоянии Левенштейна от query
+    не больше max_distance.
+    """
+    window = word[:len(query) + max_distance]
+    previous = list(range(len(window) + 1))
+    for i, query_char in enumerate(query, 1):
+        current = [i]
+        for j, word_char in enumerate(window, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (query_char != word_char)))
+        if min(current) > max_distance:
+            return False
+        previous = current
+    return min(previous[max(0, len(query) - max_distance):]) <= max_distance
+
+
+class _Snapshot:
+    """ Неизменяемый слепок каталога со всеми поисковыми структурами """
+
+    def __init__(self, ingredients, popularity):
+        self.records = []
+        self.names = []
+        self.popularity = []
+        for ingredient_id, name, unit in ingredients:
+            self.records.append({'id': ingredient_id, 'name': name,
+                                 'measurement_unit': unit})
+            self.names.append(normalize(name))
+            self.popularity.append(popularity.get(ingredient_id, 0))
+
+        self.name_keys = sorted(
+            (name, position) for position, name in enumerate(self.names))
+        self.word_keys = []
+        self.trigrams = defaultdict(set)
+        word_positions = defaultdict(list)
+        for position, name in enumerate(self.names):
+            for trigram in _ngrams(name, 3):
+                self.trigrams[trigram].add(position)
+            for word in filter(None, WORD_SEPARATORS.split(name)):
+                self.word_keys.append((word, position))
+                word_positions[word].append(position)
+        self.word_keys.sort()
+
+        # Для поиска с опечатками: биграммы уникальных слов вместе со
+        # смещением, чтобы сравнивать только биграммы на близких местах.
+        self.words = list(word_positions.items())
+        self.bigrams = defaultdict(list)
+        for word_number, (word, _) in enumerate(self.words):
+            for offset in range(len(word) - 1):
+                self.bigrams[word[offset:offset + 2]].append(
+                    (word_number, offset))
+        self.built_at = time.monotonic()
+
+    @staticmethod
+    def _prefix_range(keys, prefix):
+        index = bisect.bisect_left(keys, (prefix,))
+        while index < len(keys) and keys[index][0].startswith(prefix):
+            yield keys[index][1]
+            index += 1
+
+    def _substrings(self, query):
+        postings = [self.trigrams.get(trigram, set())
+                    for trigram in _ngrams(query, 3)]
+        if not postings:
+            return ()
+        candidates = set.intersection(*sorted(postings, key=len))
+        return (position for position in candidates
+                if query in self.names[position])
+
+    def _fuzzy(self, query):
+        max_distance = 1 if len(query) < 7 else 2
+        # Одна правка портит не больше двух биграмм запроса.
+        required = max(1, len(query) - 1 - 2 * max_distance)
+        hits = Counter()
+        for query_offset in range(len(query) - 1):
+            bigram = query[query_offset:query_offset + 2]
+            for word_number, offset in self.bigrams.get(bigram, ()):
+                if abs(offset - query_offset) <= max_distance:
+                    hits[word_number] += 1
+        for word_number, count in hits.items():
+            word, positions = self.words[word_number]
+            if count >= required and _prefix_distance_within(
+                    query, word, max_distance):
+                for position in positions:
+                    if self.names[position].startswith(word):
+                        yield position, FUZZY_NAME
+                    else:
+                        yield position, FUZZY_WORD
+
+    def search(self, query, limit):
+        ranks = {}
+
+        def add(positions, rank):
+            for position in positions:
+                ranks.setdefault(position, rank)
+
+        add(self._prefix_range(self.name_keys, query), NAME_PREFIX)
+        add(self._prefix_range(self.word_keys, query), WORD_PREFIX)
+        if len(query) >= 3:
+            add(self._substrings(query), SUBSTRING)
+        if len(ranks) < limit and len(query) >= FUZZY_MIN_LENGTH:
+            for position, rank in sorted(self._fuzzy(query)):
+                ranks.setdefault(position, rank)
+        ranked = sorted(ranks, key=lambda position: (
+            ranks[position], -self.popularity[position],
+            self.names[position]))
+        return [self.records[position] for position in ranked[:limit]]
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Ищет по началу названия, по началу любого слова, по подстроке и
+    с опечатками. Выдача упорядочена по рангу совпадения, затем по
+    числу рецептов с ингредиентом.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+        # Номер сброса: фоновая сборка, начатая до invalidate, не
+        # подменяет индекс, собранный уже после изменения.
+        self._generation = 0
+        self._refresher = None
+
+    def _build(self):
+        ingredients = Ingredient.objects.order_by('id').values_list(
+            'id', 'name', 'measurement_unit')
+        popularity = dict(
+            IngredientInRecipe.objects.values_list('ingredient').annotate(
+                uses=Count('id')).order_by())
+        return _Snapshot(ingredients, popularity)
+
+    @staticmethod
+    def _is_fresh(snapshot):
+        return time.monotonic() - snapshot.built_at < REFRESH_INTERVAL
+
+    def _current(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._snapshot = self._build()
+        elif not self._is_fresh(snapshot):
+            self._refresh_in_background()
+        return snapshot
+
+    def _refresh_in_background(self):
+        """
+        Устаревший индекс пересобирается в отдельном потоке, а запросы
+        пока отвечают по прежнему: сборка читает весь каталог и считает
+        использование ингредиентов по всем рецептам.
+        """
+        with self._lock:
+            if self._refresher is not None:
+                return
+            refresher = self._refresher = threading.Thread(
+                target=self._refresh, args=(self._generation,),
+                name='ingredient-index-refresh', daemon=True)
+        refresher.start()
+
+    def _refresh(self, generation):
+        try:
+            snapshot = self._build()
+            with self._lock:
+                if self._generation == generation:
+                    self._snapshot = snapshot
+        finally:
+            with self._lock:
+                self._refresher = None
+            connection.close()
+
+    def warm(self):
+        self._current()
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        query = normalize(query)
+        if not query:
+            return []
+        return self._current().search(query, limit)
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,157 @@
+import csv
+import io
+import json
+from pathlib import Path
+
+from django.db import connection, transaction
+
+from app.catalog import invalidate_snapshot
+from app.ingredient_index import ingredient_index, normalize
+from app.models import Ingredient
+from app.response_cache import bump_data_version
+
+DEFAULT_PATH = Path(__file__).resolve().parent / 'data' / 'ingredients.json'
+BATCH_SIZE = 1000
+READ_CHUNK = 64 * 1024
+CSV_HEADER = ('name', 'measurement_unit')
+
+
+class SyncError(ValueError):
+    """ Файл каталога не удаётся прочитать """
+
+
+def _csv_rows(file):
+    for line_number, row in enumerate(csv.reader(file), 1):
+        if not row or (line_number == 1 and tuple(row) == CSV_HEADER):
+            continue
+        if len(row) < 2:
+            raise SyncError(f'Строка {line_number}: нужны name и '
+                            f'measurement_unit')
+        yield row[0], row[1]
+
+
+def _json_objects(file):
+    """ Элементы JSON-массива по одному, не читая файл целиком """
+    decoder = json.JSONDecoder()
+    buffer, position, started = '', 0, False
+    while True:
+        chunk = file.read(READ_CHUNK)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise SyncError('Ожидается JSON-массив объектов')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield item
+        if not chunk:
+            raise SyncError('Файл JSON оборван или повреждён')
+
+
+def _json_rows(file):
+    for item in _json_objects(file):
+        try:
+            yield item['name'], item['measurement_unit']
+        except (TypeError, KeyError):
+            raise SyncError(f'Нужны name и measurement_unit: {item}')
+
+
+def read_rows(path, fmt=None):
+    """ Поток пар (name, measurement_unit) из CSV или JSON """
+    fmt = fmt or Path(path).suffix.lstrip('.').lower()
+    readers = {'csv': _csv_rows, 'json': _json_rows}
+    if fmt not in readers:
+        raise SyncError(f'Неизвестный формат {fmt}: нужен csv или json')
+    with open(path, encoding='utf-8', newline='') as file:
+        yield from readers[fmt](file)
+
+
+def _apply_postgresql(inserts, updates):
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for ingredient in updates:
+        writer.writerow((ingredient.id, ingredient.name,
+                         ingredient.measurement_unit))
+    for name, unit in inserts:
+        writer.writerow(('', name, unit))
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE ingredient_sync (id bigint, '
+            'name varchar(200), measurement_unit varchar(200)) '
+            'ON COMMIT DROP')
+        cursor.cursor.copy_expert(
+            'COPY ingredient_sync (id, name, measurement_unit) '
+            'FROM STDIN WITH (FORMAT csv)', buffer)
+        cursor.execute(
+            f'UPDATE {table} AS i SET name = s.name, '
+            f'measurement_unit = s.measurement_unit FROM ingredient_sync s '
+            f'WHERE i.id = s.id')
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            f'SELECT name, measurement_unit FROM ingredient_sync '
+            f'WHERE id IS NULL')
+
+
+def _apply_batched(inserts, updates, batch_size):
+    Ingredient.objects.bulk_create(
+        [Ingredient(name=name, measurement_unit=unit)
+         for name, unit in inserts], batch_size=batch_size)
+    Ingredient.objects.bulk_update(
+        updates, ('name', 'measurement_unit'), batch_size=batch_size)
+
+
+def sync_ingredients(rows, batch_size=BATCH_SIZE):
+    """
+    Приводит каталог ингредиентов к строкам rows без дублей.
+
+    Строка совпадает с ингредиентом, если равны название и единица
+    после нормализации (регистр, ё, пробелы); написание из файла
+    считается правильным. Возвращает (добавлено, изменено, без
+    изменений, повторов в файле).
+    """
+    # При дублях в базе остаётся ингредиент с наименьшим id.
+    existing = {}
+    for ingredient in Ingredient.objects.order_by('-id'):
+        key = (normalize(ingredient.name),
+               normalize(ingredient.measurement_unit))
+        existing[key] = ingredient
+    seen = set()
+    inserts, updates, unchanged, repeated = [], [], 0, 0
+    for name, unit in rows:
+        name, unit = ' '.join(name.split()), ' '.join(unit.split())
+        key = (normalize(name), normalize(unit))
+        if not key[0] or key in seen:
+            repeated += 1
+            continue
+        seen.add(key)
+        ingredient = existing.get(key)
+        if ingredient is None:
+            inserts.append((name, unit))
+        elif (ingredient.name, ingredient.measurement_unit) != (name, unit):
+            ingredient.name, ingredient.measurement_unit = name, unit
+            updates.append(ingredient)
+        else:
+            unchanged += 1
+
+    if inserts or updates:
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                _apply_postgresql(inserts, updates)
+            else:
+                _apply_batched(inserts, updates, batch_size)
+        ingredient_index.invalidate()
+        invalidate_snapshot('ingredients')
+        bump_data_version()
+    return len(inserts), len(updates), unchanged, repeated
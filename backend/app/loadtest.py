@@ -0,0 +1,474 @@
+import http.client
+import json
+import math
+import random
+import re
+import socket
+import string
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from rest_framework.authtoken.models import Token
+
+from app.models import Favorite, Ingredient, Recipe, ShoppingList, Tag
+from app.pantry_index import MAX_PANTRY
+
+User = get_user_model()
+
+SCENARIOS = Path(__file__).resolve().parent / 'data' / (
+    'loadtest_scenarios.json')
+PERCENTILES = (50, 95, 99)
+# Сколько значений каждого параметра выбирается из базы: новые рецепты
+# и их авторы, как в реальном трафике, без чтения всей таблицы.
+POOL_SIZE = 10000
+PAGES = 10
+GUNICORN_START_TIMEOUT = 30
+# Приложение и класс воркера gunicorn для сетевых целей.
+SERVERS = {
+    'gunicorn': ('backend.wsgi:application', 'sync'),
+    'asgi': ('backend.asgi:application', 'uvicorn.workers.UvicornWorker'),
+}
+TOTAL = 'всего'
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) SQL"')
+SLOW_UPLOAD = 'slow-upload'
+SLOW_DOWNLOAD = 'slow-download'
+SLOW_UPLOAD_PATH = '/api/recipes/pantry/'
+SLOW_DOWNLOAD_PATH = '/api/recipes/?limit=100'
+# Медленный клиент пишет и читает такими порциями, а его буфер приёма
+# мал: ответ не помещается в сокеты целиком, и сервер ждёт клиента,
+# как на плохой мобильной сети.
+SLOW_PIECE = 1024
+SLOW_RECEIVE_BUFFER = 4096
+
+Step = namedtuple('Step', ('name', 'method', 'path', 'body', 'status'))
+Entry = namedtuple('Entry', ('name', 'weight', 'auth', 'steps', 'fields'))
+Sample = namedtuple('Sample', ('name', 'ok', 'time_ms', 'queries'))
+
+
+class Pools:
+    """ Значения параметров путей сценария, общие для всех пользователей """
+
+    def __init__(self, size=POOL_SIZE):
+        recipes = Recipe.objects.order_by('-id')[:size]
+        self.recipes = list(recipes.values_list('id', flat=True))
+        self.authors = sorted(set(recipes.values_list('author_id', flat=True)))
+        self.words = sorted({
+            word for name in recipes.values_list('name', flat=True)
+            for word in name.lower().split() if word.isalpha()})
+        self.tags = list(Tag.objects.values_list('slug', flat=True))
+        ingredients = Ingredient.objects.order_by('id')[:size]
+        self.ingredients = list(ingredients.values_list('name', flat=True))
+        self.ingredient_ids = list(ingredients.values_list('id', flat=True))
+
+
+class VirtualUser:
+    """
+    Пользователь нагрузки: свой генератор случайных чисел, токен и
+    рецепты, уже отмеченные его учётной записью, чтобы переключение
+    избранного и покупок начиналось с добавления.
+    """
+
+    def __init__(self, pools, user, rng):
+        self.pools = pools
+        self.rng = rng
+        self.headers = {
+            'Authorization':
+                f'Token {Token.objects.get_or_create(user=user)[0].key}',
+        }
+        self.marked = set(Favorite.objects.filter(user=user).values_list(
+            'recipe_id', flat=True))
+        self.marked.update(ShoppingList.objects.filter(
+            user=user).values_list('recipe_id', flat=True))
+
+    def value(self, field):
+        rng, pools = self.rng, self.pools
+        if field == 'recipe':
+            return rng.choice(pools.recipes)
+        if field == 'unmarked_recipe':
+            for _ in range(len(pools.recipes)):
+                recipe = rng.choice(pools.recipes)
+                if recipe not in self.marked:
+                    break
+            return recipe
+        if field == 'author':
+            return rng.choice(pools.authors)
+        if field == 'page':
+            return rng.randint(1, PAGES)
+        if field == 'tag':
+            return rng.choice(pools.tags)
+        if field == 'dish':
+            return quote(rng.choice(pools.words))
+        name = rng.choice(pools.ingredients)
+        return quote(name[:rng.randint(1, 3)])
+
+
+FIELDS = ('recipe', 'unmarked_recipe', 'author', 'page', 'tag', 'dish',
+          'ingredient_prefix')
+
+
+def _step(data, name):
+    body = data.get('body')
+    return Step(data.get('name', name), data.get('method', 'GET').upper(),
+                data['path'], None if body is None else json.dumps(
+                    body).encode(), data.get('status', 200))
+
+
+def load_scenario(path=SCENARIOS):
+    """
+    Смесь запросов из JSON-файла: {"requests": [...]}, у каждой записи
+    name, weight, auth и path (с method, body, status) или список steps,
+    которые выполняются подряд с одними и теми же параметрами.
+    """
+    with open(path, encoding='utf-8') as file:
+        data = json.load(file)
+    entries = []
+    for item in data['requests']:
+        steps = [_step(step, item['name'])
+                 for step in item.get('steps', [item])]
+        fields = {name for step in steps
+                  for _, name, _, _ in string.Formatter().parse(step.path)
+                  if name}
+        unknown = fields - set(FIELDS)
+        if unknown:
+            raise ValueError(
+                f'{item["name"]}: неизвестные параметры '
+                f'{", ".join(sorted(unknown))}, доступны: {", ".join(FIELDS)}')
+        if item.get('weight', 1) <= 0:
+            raise ValueError(f'{item["name"]}: вес должен быть больше нуля')
+        entries.append(Entry(item['name'], item.get('weight', 1),
+                             item.get('auth', False), steps, sorted(fields)))
+    if not entries:
+        raise ValueError('В сценарии нет запросов')
+    return entries
+
+
+def _host():
+    host = next(iter(settings.ALLOWED_HOSTS), '*')
+    return 'localhost' if host == '*' else host.lstrip('.')
+
+
+class WSGITarget:
+    """ Приложение backend.wsgi в этом же процессе, без сети """
+
+    name = 'wsgi'
+
+    def __init__(self):
+        self.application = get_wsgi_application()
+        self.host = _host()
+
+    def send(self, method, path, headers, body):
+        url = urlsplit(path)
+        body = body or b''
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': self.host,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+        started = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            started['status'] = int(status.split()[0])
+            started['headers'] = dict(response_headers)
+
+        result = self.application(environ, start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            result.close()
+        return started['status'], started['headers'].get('Server-Timing', '')
+
+
+class HTTPTarget:
+    """ Сервер по HTTP, новое соединение на запрос, как от nginx """
+
+    def __init__(self, port, name='gunicorn'):
+        self.port = port
+        self.name = name
+        self.host = _host()
+
+    def send(self, method, path, headers, body):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port,
+                                                timeout=60)
+        try:
+            connection.request(method, path, body, {
+                **headers, 'Host': self.host,
+                'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            return response.status, response.getheader('Server-Timing', '')
+        finally:
+            connection.close()
+
+
+def _response_head(data):
+    head = data.split(b'\r\n\r\n', 1)[0].decode('latin1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in head[1:] if ': ' in line)
+    return int(head[0].split()[1]), headers.get('Server-Timing', '')
+
+
+class SlowClient:
+    """
+    Клиент на медленном канале: пишет тело запроса (slow-upload) или
+    читает ответ (slow-download) со скоростью rate байт в секунду и всё
+    это время держит соединение с сервером. Загрузка - поиск по
+    продуктам с телом, дополненным до size байт, выгрузка - большая
+    страница списка рецептов.
+    """
+
+    def __init__(self, target, name, rate, size, pools):
+        self.port = target.port
+        self.name = name
+        self.pause = SLOW_PIECE / rate
+        if name == SLOW_UPLOAD:
+            body = {'ingredients': pools.ingredient_ids[:MAX_PANTRY]}
+            padding = size - len(json.dumps({**body, 'padding': ''}))
+            self.body = json.dumps(
+                {**body, 'padding': ' ' * max(0, padding)}).encode()
+            self.head = (
+                f'POST {SLOW_UPLOAD_PATH} HTTP/1.1\r\n'
+                f'Host: {target.host}\r\n'
+                f'Content-Type: application/json\r\n'
+                f'Content-Length: {len(self.body)}\r\n'
+                f'Connection: close\r\n\r\n').encode()
+        else:
+            self.body = b''
+            self.head = (
+                f'GET {SLOW_DOWNLOAD_PATH} HTTP/1.1\r\n'
+                f'Host: {target.host}\r\n'
+                f'Connection: close\r\n\r\n').encode()
+
+    def send(self):
+        with socket.socket() as sock:
+            if self.name == SLOW_DOWNLOAD:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                SLOW_RECEIVE_BUFFER)
+            sock.settimeout(60)
+            sock.connect(('127.0.0.1', self.port))
+            sock.sendall(self.head)
+            for start in range(0, len(self.body), SLOW_PIECE):
+                time.sleep(self.pause)
+                sock.sendall(self.body[start:start + SLOW_PIECE])
+            response = bytearray()
+            while True:
+                piece = sock.recv(SLOW_PIECE)
+                if not piece:
+                    break
+                response += piece
+                if self.name == SLOW_DOWNLOAD:
+                    time.sleep(self.pause)
+        return _response_head(bytes(response))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def gunicorn(workers, server='gunicorn'):
+    """
+    Запускает gunicorn с приложением из SERVERS на свободном порту с
+    теми же настройками, что у команды, и останавливает его по выходе:
+    gunicorn - backend.wsgi на синхронных воркерах, asgi - backend.asgi
+    на воркерах uvicorn.
+    """
+    application, worker_class = SERVERS[server]
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', application,
+         '--worker-class', worker_class,
+         '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         '--log-level', 'warning'],
+        cwd=settings.BASE_DIR)
+    try:
+        deadline = time.monotonic() + GUNICORN_START_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(
+                    f'gunicorn завершился с кодом {process.returncode}')
+            try:
+                socket.create_connection(('127.0.0.1', port), 1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn не начал принимать запросы')
+                time.sleep(0.2)
+        yield HTTPTarget(port, server)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def virtual_users(count, seed=0):
+    """
+    count пользователей нагрузки на учётных записях обычных активных
+    пользователей; если их меньше count, записи используются по кругу.
+    """
+    pools = Pools()
+    if not pools.recipes:
+        raise ValueError(
+            'В базе нет рецептов: наполните её командой seed_data')
+    accounts = list(User.objects.filter(
+        is_active=True, is_staff=False).order_by('id')[:count])
+    if not accounts:
+        raise ValueError('В базе нет пользователей для нагрузки')
+    return [
+        VirtualUser(pools, accounts[index % len(accounts)],
+                    random.Random(f'{seed}:{index}'))
+        for index in range(count)
+    ]
+
+
+def _queries(server_timing):
+    match = SERVER_TIMING_QUERIES.search(server_timing)
+    return int(match.group(1)) if match else None
+
+
+def run(target, entries, users, duration, warmup=0, think_time_ms=0,
+        slow=()):
+    """
+    Замкнутая модель: каждый пользователь в своём потоке выбирает
+    запись смеси по весам, выполняет её шаги, ждёт случайное время со
+    средним think_time_ms и повторяет. Медленные клиенты slow в своих
+    потоках повторяют один и тот же запрос без пауз. Замеры первых
+    warmup секунд отбрасываются, как и запросы, не завершившиеся за
+    duration секунд.
+    """
+    weights = [entry.weight for entry in entries]
+    samples = [[] for _ in [*users, *slow]]
+    measure_from = time.perf_counter() + warmup
+    deadline = measure_from + duration
+
+    def slow_loop(client, collected):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                status, timing = client.send()
+            except (OSError, ValueError, IndexError):
+                status, timing = None, ''
+            finished = time.perf_counter()
+            if measure_from <= started and finished <= deadline:
+                collected.append(Sample(
+                    client.name, status == 200,
+                    (finished - started) * 1000, _queries(timing)))
+
+    def loop(user, collected):
+        rng = user.rng
+        try:
+            while time.perf_counter() < deadline:
+                entry = rng.choices(entries, weights)[0]
+                values = {field: user.value(field) for field in entry.fields}
+                headers = user.headers if entry.auth else {}
+                for step in entry.steps:
+                    started = time.perf_counter()
+                    try:
+                        status, timing = target.send(
+                            step.method, step.path.format(**values),
+                            headers, step.body)
+                    except (OSError, http.client.HTTPException):
+                        status, timing = None, ''
+                    finished = time.perf_counter()
+                    if measure_from <= started and finished <= deadline:
+                        collected.append(Sample(
+                            step.name, status == step.status,
+                            (finished - started) * 1000, _queries(timing)))
+                if think_time_ms:
+                    time.sleep(rng.expovariate(1000 / think_time_ms))
+        finally:
+            connections.close_all()
+
+    threads = [
+        threading.Thread(target=loop, args=(user, collected))
+        for user, collected in zip(users, samples)
+    ] + [
+        threading.Thread(target=slow_loop, args=(client, collected))
+        for client, collected in zip(slow, samples[len(users):])
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [sample for collected in samples for sample in collected]
+
+
+def percentile(values, percent):
+    """ Процентиль отсортированного списка методом ближайшего ранга """
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def _stats(samples, seconds):
+    times = sorted(sample.time_ms for sample in samples)
+    queries = [sample.queries for sample in samples
+               if sample.queries is not None]
+    stats = {
+        'count': len(samples),
+        'errors': sum(not sample.ok for sample in samples),
+        'rps': round(len(samples) / seconds, 2),
+        'mean_ms': round(sum(times) / len(times), 2),
+        'max_ms': round(times[-1], 2),
+        'queries': (round(sum(queries) / len(queries), 1)
+                    if queries else None),
+    }
+    for percent in PERCENTILES:
+        stats[f'p{percent}_ms'] = round(percentile(times, percent), 2)
+    return stats
+
+
+def summarize(samples, seconds):
+    """
+    {'endpoints': {имя шага: статистика}, 'total': статистика};
+    запросы медленных клиентов в 'total' не входят.
+    """
+    groups = {}
+    for sample in samples:
+        groups.setdefault(sample.name, []).append(sample)
+    regular = [sample for sample in samples
+               if sample.name not in (SLOW_UPLOAD, SLOW_DOWNLOAD)]
+    return {
+        'endpoints': {name: _stats(group, seconds)
+                      for name, group in sorted(groups.items())},
+        'total': _stats(regular, seconds) if regular else None,
+    }
+
+
+def compare(previous, current):
+    """
+    Строки сравнения двух сохранённых прогонов: (эндпоинт, p95 было,
+    p95 стало, rps было, rps стало) для эндпоинтов, что есть в обоих.
+    """
+    rows = []
+    named = {**current['endpoints'], TOTAL: current['total']}
+    before = {**previous['endpoints'], TOTAL: previous['total']}
+    for name, stats in named.items():
+        if name in before and stats and before[name]:
+            rows.append((name, before[name]['p95_ms'], stats['p95_ms'],
+                         before[name]['rps'], stats['rps']))
+    return rows
@@ -0,0 +1,83 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+import app.urls
+import users.urls
+from app import benchmark
+
+BUDGETS = Path(__file__).resolve().parents[2] / 'data' / 'api_budgets.json'
+# Наполнение базы для --update-budgets без явных параметров.
+DATASET = {'users': 2000, 'recipes': 20000, 'seed': 0}
+
+
+class Command(BaseCommand):
+    help = ('Наполняет тестовую базу и проверяет число SQL-запросов, '
+            'время и размер ответа каждого эндпоинта API')
+
+    def add_arguments(self, parser):
+        for name in DATASET:
+            parser.add_argument(
+                f'--{name}', type=int,
+                help='По умолчанию - как при записи файла бюджетов')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--budgets', default=str(BUDGETS))
+        parser.add_argument(
+            '--update-budgets', action='store_true',
+            help='Перезаписать файл бюджетов результатами прогона')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не пересоздавать тестовую базу, если она уже есть')
+
+    def handle(self, *args, **options):
+        uncovered = benchmark.uncovered_routes(app.urls, users.urls)
+        if uncovered:
+            raise CommandError(
+                'Нет сценариев для маршрутов: ' + ', '.join(uncovered))
+
+        budgets = None
+        if not options['update_budgets']:
+            budgets = benchmark.load_budgets(options['budgets'])
+        recorded = budgets['dataset'] if budgets else DATASET
+        dataset = {name: recorded[name] if options[name] is None
+                   else options[name] for name in DATASET}
+
+        with benchmark.seeded_test_database(
+                dataset['users'], dataset['recipes'], dataset['seed'],
+                options['keepdb'], stdout=self.stdout) as (principal, guest):
+            results = benchmark.run(principal, guest, options['repeat'])
+
+        self.report(results)
+        if options['output']:
+            benchmark.dump_json(
+                [result._asdict() for result in results], options['output'])
+        if options['update_budgets']:
+            benchmark.dump_json(
+                benchmark.make_budgets(results, dataset), options['budgets'])
+            self.stdout.write(f'Бюджеты сохранены в {options["budgets"]}')
+            return
+        metrics = benchmark.METRICS
+        if dataset != budgets['dataset']:
+            # Время и размер ответов растут с объёмом данных и
+            # сравнимы только на том же наполнении.
+            metrics = ('queries',)
+            self.stdout.write(self.style.WARNING(
+                f'Бюджеты записаны для {budgets["dataset"]}, прогон - для '
+                f'{dataset}: проверяется только число запросов'))
+        failures = benchmark.check_budgets(
+            results, budgets['scenarios'], metrics)
+        if failures:
+            raise CommandError(
+                'Бюджет превышен:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены'))
+
+    def report(self, results):
+        self.stdout.write(f'База данных: {connection.vendor}')
+        self.stdout.write(f'{"эндпоинт":<40} {"код":>4} {"SQL":>5} '
+                          f'{"мс":>9} {"байт":>9}')
+        for result in results:
+            self.stdout.write(
+                f'{result.key:<40} {result.status:>4} {result.queries:>5} '
+                f'{result.time_ms:>9.1f} {result.bytes:>9}')
@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F
+
+from app.images import build_derivatives
+from app.models import Recipe
+from app.response_cache import bump_data_version
+
+UPDATE_BATCH = 500
+
+
+def _build(name):
+    return name, build_derivatives(name)
+
+
+class Command(BaseCommand):
+    help = ('Строит уменьшенные копии изображений рецептов (WebP и JPEG) '
+            'для уже загруженных файлов media/recipes/')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Число процессов, по умолчанию все ядра')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии и для рецептов, где они уже есть')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['force']:
+            recipes = recipes.exclude(image_derivatives_for=F('image'))
+        names = list(recipes.order_by().values_list(
+            'image', flat=True).distinct())
+        total = len(names)
+        self.stdout.write(
+            f'Изображений: {total}, процессов: {options["workers"]}')
+
+        # Дочерние процессы не должны унаследовать открытые соединения.
+        connections.close_all()
+        built, failed = [], 0
+        with multiprocessing.Pool(options['workers']) as pool:
+            for done, (name, ok) in enumerate(
+                    pool.imap_unordered(_build, names, chunksize=4), 1):
+                if ok:
+                    built.append(name)
+                else:
+                    failed += 1
+                if len(built) >= UPDATE_BATCH:
+                    self.mark_built(built)
+                if done % UPDATE_BATCH == 0:
+                    self.stdout.write(f'Обработано {done} из {total}')
+        self.mark_built(built)
+        bump_data_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {total - failed}, с ошибками: {failed}'))
+
+    def mark_built(self, names):
+        Recipe.objects.filter(image__in=names).update(
+            image_derivatives_for=F('image'))
+        names.clear()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from app.counters import sync_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, покупок, рецептов и '
+            'подписчиков по самим данным и сообщает о расхождениях')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сообщить о расхождениях, ничего не исправлять')
+
+    def handle(self, *args, **options):
+        missing, stale = sync_counters(fix=not options['check'])
+        self.stdout.write(f'Пользователей без профиля: {missing}')
+        for field, total in stale.items():
+            self.stdout.write(f'{field}: {total}')
+        if not (missing or any(stale.values())):
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING(
+                'Найдены расхождения, запустите без --check для исправления'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
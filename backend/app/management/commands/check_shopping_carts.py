@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from app.shopping_cart import sync_cart_totals
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает суммы ингредиентов в списках покупок по самим '
+            'спискам и сообщает о расхождениях')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сообщить о расхождениях, ничего не исправлять')
+
+    def handle(self, *args, **options):
+        missing, changed, extra = sync_cart_totals(fix=not options['check'])
+        self.stdout.write(
+            f'Нет в сумме: {missing}, неверное количество: {changed}, '
+            f'лишние строки: {extra}')
+        if not (missing or changed or extra):
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING(
+                'Найдены расхождения, запустите без --check для исправления'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Суммы пересчитаны'))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from app import benchmark, query_plans
+
+
+class Command(BaseCommand):
+    help = ('Наполняет тестовую базу, собирает SQL каждого сценария '
+            'бенчмарка и ищет в планах полные просмотры, сортировки и '
+            'вложенные циклы по большим таблицам')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--threshold', type=int, default=query_plans.LARGE_TABLE_ROWS,
+            help='С какого числа строк таблица считается большой')
+        parser.add_argument(
+            '--sql', action='store_true',
+            help='Печатать SQL запроса для каждой находки')
+        parser.add_argument('--output', help='Сохранить находки в JSON')
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не пересоздавать тестовую базу, если она уже есть')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in query_plans.PLANNERS:
+            raise CommandError(
+                f'Планы {connection.vendor} не поддерживаются')
+        with benchmark.seeded_test_database(
+                options['users'], options['recipes'], options['seed'],
+                options['keepdb'], stdout=self.stdout) as (principal, guest):
+            captured = query_plans.capture(principal, guest)
+            findings = query_plans.explain(captured, options['threshold'])
+
+        total = len({sql for queries in captured.values() for sql in queries})
+        self.stdout.write(
+            f'База данных: {connection.vendor}, запросов: {total}')
+        for finding, scenarios in findings.values():
+            self.stdout.write(self.style.WARNING(
+                f'{query_plans.KINDS[finding.kind]}: {finding.table}'))
+            self.stdout.write(f'  {finding.detail}')
+            self.stdout.write(f'  сценарии: {", ".join(scenarios)}')
+            if options['sql']:
+                self.stdout.write(f'  {finding.sql}')
+        if options['output']:
+            benchmark.dump_json([
+                dict(finding._asdict(), scenarios=scenarios)
+                for finding, scenarios in findings.values()
+            ], options['output'])
+        if not findings:
+            self.stdout.write(self.style.SUCCESS('Проблемных планов нет'))
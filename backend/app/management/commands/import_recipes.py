@@ -0,0 +1,142 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
+from django.forms.models import model_to_dict
+
+from app.models import ImportProgress
+from app.recipe_import import (Catalog, RecordError, discard_images,
+                               import_batch, parse_record, store_image)
+from app.response_cache import bump_data_version
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = ('Импортирует рецепты из файла NDJSON (один объект JSON на '
+            'строку) пачками с продолжением после сбоя')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл NDJSON')
+        parser.add_argument(
+            '--author',
+            help='username или email автора для строк без поля author')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--checkpoint',
+            help='Имя сохранённого прогресса, по умолчанию полный путь '
+                 'к файлу')
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с начала файла, не глядя на сохранённый прогресс')
+
+    def handle(self, *args, **options):
+        source = options['checkpoint'] or os.path.abspath(options['path'])
+        if options['restart']:
+            ImportProgress.objects.filter(source=source).delete()
+        progress, _ = ImportProgress.objects.get_or_create(source=source)
+        state = model_to_dict(
+            progress, fields=('offset', 'line', 'imported', 'rejected'))
+        if state['line']:
+            self.stdout.write(
+                f'Продолжение со строки {state["line"] + 1}: уже '
+                f'импортировано {state["imported"]}')
+
+        catalog = Catalog()
+        started = time.monotonic()
+        imported_before = state['imported']
+        batch = []
+        try:
+            with open(options['path'], 'rb') as file:
+                file.seek(state['offset'])
+                offset, line = state['offset'], state['line']
+                for raw in file:
+                    offset += len(raw)
+                    line += 1
+                    text = raw.decode('utf-8', errors='replace').strip()
+                    if text:
+                        recipe = self.parse(
+                            text, line, catalog, options['author'], state)
+                        if recipe is not None:
+                            batch.append(recipe)
+                    if len(batch) >= options['batch_size']:
+                        self.flush(batch, state, offset, line, progress,
+                                   started, imported_before)
+                self.flush(batch, state, offset, line, progress, started,
+                           imported_before)
+        except DatabaseError as error:
+            discard_images(batch)
+            raise CommandError(
+                f'Ошибка базы данных: {error}. Повторный запуск продолжит '
+                f'импорт со строки {state["line"] + 1}')
+        except BaseException:
+            # Картинки незаписанной пачки уже сохранены, а строки будут
+            # прочитаны заново: файлы удаляются, чтобы не остались сиротами.
+            discard_images(batch)
+            raise
+        finally:
+            bump_data_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано: {state["imported"]}, '
+            f'пропущено: {state["rejected"]}'))
+        if state['imported'] > imported_before:
+            self.stdout.write('Уменьшенные копии изображений: '
+                              'python manage.py build_image_derivatives')
+
+    def parse(self, text, line, catalog, default_author, state):
+        try:
+            recipe = parse_record(text, catalog, default_author)
+            recipe.uploaded = recipe.image.startswith('data:')
+            recipe.image = store_image(recipe.image)
+        except RecordError as error:
+            self.reject(line, error, state)
+            return None
+        recipe.line = line
+        return recipe
+
+    def reject(self, line, error, state):
+        state['rejected'] += 1
+        self.stderr.write(f'Строка {line}: {error}')
+
+    def flush(self, batch, state, offset, line, progress, started,
+              imported_before):
+        # Прогресс пишется в той же транзакции, что и пачка: после сбоя
+        # пачка либо записана вместе с ним, либо импортируется заново.
+        rejected = []
+        try:
+            with transaction.atomic():
+                if batch:
+                    rejected = import_batch(batch)
+                progress.offset, progress.line = offset, line
+                progress.imported = (state['imported'] + len(batch)
+                                     - len(rejected))
+                progress.rejected = state['rejected'] + len(rejected)
+                progress.save()
+        except BaseException:
+            # Хуки on_commit выполняются уже после фиксации, и их ошибка
+            # вылетает из того же блока. Пачка записана, если записан её
+            # прогресс: тогда её картинки удалять нельзя.
+            if not ImportProgress.objects.filter(
+                    pk=progress.pk, offset=offset).exists():
+                raise
+            self.committed(batch, rejected, state, offset, line, progress)
+            raise
+        self.committed(batch, rejected, state, offset, line, progress)
+
+        elapsed = time.monotonic() - started
+        imported = state['imported'] - imported_before
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(
+            f'Строк: {line}, импортировано: {state["imported"]}, '
+            f'пропущено: {state["rejected"]}, {rate:.0f} рецептов/с')
+
+    def committed(self, batch, rejected, state, offset, line, progress):
+        # Записанные картинки больше не удаляются при сбое в handle.
+        batch.clear()
+        discard_images(rejected)
+        for recipe in rejected:
+            self.reject(recipe.line, f'Нет автора {recipe.author}', state)
+        state['imported'] = progress.imported
+        state['offset'], state['line'] = offset, line
@@ -0,0 +1,156 @@
+import json
+from contextlib import nullcontext
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from app import benchmark, loadtest
+
+
+class Command(BaseCommand):
+    help = ('Нагружает API смесью запросов из файла сценария от множества '
+            'одновременных пользователей и печатает процентили времени '
+            'ответа и число запросов в секунду по эндпоинтам. Работает с '
+            'базой из настроек; пользователям нагрузки выдаются токены')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', choices=('wsgi', *loadtest.SERVERS), default='wsgi',
+            help='wsgi - приложение в этом процессе, gunicorn - отдельный '
+                 'сервер с backend.wsgi на свободном порту, asgi - он же '
+                 'с backend.asgi на воркерах uvicorn')
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Число воркеров gunicorn')
+        parser.add_argument(
+            '--slow-uploads', type=int, default=0,
+            help='Число клиентов, медленно отправляющих тело запроса')
+        parser.add_argument(
+            '--slow-downloads', type=int, default=0,
+            help='Число клиентов, медленно читающих большой ответ')
+        parser.add_argument(
+            '--slow-rate', type=int, default=16384,
+            help='Скорость канала медленного клиента, байт в секунду')
+        parser.add_argument(
+            '--slow-size', type=int, default=65536,
+            help='Размер тела запроса медленной загрузки, байт')
+        parser.add_argument(
+            '--users', type=int, default=20,
+            help='Число одновременных пользователей нагрузки')
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность замера в секундах')
+        parser.add_argument(
+            '--warmup', type=float, default=5,
+            help='Сколько секунд нагружать до начала замера')
+        parser.add_argument(
+            '--think-time', type=float, default=0,
+            help='Средняя пауза пользователя между запросами, мс')
+        parser.add_argument(
+            '--scenario', default=str(loadtest.SCENARIOS),
+            help='Файл JSON со смесью запросов')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument(
+            '--compare', help='JSON прошлого прогона для сравнения')
+
+    def handle(self, *args, **options):
+        try:
+            entries = loadtest.load_scenario(options['scenario'])
+        except (OSError, KeyError, ValueError) as error:
+            raise CommandError(f'{options["scenario"]}: {error}')
+        try:
+            users = loadtest.virtual_users(options['users'], options['seed'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        slow = ([loadtest.SLOW_UPLOAD] * options['slow_uploads']
+                + [loadtest.SLOW_DOWNLOAD] * options['slow_downloads'])
+        if slow and options['target'] == 'wsgi':
+            raise CommandError('Медленным клиентам нужен сетевой сервер: '
+                               '--target gunicorn или asgi')
+        if slow and options['slow_rate'] < 1:
+            raise CommandError('--slow-rate должен быть больше нуля')
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)
+
+        server = (nullcontext(loadtest.WSGITarget())
+                  if options['target'] == 'wsgi' else loadtest.gunicorn(
+                      options['workers'], options['target']))
+        self.stdout.write(
+            f'Цель: {options["target"]}, база данных: {connection.vendor}, '
+            f'пользователей: {len(users)}, замер {options["duration"]:g} с '
+            f'после разогрева {options["warmup"]:g} с, медленных '
+            f'клиентов: {len(slow)}')
+        started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        try:
+            with server as target:
+                clients = [
+                    loadtest.SlowClient(target, name, options['slow_rate'],
+                                        options['slow_size'], users[0].pools)
+                    for name in slow
+                ]
+                samples = loadtest.run(
+                    target, entries, users, options['duration'],
+                    options['warmup'], options['think_time'], clients)
+        except RuntimeError as error:
+            raise CommandError(str(error))
+        if not samples:
+            raise CommandError('За время замера не завершился ни один запрос')
+
+        result = loadtest.summarize(samples, options['duration'])
+        result['meta'] = {
+            'started_at': started_at,
+            'target': options['target'],
+            'workers': (options['workers']
+                        if options['target'] != 'wsgi' else None),
+            'database': connection.vendor,
+            'users': len(users),
+            'duration': options['duration'],
+            'warmup': options['warmup'],
+            'think_time_ms': options['think_time'],
+            'scenario': options['scenario'],
+            'seed': options['seed'],
+            'slow_uploads': options['slow_uploads'],
+            'slow_downloads': options['slow_downloads'],
+            'slow_rate': options['slow_rate'] if slow else None,
+            'slow_size': options['slow_size'] if slow else None,
+        }
+        self.report(result)
+        if previous is not None:
+            self.report_comparison(loadtest.compare(previous, result))
+        if options['output']:
+            benchmark.dump_json(result, options['output'])
+
+    def report(self, result):
+        percentiles = ''.join(
+            f'{f"p{percent}":>9}' for percent in loadtest.PERCENTILES)
+        self.stdout.write(f'{"эндпоинт":<36} {"запросов":>8} {"ошибок":>7} '
+                          f'{"rps":>8}{percentiles} {"макс":>9} {"SQL":>5}')
+        rows = list(result['endpoints'].items())
+        if result['total']:
+            rows.append((loadtest.TOTAL, result['total']))
+        for name, stats in rows:
+            timings = ''.join(f'{stats[f"p{percent}_ms"]:>9.1f}'
+                              for percent in loadtest.PERCENTILES)
+            queries = ('' if stats['queries'] is None
+                       else f'{stats["queries"]:.1f}')
+            line = (f'{name:<36} {stats["count"]:>8} {stats["errors"]:>7} '
+                    f'{stats["rps"]:>8.1f}{timings} '
+                    f'{stats["max_ms"]:>9.1f} {queries:>5}')
+            self.stdout.write(
+                self.style.ERROR(line) if stats['errors'] else line)
+        self.stdout.write('Время в миллисекундах, SQL - среднее число '
+                          'запросов к базе по заголовку Server-Timing; '
+                          'медленные клиенты не входят во «всего»')
+
+    def report_comparison(self, rows):
+        self.stdout.write(f'{"эндпоинт":<36} {"p95 было":>9} {"стало":>9} '
+                          f'{"rps было":>9} {"стало":>9}')
+        for name, p95_before, p95_after, rps_before, rps_after in rows:
+            line = (f'{name:<36} {p95_before:>9.1f} {p95_after:>9.1f} '
+                    f'{rps_before:>9.1f} {rps_after:>9.1f}')
+            slower = p95_after > p95_before * 1.1
+            self.stdout.write(self.style.WARNING(line) if slower else line)
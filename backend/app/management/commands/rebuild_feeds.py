@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from app.feed import FEED_LENGTH, rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = ('Собирает ленты подписок заново по подпискам: после '
+            'миграции или массовой загрузки рецептов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--length', type=int, default=FEED_LENGTH,
+            help='Сколько последних рецептов хранить в каждой ленте')
+
+    def handle(self, *args, **options):
+        feeds, entries = rebuild_feeds(options['length'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Лент: {feeds}, записей: {entries}'))
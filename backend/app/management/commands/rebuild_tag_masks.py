@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from app.models import Tag
+from app.tag_masks import MASK_BITS, assign_tag_bits, sync_tag_masks
+
+
+class Command(BaseCommand):
+    help = ('Сверяет маски тегов рецептов с таблицей связей рецептов и '
+            'тегов и пересчитывает неверные')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сообщить о расхождениях, ничего не исправлять')
+
+    def handle(self, *args, **options):
+        check = options['check']
+        if not check:
+            assigned = assign_tag_bits()
+            if assigned:
+                self.stdout.write(f'Выдано битов тегам: {assigned}')
+        unmasked = Tag.objects.filter(bit=None).count()
+        if unmasked:
+            self.stdout.write(self.style.WARNING(
+                f'Тегов без бита: {unmasked}. В маске {MASK_BITS} битов, '
+                'такие теги фильтруются по таблице связей'))
+        stale = sync_tag_masks(fix=not check)
+        self.stdout.write(f'Рецептов с неверной маской: {stale}')
+        if not stale:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+        elif check:
+            self.stdout.write(self.style.WARNING(
+                'Найдены расхождения, запустите без --check для исправления'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Маски пересчитаны'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.seeding import ZIPF_EXPONENT, seed_database
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу из настроек синтетическими пользователями, '
+            'рецептами, избранным, покупками и подписками для проверки '
+            'под нагрузкой. Данные воспроизводимы по --seed, популярность '
+            'распределена по закону Ципфа; повторный запуск добавляет '
+            'новых пользователей и рецепты к уже созданным')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--exponent', type=float, default=ZIPF_EXPONENT,
+            help='Показатель Ципфа: чем больше, тем сильнее перекос '
+                 'популярности, 0 - равномерно')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['recipes'] < 0:
+            raise CommandError('Нужен хотя бы один пользователь')
+        started = time.monotonic()
+        seed_database(options['users'], options['recipes'], options['seed'],
+                      stdout=self.stdout, exponent=options['exponent'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.0f} с'))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.ingredient_sync import (BATCH_SIZE, DEFAULT_PATH, SyncError,
+                                 read_rows, sync_ingredients)
+
+
+class Command(BaseCommand):
+    help = ('Синхронизирует каталог ингредиентов с файлом CSV или JSON: '
+            'добавляет новые, исправляет изменившиеся, дублей не создаёт')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_PATH))
+        parser.add_argument(
+            '--format', choices=('csv', 'json'),
+            help='Формат файла, по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            inserted, updated, unchanged, repeated = sync_ingredients(
+                read_rows(options['path'], options['format']),
+                options['batch_size'])
+        except (OSError, SyncError) as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {inserted}, изменено: {updated}, '
+            f'без изменений: {unchanged}, повторов в файле: {repeated} '
+            f'({time.monotonic() - started:.2f} с)'))
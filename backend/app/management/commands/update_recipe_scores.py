@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.recipe_scores import update_recipe_scores
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает места рецептов в рейтингах popular и trending '
+            'по избранному и спискам покупок с затуханием по времени. '
+            'Запускается по расписанию, например раз в 15 минут')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        for name, (ranked, changed) in update_recipe_scores().items():
+            self.stdout.write(
+                f'{name}: в рейтинге {ranked}, изменено мест {changed}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.2f} с'))
@@ -0,0 +1,413 @@
+import asyncio
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Гистограмма: (описание, границы корзин).
+HISTOGRAMS = {
+    'http_request_duration_seconds': (
+        'Время обработки запроса целиком', TIME_BUCKETS),
+    'http_request_db_queries': (
+        'Число SQL-запросов за запрос', QUERY_BUCKETS),
+    'http_request_db_duration_seconds': (
+        'Время SQL-запросов за запрос', TIME_BUCKETS),
+    'http_request_serialization_seconds': (
+        'Время представления без SQL-запросов: у API это в основном '
+        'сериализация', TIME_BUCKETS),
+    'http_request_render_seconds': (
+        'Время рендеринга ответа', TIME_BUCKETS),
+    'http_response_size_bytes': (
+        'Размер тела ответа', SIZE_BUCKETS),
+}
+REQUESTS_TOTAL = 'http_requests_total'
+
+# Фоновый поток воркера раз в этот интервал (в секундах) сбрасывает
+# новые данные в METRICS_DIR; /metrics читает файлы всех воркеров.
+FLUSH_INTERVAL = 10
+ARCHIVE = 'archive.json'
+LOCK = '.lock'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Замеры текущего запроса. Переменная контекста, а не потока: в режиме
+# ASGI запрос выполняется переходами в общий поток thread_sensitive, и
+# asgiref переносит в него контекст вызывающей задачи.
+_current = ContextVar('request_timer', default=None)
+
+
+class Registry:
+    """
+    Гистограммы и счётчик запросов процесса. Корзины хранятся без
+    накопления, последняя - для значений больше всех границ.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.requests = {}
+        self.observed = 0
+        self.lock = threading.Lock()
+
+    def observe(self, route, method, status, values):
+        with self.lock:
+            self.observed += 1
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, value in values.items():
+                series = self.histograms.get((name, route, method))
+                if series is None:
+                    buckets = HISTOGRAMS[name][1]
+                    series = self.histograms[(name, route, method)] = [
+                        [0] * (len(buckets) + 1), 0, 0]
+                series[0][bisect_left(HISTOGRAMS[name][1], value)] += 1
+                series[1] += value
+                series[2] += 1
+
+    def dump(self):
+        with self.lock:
+            return {
+                'histograms': [[*key, counts[:], total, count] for key, (
+                    counts, total, count) in self.histograms.items()],
+                'requests': [[*key, count]
+                             for key, count in self.requests.items()],
+            }
+
+    def merge(self, data):
+        for name, route, method, counts, total, count in data['histograms']:
+            if name not in HISTOGRAMS:
+                continue
+            series = self.histograms.setdefault(
+                (name, route, method), [[0] * len(counts), 0, 0])
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+            series[2] += count
+        for route, method, status, count in data['requests']:
+            key = (route, method, status)
+            self.requests[key] = self.requests.get(key, 0) + count
+
+
+registry = Registry()
+_flusher_pid = None
+_flushed = 0
+_flush_lock = threading.Lock()
+
+
+def _label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"')
+
+
+def render(source):
+    """ Текстовый формат Prometheus """
+    lines = []
+    for name, (description, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for (series_name, route, method), (counts, total, count) in sorted(
+                source.histograms.items()):
+            if series_name != name:
+                continue
+            labels = f'route="{_label(route)}",method="{method}"'
+            cumulative = 0
+            for bound, bucket in zip((*buckets, '+Inf'), counts):
+                cumulative += bucket
+                lines.append(
+                    f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {total}')
+            lines.append(f'{name}_count{{{labels}}} {count}')
+    lines += [f'# HELP {REQUESTS_TOTAL} Число обработанных запросов',
+              f'# TYPE {REQUESTS_TOTAL} counter']
+    for (route, method, status), count in sorted(source.requests.items()):
+        lines.append(f'{REQUESTS_TOTAL}{{route="{_label(route)}",'
+                     f'method="{method}",status="{status}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _directory():
+    return Path(settings.METRICS_DIR) if settings.METRICS_DIR else None
+
+
+def _write(path, data):
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(data))
+    os.replace(temporary, path)
+
+
+def flush():
+    """ Записывает данные процесса в файл METRICS_DIR/<pid>.json """
+    global _flushed
+    directory = _directory()
+    if directory is None:
+        return
+    with _flush_lock:
+        observed = registry.observed
+        if observed == _flushed:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        _write(directory / f'{os.getpid()}.json', registry.dump())
+        _flushed = observed
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def start_flusher():
+    """
+    Запускает поток сброса в текущем процессе. Вызывается на запросе,
+    а не при импорте: потоки не переживают fork воркеров gunicorn.
+    """
+    global _flusher_pid
+    pid = os.getpid()
+    if _flusher_pid == pid:
+        return
+    with registry.lock:
+        if _flusher_pid == pid:
+            return
+        _flusher_pid = pid
+    atexit.register(flush)
+    threading.Thread(target=_flush_periodically, name='metrics-flush',
+                     daemon=True).start()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """
+    Сумма данных всех воркеров. Файлы завершившихся воркеров
+    переносятся в общий архив, чтобы счётчики не убывали, а число
+    файлов не росло с перезапусками.
+    """
+    directory = _directory()
+    if directory is None:
+        return registry
+    flush()
+    total, archive = Registry(), directory / ARCHIVE
+    with open(directory / LOCK, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if archive.exists():
+            total.merge(json.loads(archive.read_text()))
+        dead = Registry()
+        for path in directory.glob('*.json'):
+            if path.name == ARCHIVE:
+                continue
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            total.merge(data)
+            if path.stem.isdigit() and not _alive(int(path.stem)):
+                dead.merge(data)
+                path.unlink()
+        if dead.requests:
+            if archive.exists():
+                dead.merge(json.loads(archive.read_text()))
+            _write(archive, dead.dump())
+    return total
+
+
+class RequestTimer:
+    """
+    Замеры одного запроса; как обёртка execute считает SQL. Фазы
+    отмеряются отметками: lap() относит к фазе время с прошлой отметки
+    за вычетом SQL-запросов за это время.
+    """
+
+    __slots__ = ('queries', 'db', 'serialization', 'render', 'mark')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = self.serialization = self.render = 0.0
+        self.mark = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    def start_phase(self):
+        self.mark = (time.perf_counter(), self.db)
+
+    def lap(self, phase):
+        if self.mark is None:
+            return
+        started, db = self.mark
+        self.start_phase()
+        elapsed = self.mark[0] - started - (self.db - db)
+        setattr(self, phase, getattr(self, phase) + elapsed)
+
+
+def _execute(execute, sql, params, many, context):
+    timer = _current.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def _wrap_connection(sender, connection, **kwargs):
+    # В начало списка: execute_wrapper() снимает последнюю обёртку, и
+    # соединение, открытое внутри него, не должно потерять чужую.
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _execute)
+
+
+def instrument():
+    """ Оборачивает каждое соединение с базой счётчиком SQL запроса """
+    connection_created.connect(_wrap_connection,
+                               dispatch_uid='request_metrics')
+    for connection in connections.all():
+        _wrap_connection(None, connection)
+
+
+def render_response(response):
+    """
+    Рендерит ответ, относя время до этого к сериализации, а сам
+    рендеринг - к фазе render текущего запроса. Для представлений,
+    которым содержимое нужно раньше, чем его отрендерит Django.
+    """
+    timer = _current.get()
+    if timer is not None:
+        timer.lap('serialization')
+    response.render()
+    if timer is not None:
+        timer.lap('render')
+        timer.mark = None
+    return response
+
+
+class RequestMetricsMiddleware:
+    """
+    Для каждого запроса считает SQL-запросы и их время, время
+    сериализации и рендеринга, размер ответа. Отдаёт их в заголовке
+    Server-Timing и копит в гистограммах по имени маршрута для
+    /metrics. Сериализацией считается время от вызова представления
+    до его ответа без SQL, рендерингом - render() ответа с шаблоном
+    (все ответы DRF такие): middleware рендерит его сама в
+    process_template_response. Стоимость - несколько вызовов
+    perf_counter на запрос и обёртка вокруг каждого SQL-запроса.
+
+    Работает и в синхронной, и в асинхронной цепочке, чтобы в режиме
+    ASGI не переводить весь запрос в поток. У потокового ответа
+    заголовок уходит раньше тела, поэтому Server-Timing описывает
+    подготовку ответа, а гистограммы пишутся при его закрытии и
+    включают SQL, время и байты отдачи.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        instrument()
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timer, started = self.start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            _current.set(None)
+            raise
+        return self.finish(request, response, timer, started)
+
+    async def __acall__(self, request):
+        timer, started = self.start()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            _current.set(None)
+            raise
+        return self.finish(request, response, timer, started)
+
+    @staticmethod
+    def start():
+        if settings.METRICS_DIR:
+            start_flusher()
+        timer = RequestTimer()
+        _current.set(timer)
+        return timer, time.perf_counter()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = _current.get()
+        if timer is not None:
+            timer.start_phase()
+
+    def process_template_response(self, request, response):
+        return render_response(response)
+
+    def finish(self, request, response, timer, started):
+        timer.lap('serialization')
+        response['Server-Timing'] = (
+            f'db;dur={timer.db * 1000:.1f};desc="{timer.queries} SQL", '
+            f'ser;dur={timer.serialization * 1000:.1f}, '
+            f'render;dur={timer.render * 1000:.1f}, '
+            f'total;dur={(time.perf_counter() - started) * 1000:.1f}')
+        if response.streaming:
+            response.streaming_content = self.streamed(
+                response.streaming_content, request, response, timer,
+                started)
+        else:
+            self.observe(request, response, timer, started,
+                         len(response.content))
+        return response
+
+    def streamed(self, content, request, response, timer, started):
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.observe(request, response, timer, started, size)
+
+    @staticmethod
+    def observe(request, response, timer, started, size):
+        _current.set(None)
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match else 'unmatched', request.method,
+            response.status_code, {
+                'http_request_duration_seconds':
+                    time.perf_counter() - started,
+                'http_request_db_queries': timer.queries,
+                'http_request_db_duration_seconds': timer.db,
+                'http_request_serialization_seconds': timer.serialization,
+                'http_request_render_seconds': timer.render,
+                'http_response_size_bytes': size,
+            })
+
+
+def metrics_view(request):
+    """ Гистограммы всех воркеров; с METRICS_TOKEN - только по токену """
+    token = settings.METRICS_TOKEN
+    if token and request.META.get(
+            'HTTP_AUTHORIZATION') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    return HttpResponse(render(collect()), content_type=CONTENT_TYPE)
@@ -0,0 +1,74 @@
+from django.db import migrations
+
+SQLITE_FOLD = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE app_recipe_fts USING fts5("
+    "name, text, tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO app_recipe_fts(rowid, name, text) "
+    "SELECT id, {}, {} FROM app_recipe".format(
+        SQLITE_FOLD.format('name'), SQLITE_FOLD.format('text')),
+    "CREATE TRIGGER app_recipe_fts_insert AFTER INSERT ON app_recipe BEGIN "
+    "INSERT INTO app_recipe_fts(rowid, name, text) "
+    "VALUES (new.id, {}, {}); END".format(
+        SQLITE_FOLD.format('new.name'), SQLITE_FOLD.format('new.text')),
+    "CREATE TRIGGER app_recipe_fts_update AFTER UPDATE OF name, text "
+    "ON app_recipe BEGIN "
+    "UPDATE app_recipe_fts SET name = {}, text = {} "
+    "WHERE rowid = old.id; END".format(
+        SQLITE_FOLD.format('new.name'), SQLITE_FOLD.format('new.text')),
+    "CREATE TRIGGER app_recipe_fts_delete AFTER DELETE ON app_recipe BEGIN "
+    "DELETE FROM app_recipe_fts WHERE rowid = old.id; END",
+]
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS app_recipe_fts_insert',
+    'DROP TRIGGER IF EXISTS app_recipe_fts_update',
+    'DROP TRIGGER IF EXISTS app_recipe_fts_delete',
+    'DROP TABLE IF EXISTS app_recipe_fts',
+]
+
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce({0}.name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce({0}.text, '')), 'B')"
+)
+POSTGRES_FORWARD = [
+    'ALTER TABLE app_recipe ADD COLUMN search_vector tsvector',
+    "CREATE FUNCTION app_recipe_search_vector_update() RETURNS trigger AS $$ "
+    "BEGIN NEW.search_vector := {}; RETURN NEW; END "
+    "$$ LANGUAGE plpgsql".format(POSTGRES_VECTOR.format('NEW')),
+    'CREATE TRIGGER app_recipe_search_vector_trigger '
+    'BEFORE INSERT OR UPDATE OF name, text ON app_recipe '
+    'FOR EACH ROW EXECUTE FUNCTION app_recipe_search_vector_update()',
+    'UPDATE app_recipe SET search_vector = {}'.format(
+        POSTGRES_VECTOR.format('app_recipe')),
+    'CREATE INDEX app_recipe_search_vector_idx '
+    'ON app_recipe USING GIN (search_vector)',
+]
+POSTGRES_BACKWARD = [
+    'DROP TRIGGER IF EXISTS app_recipe_search_vector_trigger ON app_recipe',
+    'DROP FUNCTION IF EXISTS app_recipe_search_vector_update()',
+    'ALTER TABLE app_recipe DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(sql, params=None)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_auto_20231003_2236'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRES_FORWARD,
+                            'sqlite': SQLITE_FORWARD}),
+            run_for_vendor({'postgresql': POSTGRES_BACKWARD,
+                            'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
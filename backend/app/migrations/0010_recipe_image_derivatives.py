@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_shoppingcartingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_derivatives_for',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Оригинал уменьшенных изображений'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.16 on 2026-10-18 11:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count(model, reference):
+    return Coalesce(Subquery(
+        model.objects.filter(**{reference: OuterRef('pk')}).order_by()
+        .values(reference).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('app', 'Recipe')
+    Recipe.objects.update(
+        favorites_count=_count(apps.get_model('app', 'Favorite'), 'recipe'),
+        shopping_cart_count=_count(
+            apps.get_model('app', 'ShoppingList'), 'recipe'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_recipe_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.16 on 2026-10-18 11:30
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Время отметок, поставленных до появления поля created, неизвестно.
+# Им ставится время старше окна trending (7 дней): в набирающие
+# популярность они не попадают, а в popular идут с затуханием.
+LEGACY_AGE = timedelta(days=8)
+
+
+def backfill_created(apps, schema_editor):
+    created = timezone.now() - LEGACY_AGE
+    for model in ('Favorite', 'ShoppingList'):
+        apps.get_model('app', model).objects.filter(
+            created=None).update(created=created)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='Добавлено'),
+        ),
+        migrations.AddField(
+            model_name='shoppinglist',
+            name='created',
+            field=models.DateTimeField(db_index=True, null=True, verbose_name='Добавлено'),
+        ),
+        migrations.RunPython(backfill_created, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Добавлено'),
+        ),
+        migrations.AlterField(
+            model_name='shoppinglist',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Добавлено'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popular_rank',
+            field=models.PositiveIntegerField(db_index=True, editable=False, null=True, verbose_name='Место среди популярных'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_rank',
+            field=models.PositiveIntegerField(db_index=True, editable=False, null=True, verbose_name='Место среди набирающих популярность'),
+        ),
+    ]
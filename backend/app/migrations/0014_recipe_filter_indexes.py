@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-18 11:16
+
+from django.db import migrations, models
+
+# Таблица связи рецептов и тегов создаётся ManyToManyField без модели,
+# поэтому индекс для поиска рецептов по тегу добавляется SQL.
+TAG_INDEX = ('CREATE INDEX app_recipe_tags_tag_recipe_idx '
+             'ON app_recipe_tags (tag_id, recipe_id)')
+DROP_TAG_INDEX = 'DROP INDEX app_recipe_tags_tag_recipe_idx'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_timeline'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-id'], name='recipe_author_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['cooking_time', '-id'], name='recipe_cooking_time_id_idx'),
+        ),
+        migrations.RunSQL(TAG_INDEX, DROP_TAG_INDEX),
+    ]
@@ -0,0 +1,43 @@
+from collections import defaultdict
+
+from django.db import migrations, models
+
+MASK_BITS = 63
+
+
+def fill_masks(apps, schema_editor):
+    Tag = apps.get_model('app', 'Tag')
+    Recipe = apps.get_model('app', 'Recipe')
+    tags = list(Tag.objects.order_by('id')[:MASK_BITS])
+    for bit, tag in enumerate(tags):
+        tag.bit = bit
+    Tag.objects.bulk_update(tags, ['bit'])
+    masks = defaultdict(int)
+    for recipe_id, bit in Recipe.tags.through.objects.exclude(
+            tag__bit=None).values_list('recipe_id', 'tag__bit').iterator():
+        masks[recipe_id] |= 1 << bit
+    Recipe.objects.bulk_update(
+        [Recipe(id=recipe_id, tag_mask=mask)
+         for recipe_id, mask in masks.items()],
+        ['tag_mask'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_recipe_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True, verbose_name='Бит в маске тегов рецепта'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tag_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_masks, migrations.RunPython.noop),
+    ]
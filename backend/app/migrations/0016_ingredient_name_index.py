@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_tag_masks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(db_index=True, max_length=200, verbose_name='Название ингредиента'),
+        ),
+    ]
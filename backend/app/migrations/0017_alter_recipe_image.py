@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_ingredient_name_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(upload_to='recipes/', verbose_name='Изображение рецепта'),
+        ),
+    ]
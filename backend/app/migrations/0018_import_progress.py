@@ -0,0 +1,28 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_alter_recipe_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='Смещение в байтах')),
+                ('line', models.PositiveIntegerField(default=0, verbose_name='Прочитано строк')),
+                ('imported', models.PositiveIntegerField(default=0, verbose_name='Импортировано')),
+                ('rejected', models.PositiveIntegerField(default=0, verbose_name='Пропущено')),
+            ],
+            options={
+                'verbose_name': 'Прогресс импорта',
+                'verbose_name_plural': 'Прогресс импорта',
+            },
+        ),
+    ]
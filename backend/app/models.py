@@ -1,7 +1,10 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import UniqueConstraint
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              UniqueConstraint, Value)
+
+from users.models import Subscriptions
 
 User = get_user_model()
 MINVALUE = 1
@@ -26,6 +29,13 @@ class Tag(models.Model):
         verbose_name='Слаг тега'
     )
 
+    bit = models.PositiveSmallIntegerField(
+        null=True,
+        unique=True,
+        editable=False,
+        verbose_name='Бит в маске тегов рецепта'
+    )
+
     class Meta:
         verbose_name = 'Тег'
         verbose_name_plural = 'Теги'
@@ -40,6 +50,7 @@ class Ingredient(models.Model):
 
     name = models.CharField(
         max_length=200,
+        db_index=True,
         verbose_name='Название ингредиента'
     )
 
@@ -57,6 +68,34 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_details(self, user):
+        """
+        Всё, что нужно для полного вывода рецептов, за постоянное число
+        запросов: автор, теги, ингредиенты и отметки пользователя.
+        """
+        queryset = self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch('ingredient_list',
+                     queryset=IngredientInRecipe.objects.select_related(
+                         'ingredient')),
+        )
+        if not user.is_authenticated:
+            false = Value(False, output_field=BooleanField())
+            return queryset.annotate(is_favorited=false,
+                                     is_in_shopping_cart=false,
+                                     author_is_subscribed=false)
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingList.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            author_is_subscribed=Exists(Subscriptions.objects.filter(
+                user=user, author=OuterRef('author'))),
+        )
+
+
 class Recipe(models.Model):
     """ Модель для рецептов """
 
@@ -86,6 +125,45 @@ class Recipe(models.Model):
         upload_to='recipes/'
     )
 
+    image_derivatives_for = models.CharField(
+        max_length=100,
+        blank=True,
+        editable=False,
+        verbose_name='Оригинал уменьшенных изображений'
+    )
+
+    favorites_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+
+    shopping_cart_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+
+    tag_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Маска тегов'
+    )
+
+    popular_rank = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        db_index=True,
+        verbose_name='Место среди популярных'
+    )
+
+    trending_rank = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        db_index=True,
+        verbose_name='Место среди набирающих популярность'
+    )
+
     name = models.CharField(
         max_length=200,
         verbose_name='Название рецепта'
@@ -103,10 +181,18 @@ class Recipe(models.Model):
             MaxValueValidator(MAXVALUE)],
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['author', '-id'],
+                         name='recipe_author_id_idx'),
+            models.Index(fields=['cooking_time', '-id'],
+                         name='recipe_cooking_time_id_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.name}.'
@@ -135,7 +221,7 @@ class IngredientInRecipe(models.Model):
         verbose_name_plural = 'Связка рецепта и ингредиента'
 
     def __str__(self):
-        return ({self.ingredient.name}, {self.recipe})
+        return f'{self.ingredient.name}, {self.recipe}'
 
 
 class Favorite(models.Model):
@@ -152,6 +238,11 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Рецепт избранного'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Добавлено'
+    )
 
     class Meta:
         ordering = ('user',)
@@ -181,6 +272,11 @@ class ShoppingList(models.Model):
         related_name='recipe_shopping',
         verbose_name='Рецепт покупок'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Добавлено'
+    )
 
     class Meta:
         ordering = ('user',)
@@ -194,3 +290,106 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'{self.recipe}'
+
+
+class ShoppingCartIngredient(models.Model):
+    """
+    Модель для суммарного количества ингредиента в списке покупок.
+    Поддерживается при изменении списка покупок и состава рецептов.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        ordering = ('user', 'ingredient')
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_ingredient')
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.amount}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписчика. Строки добавляются при публикации
+    рецепта (fan-out on write), лента читается по индексу
+    (user, recipe) от новых рецептов к старым.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+
+    class Meta:
+        ordering = ('user', '-recipe')
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry')
+        ]
+
+    def __str__(self):
+        return f'{self.user}, {self.recipe}'
+
+
+class ImportProgress(models.Model):
+    """
+    Сколько файла уже импортировано командой import_recipes. Строка
+    обновляется в транзакции каждой пачки, поэтому после сбоя
+    повторный запуск продолжает ровно с первой незаписанной строки.
+    """
+    source = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Файл'
+    )
+    offset = models.BigIntegerField(
+        default=0,
+        verbose_name='Смещение в байтах'
+    )
+    line = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Прочитано строк'
+    )
+    imported = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Импортировано'
+    )
+    rejected = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Пропущено'
+    )
+
+    class Meta:
+        verbose_name = 'Прогресс импорта'
+        verbose_name_plural = 'Прогресс импорта'
+
+    def __str__(self):
+        return f'{self.source}: {self.line}'
@@ -1,6 +1,86 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+
+from django.core.cache import cache
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+COUNT_CACHE_TIMEOUT = 60
+
+
+def cached_count(queryset):
+    """
+    Число объектов в выборке, закэшированное на COUNT_CACHE_TIMEOUT
+    секунд по тексту SQL-запроса. Может немного отставать от базы.
+    """
+    sql, params = queryset.query.sql_with_params()
+    key = 'count:' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class CustomCursorPagination(CursorPagination):
+    """ Пагинация по курсору (keyset) без OFFSET """
+
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = '-id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = cached_count(queryset.order_by())
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data = {'count': self.count, **response.data}
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties'] = {
+            'count': {'type': 'integer', 'example': 123},
+            **response_schema['properties'],
+        }
+        return response_schema
+
+
+class FeedPagination(CustomCursorPagination):
+    """
+    Курсор по позиции в ленте подписок: сортировка по столбцу индекса
+    ленты, чтобы страница читалась диапазоном индекса без сортировки.
+    """
+
+    ordering = '-feed_position'
 
 
 class CustomLimitPagination(PageNumberPagination):
+    """
+    Постраничная пагинация по page и limit. Если в запросе есть
+    параметр cursor (в том числе пустой), включается пагинация по
+    курсору с приблизительным count.
+    """
+
     page_size = 6
     page_size_query_param = "limit"
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_pagination = None
+        if (self.cursor_query_param
+                and self.cursor_query_param in request.query_params):
+            self.cursor_pagination = CustomCursorPagination()
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class ListPagination(CustomLimitPagination):
+    """ Постраничная пагинация для готовых списков, без курсора """
+
+    cursor_query_param = None
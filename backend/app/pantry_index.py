@@ -0,0 +1,313 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from app.models import IngredientInRecipe, Recipe
+
+# Полная пересборка не реже этого интервала (в секундах): так индекс
+# подхватывает рецепты, изменённые в других процессах.
+REFRESH_INTERVAL = 600
+CHUNK_SIZE = 5000
+MAX_PANTRY = 100
+
+
+def _bitset(ids):
+    """ Множество id как целое число: бит с номером id равен 1 """
+    if not ids:
+        return 0
+    buffer = bytearray((max(ids) >> 3) + 1)
+    for recipe_id in ids:
+        buffer[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def _add_bit(planes, bits):
+    """
+    Прибавляет 1 ко всем рецептам из bits в побитовом счётчике: planes
+    хранит двоичные разряды числа совпадений, младший первым.
+    """
+    for index, plane in enumerate(planes):
+        planes[index], bits = plane ^ bits, plane & bits
+        if not bits:
+            return
+    planes.append(bits)
+
+
+def _equal_to(planes, value, universe):
+    """ Рецепты, у которых счётчик planes равен value """
+    if value >> len(planes):
+        return 0
+    result = universe
+    for index, plane in enumerate(planes):
+        result &= plane if value >> index & 1 else ~plane
+    return result
+
+
+def _descending(bits, skip=0):
+    """ Номера единичных битов от старшего к младшему, первые skip - мимо """
+    while bits:
+        position = bits.bit_length() - 1
+        bits ^= 1 << position
+        if skip:
+            skip -= 1
+        else:
+            yield position
+
+
+class PantryMatches:
+    """
+    Найденные рецепты в порядке выдачи: доля ингредиентов рецепта,
+    которые есть у пользователя, затем их число, затем новизна.
+    Ведёт себя как список, поэтому подходит для пагинатора DRF:
+    длина считается по битам, срез разворачивает только нужную часть.
+    """
+
+    def __init__(self, groups):
+        # groups: (совпало, всего ингредиентов, битовое множество).
+        self.groups = sorted(
+            (group for group in groups if group[2]),
+            key=lambda group: (-group[0] / group[1], -group[0]))
+        self.total = sum(bits.bit_count() for _, _, bits in self.groups)
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('PantryMatches поддерживает только срезы')
+        start, stop, _ = index.indices(self.total)
+        wanted, rows = stop - start, []
+        for matched, size, bits in self.groups:
+            if len(rows) >= wanted:
+                break
+            count = bits.bit_count()
+            if start >= count:
+                start -= count
+                continue
+            for recipe_id in _descending(bits, start):
+                rows.append((recipe_id, matched, size))
+                if len(rows) >= wanted:
+                    break
+            start = 0
+        return rows
+
+
+class _Postings:
+    """
+    Отсортированные массивы id рецептов по ключу (ингредиент, автор)
+    и кэш их битовых множеств: битовое множество строится при первом
+    запросе ключа и сбрасывается при изменении массива.
+    """
+
+    def __init__(self, lists=()):
+        self.arrays = {key: array('q', sorted(ids)) for key, ids in lists}
+        self.bits = {}
+
+    def add(self, key, recipe_id):
+        insort(self.arrays.setdefault(key, array('q')), recipe_id)
+        self.bits.pop(key, None)
+
+    def remove(self, key, recipe_id):
+        ids = self.arrays.get(key)
+        if ids is None:
+            return
+        index = bisect_left(ids, recipe_id)
+        if index < len(ids) and ids[index] == recipe_id:
+            del ids[index]
+        self.bits.pop(key, None)
+
+    def get(self, key):
+        bits = self.bits.get(key)
+        if bits is None:
+            bits = self.bits[key] = _bitset(self.arrays.get(key, ()))
+        return bits
+
+
+class _Snapshot:
+    """
+    Инвертированный индекс ингредиент -> рецепты и всё для фильтров:
+    теги и размеры рецептов - битовыми множествами, авторы и
+    ингредиенты - массивами с кэшем битовых множеств.
+    """
+
+    def __init__(self, recipes, ingredients, tags):
+        self.recipes = {}
+        by_ingredient, by_author = defaultdict(list), defaultdict(list)
+        by_tag, by_size = defaultdict(list), defaultdict(list)
+        for recipe_id, author_id in recipes:
+            self.recipes[recipe_id] = (author_id, [], [])
+            by_author[author_id].append(recipe_id)
+        for recipe_id, ingredient_id in ingredients:
+            if recipe_id in self.recipes:
+                self.recipes[recipe_id][1].append(ingredient_id)
+                by_ingredient[ingredient_id].append(recipe_id)
+        for recipe_id, slug in tags:
+            if recipe_id in self.recipes:
+                self.recipes[recipe_id][2].append(slug)
+                by_tag[slug].append(recipe_id)
+        for recipe_id, (_, recipe_ingredients, _) in self.recipes.items():
+            by_size[len(recipe_ingredients)].append(recipe_id)
+
+        self.ingredients = _Postings(by_ingredient.items())
+        self.authors = _Postings(by_author.items())
+        self.tags = {slug: _bitset(ids) for slug, ids in by_tag.items()}
+        self.sizes = {size: _bitset(ids) for size, ids in by_size.items()
+                      if size}
+        self.built_at = time.monotonic()
+
+    def _set(self, recipe_id, author_id, ingredients, tags):
+        self.recipes[recipe_id] = (author_id, ingredients, tags)
+        bit = 1 << recipe_id
+        self.authors.add(author_id, recipe_id)
+        for ingredient_id in ingredients:
+            self.ingredients.add(ingredient_id, recipe_id)
+        for slug in tags:
+            self.tags[slug] = self.tags.get(slug, 0) | bit
+        if ingredients:
+            size = len(ingredients)
+            self.sizes[size] = self.sizes.get(size, 0) | bit
+
+    def _unset(self, recipe_id):
+        author_id, ingredients, tags = self.recipes.pop(recipe_id)
+        mask = ~(1 << recipe_id)
+        self.authors.remove(author_id, recipe_id)
+        for ingredient_id in ingredients:
+            self.ingredients.remove(ingredient_id, recipe_id)
+        for slug in tags:
+            self.tags[slug] &= mask
+        if ingredients:
+            self.sizes[len(ingredients)] &= mask
+
+    def apply(self, recipe_ids, recipes, ingredients, tags):
+        """ Заменяет данные рецептов recipe_ids свежими строками из базы """
+        for recipe_id in recipe_ids:
+            if recipe_id in self.recipes:
+                self._unset(recipe_id)
+        rows = {recipe_id: (author_id, [], [])
+                for recipe_id, author_id in recipes}
+        for recipe_id, ingredient_id in ingredients:
+            if recipe_id in rows:
+                rows[recipe_id][1].append(ingredient_id)
+        for recipe_id, slug in tags:
+            if recipe_id in rows:
+                rows[recipe_id][2].append(slug)
+        for recipe_id, row in rows.items():
+            self._set(recipe_id, *row)
+
+    def _filter(self, tags, author):
+        allowed = -1
+        if tags:
+            allowed = 0
+            for slug in tags:
+                allowed |= self.tags.get(slug, 0)
+        if author is not None:
+            allowed &= self.authors.get(author)
+        return allowed
+
+    def search(self, pantry, tags=(), author=None):
+        planes, found, present = [], 0, 0
+        for ingredient_id in set(pantry):
+            bits = self.ingredients.get(ingredient_id)
+            if bits:
+                _add_bit(planes, bits)
+                found |= bits
+                present += 1
+        found &= self._filter(tags, author)
+        if not found:
+            return PantryMatches(())
+        groups = []
+        for matched in range(1, present + 1):
+            with_matched = _equal_to(planes, matched, found)
+            if not with_matched:
+                continue
+            for size, recipes in self.sizes.items():
+                if size >= matched:
+                    groups.append((matched, size, with_matched & recipes))
+        return PantryMatches(groups)
+
+
+class PantryIndex:
+    """
+    Индекс «что приготовить из того, что есть» в памяти процесса.
+
+    Рецепты с хотя бы одним ингредиентом из запроса ранжируются по доле
+    покрытых ингредиентов. Счётчик совпадений считается сразу для всех
+    рецептов побитовыми операциями над битовыми множествами, поэтому
+    время поиска почти не зависит от числа рецептов. Изменённые рецепты
+    перечитываются из базы перед следующим поиском.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._dirty = set()
+        self._reset = False
+        self._lock = threading.Lock()
+        self._changes_lock = threading.Lock()
+
+    @staticmethod
+    def _rows(recipe_ids=None):
+        recipes = Recipe.objects.order_by()
+        ingredients = IngredientInRecipe.objects.order_by()
+        tags = Recipe.tags.through.objects.order_by()
+        if recipe_ids is not None:
+            recipes = recipes.filter(id__in=recipe_ids)
+            ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+            tags = tags.filter(recipe_id__in=recipe_ids)
+        return (
+            recipes.values_list('id', 'author_id').iterator(
+                chunk_size=CHUNK_SIZE),
+            ingredients.values_list('recipe_id', 'ingredient_id').iterator(
+                chunk_size=CHUNK_SIZE),
+            tags.values_list('recipe_id', 'tag__slug').iterator(
+                chunk_size=CHUNK_SIZE),
+        )
+
+    @staticmethod
+    def _is_fresh(snapshot):
+        return (snapshot is not None
+                and time.monotonic() - snapshot.built_at < REFRESH_INTERVAL)
+
+    def _take_changes(self):
+        """ Забирает изменения, пришедшие позже копятся до следующей сборки """
+        with self._changes_lock:
+            changes = self._dirty, self._reset
+            self._dirty, self._reset = set(), False
+        return changes
+
+    def _current(self):
+        snapshot = self._snapshot
+        if (self._is_fresh(snapshot)
+                and not self._dirty and not self._reset):
+            return snapshot
+        with self._lock:
+            recipe_ids, reset = self._take_changes()
+            snapshot = self._snapshot
+            if reset or not self._is_fresh(snapshot):
+                snapshot = self._snapshot = _Snapshot(*self._rows())
+            elif recipe_ids:
+                snapshot.apply(recipe_ids, *self._rows(recipe_ids))
+            return snapshot
+
+    def warm(self):
+        self._current()
+
+    def invalidate(self, recipe_id=None):
+        """ Отмечает рецепт изменённым, без id - сбрасывает весь индекс """
+        if recipe_id is None:
+            with self._changes_lock:
+                self._reset = True
+        else:
+            self.invalidate_many([recipe_id])
+
+    def invalidate_many(self, recipe_ids):
+        """ Отмечает изменёнными сразу несколько рецептов """
+        with self._changes_lock:
+            self._dirty.update(recipe_ids)
+
+    def search(self, pantry, tags=(), author=None):
+        return self._current().search(pantry, tags, author)
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,190 @@
+import re
+from collections import defaultdict, namedtuple
+
+from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from app.benchmark import SCENARIOS, build_context, prepare, remember
+
+# Таблица считается большой, если в ней не меньше строк.
+LARGE_TABLE_ROWS = 1000
+
+KINDS = {
+    'seq_scan': 'полный просмотр таблицы',
+    'nested_loop': 'вложенный цикл по большой таблице',
+    'sort': 'сортировка без индекса',
+}
+
+Finding = namedtuple('Finding', ('kind', 'table', 'detail', 'sql'))
+
+SQLITE_SCAN = re.compile(r'^SCAN (\S+)')
+SQLITE_SEARCH = re.compile(r'^SEARCH (\S+)')
+SQLITE_ALIAS = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?')
+OUTER_LIMIT = re.compile(r'LIMIT \d+(?: OFFSET \d+)?$')
+
+
+def table_sizes():
+    """ Число строк в таблицах всех моделей, включая таблицы связей """
+    return {
+        model._meta.db_table: model._base_manager.count()
+        for model in apps.get_models(include_auto_created=True)
+        if model._meta.managed
+    }
+
+
+def _is_read(sql):
+    return sql.lstrip().upper().startswith(('SELECT', 'WITH'))
+
+
+def capture(principal, guest):
+    """
+    Один проход по сценариям бенчмарка: {сценарий: [SQL на чтение]}.
+    Запросы на запись не объясняются: EXPLAIN ANALYZE их выполнил бы.
+    """
+    context = build_context(principal, guest)
+    captured = {}
+    for scenario in SCENARIOS:
+        send = prepare(scenario, context, principal)
+        with CaptureQueriesContext(connection) as queries:
+            response, _ = send()
+        remember(scenario, response, context)
+        captured[scenario.key] = list(dict.fromkeys(
+            query['sql'] for query in queries.captured_queries
+            if _is_read(query['sql'])))
+    return captured
+
+
+def _sqlite_findings(sql, sizes, threshold):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        rows = cursor.fetchall()
+    aliases = {alias: table for table, alias in SQLITE_ALIAS.findall(sql)}
+    details, levels = {}, defaultdict(list)
+    for node, parent, _, detail in rows:
+        details[node] = (parent, detail)
+        levels[parent].append(detail)
+
+    def table(detail):
+        match = SQLITE_SCAN.match(detail) or SQLITE_SEARCH.match(detail)
+        if match:
+            name = match.group(1)
+            return aliases.get(name, name)
+        return None
+
+    def correlated(parent):
+        while parent in details:
+            parent, detail = details[parent]
+            if detail.startswith('CORRELATED'):
+                return True
+        return False
+
+    sorted_here = any(detail.startswith('USE TEMP B-TREE')
+                      for _, detail in details.values())
+    findings = []
+    for node, (parent, detail) in details.items():
+        siblings = levels[parent]
+        if detail.startswith('USE TEMP B-TREE'):
+            # Сортировать дорого, только если на этом уровне большая
+            # таблица читается целиком, а не отбирается по индексу.
+            large = [table(sibling) for sibling in siblings
+                     if SQLITE_SCAN.match(sibling)
+                     and sizes.get(table(sibling), 0) >= threshold]
+            if large:
+                findings.append(Finding('sort', large[0], detail, sql))
+            continue
+        match = SQLITE_SCAN.match(detail)
+        if not match:
+            continue
+        name = table(detail)
+        if sizes.get(name, 0) < threshold:
+            continue
+        inner = siblings.index(detail) > 0 or correlated(parent)
+        if not inner and ' WHERE ' not in sql:
+            # Запрос без условий читает таблицу целиком намеренно.
+            continue
+        if not inner and parent == 0 and OUTER_LIMIT.search(sql) and (
+                not sorted_here):
+            # Порядок даёт сам просмотр, и LIMIT останавливает его рано.
+            continue
+        findings.append(Finding(
+            'nested_loop' if inner else 'seq_scan', name, detail, sql))
+    return findings
+
+
+def _postgres_findings(sql, sizes, threshold):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql)
+        plan = cursor.fetchone()[0][0]['Plan']
+    findings = []
+
+    def relation(node):
+        if 'Relation Name' in node:
+            return node['Relation Name']
+        for child in node.get('Plans', ()):
+            name = relation(child)
+            if name:
+                return name
+        return None
+
+    def walk(node):
+        kind, children = node['Node Type'], node.get('Plans', ())
+        loops = node.get('Actual Loops', 1)
+        examined = (node.get('Actual Rows', 0)
+                    + node.get('Rows Removed by Filter', 0)) * loops
+        if kind == 'Seq Scan' and examined >= threshold and (
+                'Filter' in node or loops > 1):
+            # Без фильтра таблица читается целиком намеренно, а LIMIT
+            # останавливает просмотр рано: такие просмотры не в счёт.
+            findings.append(Finding(
+                'nested_loop' if loops > 1 else 'seq_scan',
+                node['Relation Name'],
+                f'Seq Scan: циклов {loops}, строк за цикл '
+                f'{node.get("Actual Rows")}, отброшено фильтром '
+                f'{node.get("Rows Removed by Filter", 0)}', sql))
+        elif kind in ('Sort', 'Incremental Sort') and children:
+            rows = children[0].get('Actual Rows', 0) * children[0].get(
+                'Actual Loops', 1)
+            if rows >= threshold:
+                findings.append(Finding(
+                    'sort', relation(node),
+                    f'{kind}: строк {rows}, {node.get("Sort Method")}', sql))
+        elif kind == 'Nested Loop' and len(children) == 2:
+            inner = children[1]
+            if inner.get('Actual Loops', 1) >= threshold:
+                findings.append(Finding(
+                    'nested_loop', relation(inner),
+                    f'Nested Loop: внутренний {inner["Node Type"]} '
+                    f'выполнен {inner["Actual Loops"]} раз', sql))
+        for child in children:
+            walk(child)
+
+    walk(plan)
+    return findings
+
+
+PLANNERS = {
+    'sqlite': _sqlite_findings,
+    'postgresql': _postgres_findings,
+}
+
+
+def explain(captured, threshold=LARGE_TABLE_ROWS):
+    """
+    Находки по планам всех запросов: {(вид, таблица, деталь): (находка,
+    [сценарии])}. Одинаковые запросы разных сценариев объясняются один
+    раз.
+    """
+    planner = PLANNERS[connection.vendor]
+    sizes = table_sizes()
+    plans, grouped = {}, {}
+    for scenario, queries in captured.items():
+        for sql in queries:
+            if sql not in plans:
+                plans[sql] = planner(sql, sizes, threshold)
+            for finding in plans[sql]:
+                key = (finding.kind, finding.table, finding.detail)
+                grouped.setdefault(key, (finding, []))
+                if scenario not in grouped[key][1]:
+                    grouped[key][1].append(scenario)
+    return grouped
@@ -0,0 +1,216 @@
+import base64
+import binascii
+import json
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from app.counters import add_recipes
+from app.feed import push_recipes
+from app.models import (MAXVALUE, MINVALUE, Ingredient, IngredientInRecipe,
+                        Recipe, Tag)
+from app.pantry_index import pantry_index
+from app.tag_masks import sync_tag_masks
+
+User = get_user_model()
+
+IMAGE_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+}
+NAME_MAX_LENGTH = Recipe._meta.get_field('name').max_length
+
+
+class RecordError(ValueError):
+    """ Строка файла импорта не может быть превращена в рецепт """
+
+
+def _amount(value, field):
+    if isinstance(value, bool) or not isinstance(value, int) or not (
+            MINVALUE <= value <= MAXVALUE):
+        raise RecordError(
+            f'{field}: ожидается целое от {MINVALUE} до {MAXVALUE}')
+    return value
+
+
+class Catalog:
+    """
+    Ингредиенты и теги, загруженные один раз на весь импорт: каталог
+    небольшой и не зависит от размера файла.
+    """
+
+    def __init__(self):
+        self.ingredient_ids = set()
+        self.ingredients = {}
+        for ingredient_id, name, unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'):
+            self.ingredient_ids.add(ingredient_id)
+            self.ingredients[(name.lower(), unit.lower())] = ingredient_id
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+
+    def ingredient(self, item):
+        if not isinstance(item, dict):
+            raise RecordError('ingredients: ожидается список объектов')
+        if 'id' in item:
+            ingredient_id = item['id']
+            if (not isinstance(ingredient_id, int)
+                    or ingredient_id not in self.ingredient_ids):
+                raise RecordError(f'Нет ингредиента с id {ingredient_id}')
+        else:
+            key = (str(item.get('name', '')).lower(),
+                   str(item.get('measurement_unit', '')).lower())
+            ingredient_id = self.ingredients.get(key)
+            if ingredient_id is None:
+                raise RecordError(f'Нет ингредиента {key[0]} ({key[1]})')
+        return ingredient_id, _amount(item.get('amount'), 'amount')
+
+    def tag(self, slug):
+        if not isinstance(slug, str) or slug not in self.tags:
+            raise RecordError(f'Нет тега {slug}')
+        return self.tags[slug]
+
+
+class ParsedRecipe:
+    __slots__ = ('line', 'author', 'name', 'text', 'cooking_time', 'image',
+                 'uploaded', 'tags', 'ingredients')
+
+
+def parse_record(text, catalog, default_author=None):
+    """ Разбирает и проверяет одну строку NDJSON """
+    try:
+        data = json.loads(text)
+    except ValueError as error:
+        raise RecordError(f'Некорректный JSON: {error}')
+    if not isinstance(data, dict):
+        raise RecordError('Ожидается объект JSON')
+
+    recipe = ParsedRecipe()
+    recipe.author = data.get('author') or default_author
+    if not isinstance(recipe.author, str):
+        raise RecordError('Не указан автор')
+    recipe.name = str(data.get('name') or '').strip()
+    if not recipe.name or len(recipe.name) > NAME_MAX_LENGTH:
+        raise RecordError(
+            f'name: ожидается от 1 до {NAME_MAX_LENGTH} символов')
+    recipe.text = str(data.get('text') or '')
+    recipe.cooking_time = _amount(data.get('cooking_time'), 'cooking_time')
+    recipe.image = data.get('image')
+    if not isinstance(recipe.image, str) or not recipe.image:
+        raise RecordError('Не указано изображение')
+    recipe.uploaded = False
+
+    tags = data.get('tags') or []
+    if not isinstance(tags, list):
+        raise RecordError('tags: ожидается список слагов')
+    recipe.tags = list(dict.fromkeys(catalog.tag(slug) for slug in tags))
+
+    items = data.get('ingredients')
+    if not isinstance(items, list) or not items:
+        raise RecordError('Нужен хотя бы один ингредиент')
+    recipe.ingredients = [catalog.ingredient(item) for item in items]
+    if len({ingredient for ingredient, _ in recipe.ingredients}) != len(
+            recipe.ingredients):
+        raise RecordError('Ингредиенты повторяются')
+    return recipe
+
+
+def store_image(value, storage=default_storage):
+    """
+    Сохраняет картинку из data URI в media/recipes/ и возвращает её имя.
+    Любая другая строка считается путём к уже загруженному файлу.
+    """
+    if not value.startswith('data:'):
+        if not storage.exists(value):
+            raise RecordError(f'Нет файла {value}')
+        return value
+    header, _, payload = value.partition(',')
+    extension = IMAGE_EXTENSIONS.get(header[5:].split(';')[0])
+    if extension is None or not header.endswith(';base64'):
+        raise RecordError('image: ожидается data URI картинки в base64')
+    try:
+        content = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        raise RecordError('image: некорректный base64')
+    return storage.save(f'recipes/{uuid.uuid4()}.{extension}',
+                        ContentFile(content))
+
+
+def discard_images(recipes, storage=default_storage):
+    """
+    Удаляет картинки, сохранённые store_image для рецептов, которые не
+    попали в базу; файлы, указанные в строках путём, не трогает.
+    """
+    for recipe in recipes:
+        if recipe.uploaded:
+            storage.delete(recipe.image)
+
+
+def _authors(recipes):
+    """ Пользователи по username или email одним запросом на пачку """
+    keys = {recipe.author for recipe in recipes}
+    authors = {}
+    for user_id, username in User.objects.filter(
+            username__in=keys).values_list('id', 'username'):
+        authors[username] = user_id
+    missing = keys - authors.keys()
+    if missing:
+        for user_id, email in User.objects.filter(
+                email__in=missing).values_list('id', 'email'):
+            authors[email] = user_id
+    return authors
+
+
+def _created_ids(recipes):
+    """
+    Первичные ключи только что созданных рецептов. PostgreSQL
+    возвращает их из bulk_create; SQLite держит блокировку записи до
+    конца транзакции, поэтому последние строки таблицы — наши.
+    """
+    if recipes[0].pk is not None:
+        return [recipe.pk for recipe in recipes]
+    ids = Recipe.objects.order_by('-id').values_list(
+        'id', flat=True)[:len(recipes)]
+    return sorted(ids)
+
+
+def import_batch(recipes):
+    """
+    Создаёт пачку рецептов с тегами и ингредиентами в одной транзакции.
+    Рецепты с неизвестным автором пропускаются; возвращает их список.
+    """
+    authors = _authors(recipes)
+    rejected = [recipe for recipe in recipes if recipe.author not in authors]
+    recipes = [recipe for recipe in recipes if recipe.author in authors]
+    if not recipes:
+        return rejected
+    with transaction.atomic():
+        objs = Recipe.objects.bulk_create([
+            Recipe(author_id=authors[recipe.author], name=recipe.name,
+                   text=recipe.text, cooking_time=recipe.cooking_time,
+                   image=recipe.image)
+            for recipe in recipes
+        ])
+        ids = _created_ids(objs)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id, recipe in zip(ids, recipes)
+            for tag_id in recipe.tags
+        ])
+        sync_tag_masks(ids)
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe_id=recipe_id,
+                               ingredient_id=ingredient_id, amount=amount)
+            for recipe_id, recipe in zip(ids, recipes)
+            for ingredient_id, amount in recipe.ingredients
+        ])
+        add_recipes(authors[recipe.author] for recipe in recipes)
+        push_recipes((recipe_id, authors[recipe.author])
+                     for recipe_id, recipe in zip(ids, recipes))
+        # bulk_create не шлёт сигналов, которые обновляют индекс.
+        transaction.on_commit(lambda: pantry_index.invalidate_many(ids))
+    return rejected
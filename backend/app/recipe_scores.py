@@ -0,0 +1,81 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from app.models import Favorite, Recipe, ShoppingList
+from app.response_cache import bump_data_version
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 2000
+
+# Вклад одной отметки: покупка - намерение приготовить, весит больше.
+WEIGHTS = ((Favorite, 1.0), (ShoppingList, 1.5))
+
+# Вид рейтинга: (столбец места, период полураспада, окно, корзина).
+# Отметки группируются по корзинам времени, так что запрос возвращает
+# строки (рецепт, корзина), а не все отметки по одной.
+RATINGS = {
+    'popular': ('popular_rank', timedelta(days=30), None, TruncDay),
+    'trending': ('trending_rank', timedelta(days=2), timedelta(days=7),
+                 TruncHour),
+}
+
+
+def decayed_scores(half_life, window=None, trunc=TruncDay, now=None):
+    """
+    Сумма весов отметок по рецептам, где каждая отметка с возрастом
+    теряет половину веса за half_life. Отметки старше window не
+    учитываются.
+    """
+    now = now or timezone.now()
+    scores = defaultdict(float)
+    for model, weight in WEIGHTS:
+        marks = model.objects.all()
+        if window is not None:
+            marks = marks.filter(created__gte=now - window)
+        rows = marks.annotate(bucket=trunc('created')).values_list(
+            'recipe_id', 'bucket').annotate(total=Count('id')).order_by()
+        for recipe_id, bucket, total in rows.iterator(chunk_size=CHUNK_SIZE):
+            age = max((now - bucket) / half_life, 0)
+            scores[recipe_id] += weight * total * 0.5 ** age
+    return scores
+
+
+def rank(scores):
+    """ Места 1..N по убыванию счёта, при равенстве новее выше """
+    ordered = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+    return {recipe_id: place
+            for place, (recipe_id, score) in enumerate(ordered, 1)
+            if score > 0}
+
+
+def update_recipe_scores(now=None):
+    """
+    Пересчитывает места рецептов во всех рейтингах и записывает только
+    изменившиеся. Рецепты без отметок в рейтинг не попадают (NULL).
+    Возвращает {рейтинг: (рецептов в рейтинге, изменено строк)}.
+    """
+    now = now or timezone.now()
+    fields = [field for field, *_ in RATINGS.values()]
+    ranks = {
+        name: rank(decayed_scores(half_life, window, trunc, now))
+        for name, (_, half_life, window, trunc) in RATINGS.items()
+    }
+    changed, stats = [], {name: 0 for name in RATINGS}
+    for recipe_id, *current in Recipe.objects.order_by().values_list(
+            'id', *fields).iterator(chunk_size=CHUNK_SIZE):
+        new = [ranks[name].get(recipe_id) for name in RATINGS]
+        if new == current:
+            continue
+        changed.append(Recipe(id=recipe_id, **dict(zip(fields, new))))
+        for name, old, value in zip(RATINGS, current, new):
+            stats[name] += old != value
+    with transaction.atomic():
+        Recipe.objects.bulk_update(changed, fields, batch_size=BATCH_SIZE)
+    if changed:
+        bump_data_version()
+    return {name: (len(ranks[name]), stats[name]) for name in RATINGS}
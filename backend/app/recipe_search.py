@@ -0,0 +1,91 @@
+import re
+
+from django.db import connection, connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+WORDS = re.compile(r'\w+')
+
+# Окончания для грубого стемминга на SQLite: в FTS5 нет русского
+# стеммера, поэтому от слова запроса отрезается окончание и ищется
+# префикс основы. На PostgreSQL стемминг делает словарь russian.
+ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ах',
+    'ях', 'ов', 'ев', 'ей', 'ой', 'ом', 'ем', 'ам', 'ям', 'ая', 'яя', 'ое',
+    'ее', 'ые', 'ие', 'ый', 'ий', 'ую', 'юю', 'ью', 'ия', 'ья', 'ии', 'ы',
+    'и', 'а', 'я', 'о', 'е', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+MIN_STEM = 3
+
+POSTGRES_MATCH = ("SELECT id FROM app_recipe WHERE search_vector @@ "
+                  "websearch_to_tsquery('russian', %s)")
+POSTGRES_RANK = ("ts_rank_cd(app_recipe.search_vector, "
+                 "websearch_to_tsquery('russian', %s))")
+SQLITE_MATCH = ('SELECT rowid FROM app_recipe_fts '
+                'WHERE app_recipe_fts MATCH %s')
+# bm25 тем меньше, чем лучше совпадение; название весит больше текста.
+SQLITE_RANK = ('(SELECT -bm25(app_recipe_fts, 10.0, 1.0) FROM app_recipe_fts '
+               'WHERE app_recipe_fts MATCH %s AND rowid = app_recipe.id)')
+
+
+# SQLite пересоздаёт таблицу при изменении её полей в миграциях и
+# теряет триггеры, поэтому после каждой миграции они создаются заново.
+SQLITE_FOLD = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+SQLITE_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS app_recipe_fts_insert AFTER INSERT "
+    "ON app_recipe BEGIN INSERT INTO app_recipe_fts(rowid, name, text) "
+    "VALUES (new.id, {}, {}); END".format(
+        SQLITE_FOLD.format('new.name'), SQLITE_FOLD.format('new.text')),
+    "CREATE TRIGGER IF NOT EXISTS app_recipe_fts_update AFTER UPDATE OF "
+    "name, text ON app_recipe BEGIN UPDATE app_recipe_fts SET name = {}, "
+    "text = {} WHERE rowid = old.id; END".format(
+        SQLITE_FOLD.format('new.name'), SQLITE_FOLD.format('new.text')),
+    "CREATE TRIGGER IF NOT EXISTS app_recipe_fts_delete AFTER DELETE "
+    "ON app_recipe BEGIN DELETE FROM app_recipe_fts WHERE rowid = old.id; "
+    "END",
+)
+
+
+def ensure_sqlite_triggers(using):
+    """ Восстанавливает триггеры FTS5, если таблица индекса уже есть """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    if 'app_recipe_fts' not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        for sql in SQLITE_TRIGGERS:
+            cursor.execute(sql)
+
+
+def _stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def sqlite_match_expression(query):
+    """ Запрос FTS5: все слова запроса как префиксы их основ """
+    words = WORDS.findall(query.lower().replace('ё', 'е'))
+    return ' '.join(f'"{_stem(word)}"*' for word in words)
+
+
+def search_recipes(queryset, query):
+    """
+    Оставляет рецепты, подходящие под текстовый запрос по названию и
+    описанию, и сортирует их по релевантности.
+
+    Поиск идёт по текстовому индексу: tsvector с GIN-индексом на
+    PostgreSQL и таблица FTS5 на SQLite (миграция 0008).
+    """
+    if connection.vendor == 'postgresql':
+        match, rank, param = POSTGRES_MATCH, POSTGRES_RANK, query
+    else:
+        match, rank = SQLITE_MATCH, SQLITE_RANK
+        param = sqlite_match_expression(query)
+        if not param:
+            return queryset.none()
+    return queryset.filter(id__in=RawSQL(match, (param,))).annotate(
+        search_rank=RawSQL(rank, (param,), output_field=FloatField()),
+    ).order_by('-search_rank', '-id')
@@ -0,0 +1,32 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class DownloadRenderer(BaseRenderer):
+    """
+    Рендерер выгрузок. Сами файлы отдаются потоком в обход рендерера,
+    через него проходят только ответы об ошибках.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class PlainTextRenderer(DownloadRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(DownloadRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class JSONDownloadRenderer(DownloadRenderer):
+    media_type = 'application/json'
+    format = 'json'
@@ -0,0 +1,98 @@
+import hashlib
+import time
+import uuid
+from functools import partial
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import (http_date, parse_etags, parse_http_date_safe,
+                               quote_etag)
+from rest_framework.response import Response
+
+from app.metrics import render_response
+
+VERSION_KEY = 'api:data-version'
+RESPONSE_CACHE_TIMEOUT = 300
+CACHED_ACTIONS = ('list', 'retrieve')
+
+
+def data_version():
+    """ Текущая версия данных: (идентификатор, время изменения) """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, (uuid.uuid4().hex, int(time.time())), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_data_version():
+    """ Делает недействительными все закэшированные ответы """
+    cache.set(VERSION_KEY, (uuid.uuid4().hex, int(time.time())), None)
+
+
+class AnonymousResponseCacheMixin:
+    """
+    Кэш ответов list и retrieve для анонимных запросов.
+
+    Ключ строится из полного пути с query string, заголовка Accept и
+    версии данных, которую сигналы меняют при изменении моделей.
+    Запрос с совпадающим If-None-Match или If-Modified-Since получает
+    304 без обращения к базе. Ответ из кэша подставляется вместо
+    обработчика действия, то есть после initial(): аутентификация,
+    права и ограничения частоты проверяются как без кэша.
+    """
+
+    cached_actions = CACHED_ACTIONS
+    _cache_entry = None
+
+    def _is_cacheable(self, request):
+        return (request.method == 'GET'
+                and 'HTTP_AUTHORIZATION' not in request.META
+                and self.action_map.get('get') in self.cached_actions)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self._is_cacheable(request):
+            self.get = partial(self._cached_response, self.get)
+
+    def _cached_response(self, handler, request, *args, **kwargs):
+        version, modified = data_version()
+        key = 'api:response:' + hashlib.md5(
+            f'{version}:{request.get_full_path()}:'
+            f'{request.META.get("HTTP_ACCEPT", "")}'.encode()).hexdigest()
+        headers = {'ETag': quote_etag(key[len('api:response:'):]),
+                   'Last-Modified': http_date(modified)}
+        self._cache_entry = (key, headers, None)
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if ((if_none_match and headers['ETag'] in parse_etags(if_none_match))
+                or (if_none_match is None and if_modified_since
+                    and if_modified_since >= modified)):
+            return HttpResponseNotModified()
+        cached = cache.get(key)
+        if cached is None:
+            return handler(request, *args, **kwargs)
+        content, content_type, vary = cached
+        self._cache_entry = (key, headers, vary)
+        return HttpResponse(content, content_type=content_type)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if self._cache_entry is None:
+            return response
+        key, headers, vary = self._cache_entry
+        if isinstance(response, Response):
+            if response.status_code != 200:
+                return response
+            render_response(response)
+            cache.set(key, (response.content, response['Content-Type'],
+                            response.get('Vary', 'Accept')),
+                      RESPONSE_CACHE_TIMEOUT)
+        elif vary is not None:
+            response['Vary'] = vary
+        for header, value in headers.items():
+            response[header] = value
+        return response
@@ -0,0 +1,358 @@
+import heapq
+import io
+import random
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from app.catalog import invalidate_snapshot
+from app.feed import FEED_LENGTH
+from app.recipe_scores import update_recipe_scores
+from app.images import build_derivatives
+from app.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                        ShoppingCartIngredient, ShoppingList, Tag,
+                        TimelineEntry)
+from app.response_cache import bump_data_version
+from users.models import Profile, Subscriptions
+
+User = get_user_model()
+
+INSERT_BATCH = 10000
+PASSWORD = 'bench-password-1'
+PLACEHOLDER_IMAGE = 'recipes/placeholder.png'
+USERNAME_PREFIX = 'bench_user_'
+
+# Популярность рецептов, авторов и ингредиентов убывает по закону Ципфа:
+# k-й по популярности выбирается с весом 1 / k ** ZIPF_EXPONENT.
+ZIPF_EXPONENT = 1.0
+# Средние числа отметок на пользователя; у каждого пользователя своё
+# число, распределённое экспоненциально: многие отмечают мало, немногие
+# - много.
+FAVORITES_PER_USER = 5
+CARTS_PER_USER = 2
+SUBSCRIPTIONS_PER_USER = 5
+# Отметки распределены по этому периоду до момента наполнения, чтобы
+# рейтинги популярного и трендового были не пустыми.
+MARKS_PERIOD = timedelta(days=90)
+PROGRESS_EVERY = 100000
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F2B705', 'dessert'),
+    ('Выпечка', '#B5651D', 'baking'),
+    ('Суп', '#1E90FF', 'soup'),
+    ('Салат', '#2E8B57', 'salad'),
+    ('Постное', '#708090', 'lenten'),
+)
+
+DISHES = (
+    'борщ', 'суп', 'салат', 'пирог', 'рагу', 'плов', 'омлет', 'запеканка',
+    'каша', 'котлеты', 'блины', 'оладьи', 'пельмени', 'вареники', 'гуляш',
+    'жаркое', 'сырники', 'кекс', 'соус', 'паста',
+)
+ADJECTIVES = (
+    'домашний', 'быстрый', 'острый', 'сливочный', 'постный', 'летний',
+    'зимний', 'бабушкин', 'праздничный', 'овощной', 'грибной', 'сырный',
+)
+SENTENCES = (
+    'Нарежьте овощи крупными кусками и обжарьте на сковороде.',
+    'Доведите бульон до кипения и убавьте огонь.',
+    'Смешайте муку с яйцами и молоком до однородности.',
+    'Запекайте в разогретой духовке до золотистой корочки.',
+    'Подавайте горячим со свежей зеленью и сметаной.',
+    'Посолите и поперчите по вкусу, перемешайте.',
+    'Дайте блюду настояться под крышкой несколько минут.',
+    'Грибы промойте, нарежьте и потушите со свёклой.',
+)
+
+
+def _sample(rng, population, count):
+    return rng.sample(population, min(count, len(population)))
+
+
+def _zipf_weights(count, exponent=ZIPF_EXPONENT):
+    """ Накопленные веса Ципфа для rng.choices(cum_weights=...) """
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, count + 1)))
+
+
+def _zipf_distinct(rng, ranked, weights, count, attempts=10):
+    """
+    До count разных элементов ranked (от популярных к редким) с весами
+    Ципфа. Повторы популярных элементов добираются заново, но не более
+    attempts раз, поэтому для маленьких ranked элементов может быть меньше.
+    """
+    count = min(count, len(ranked))
+    picked = set()
+    for _ in range(attempts):
+        picked.update(rng.choices(ranked, cum_weights=weights,
+                                  k=count - len(picked)))
+        if len(picked) >= count:
+            break
+    return picked
+
+
+def _marks(rng, owners, ranked, weights, mean):
+    """ Пары (владелец, цель): у каждого владельца в среднем mean целей """
+    return {
+        (owner, target)
+        for owner in owners
+        for target in _zipf_distinct(
+            rng, ranked, weights, int(rng.expovariate(1 / mean)))
+        if owner != target
+    }
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace(
+        '\n', '\\n').replace('\r', '\\r')
+
+
+class _Inserter:
+    """
+    Пачечная вставка строк в таблицу модели без создания объектов
+    моделей: COPY на PostgreSQL, executemany на остальных базах.
+    Строки - кортежи значений fields, остальные столбцы получают
+    значения по умолчанию полей модели.
+    """
+
+    def __init__(self, cursor, model, fields, batch_size=INSERT_BATCH):
+        meta = model._meta
+        given = [meta.get_field(name) for name in fields]
+        rest = [field for field in meta.concrete_fields
+                if field not in given and not field.primary_key]
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.table = connection.ops.quote_name(meta.db_table)
+        self.columns = ', '.join(connection.ops.quote_name(field.column)
+                                 for field in given + rest)
+        self.defaults = tuple(
+            field.get_db_prep_save(field.get_default(), connection)
+            for field in rest)
+        self.rows = []
+        self.written = 0
+
+    def add(self, *row):
+        self.rows.append(row + self.defaults)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if connection.vendor == 'postgresql':
+            buffer = io.StringIO(''.join(
+                '\t'.join(map(_copy_value, row)) + '\n'
+                for row in self.rows))
+            self.cursor.copy_expert(
+                f'COPY {self.table} ({self.columns}) FROM STDIN', buffer)
+        else:
+            placeholders = ', '.join(['%s'] * len(self.rows[0]))
+            self.cursor.executemany(
+                f'INSERT INTO {self.table} ({self.columns}) '
+                f'VALUES ({placeholders})', self.rows)
+        self.written += len(self.rows)
+        self.rows.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.flush()
+
+
+def _placeholder_image():
+    """
+    Кладёт в хранилище общую картинку рецептов и её уменьшенные копии.
+    Возвращает имя оригинала, для которого копии построены.
+    """
+    if not default_storage.exists(PLACEHOLDER_IMAGE):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 1200), '#E26C2D').save(buffer, 'PNG')
+        default_storage.save(PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue()))
+    return PLACEHOLDER_IMAGE if build_derivatives(PLACEHOLDER_IMAGE) else ''
+
+
+def seed_database(users=2000, recipes=20000, seed=0, stdout=None,
+                  exponent=ZIPF_EXPONENT):
+    """
+    Наполняет базу воспроизводимым набором данных для бенчмарков и
+    нагрузочных тестов: одинаковый seed даёт одинаковые строки, от
+    момента запуска зависит только время отметок. Рецепты, авторы и
+    ингредиенты выбираются с весами Ципфа, поэтому у немногих рецептов
+    большая часть избранного, у немногих авторов - подписчиков.
+
+    Строки пишутся пачками мимо моделей; счётчики, маски тегов, суммы
+    списков покупок и ленты подписок считаются в памяти по ходу, а не
+    отдельными пересчётами. Все рецепты ссылаются на одну
+    картинку-заглушку.
+
+    Возвращает первого созданного пользователя: у него больше всего
+    избранного, покупок и подписок, от его имени идут запросы.
+    """
+    rng = random.Random(seed)
+    if not Ingredient.objects.exists():
+        call_command('sync_ingredients')
+    ingredient_ranked = list(Ingredient.objects.order_by('id').values_list(
+        'id', flat=True))
+    rng.shuffle(ingredient_ranked)
+    ingredient_weights = _zipf_weights(len(ingredient_ranked), exponent)
+    derivatives_for = _placeholder_image()
+    for name, color, slug in TAGS:
+        Tag.objects.get_or_create(
+            slug=slug, defaults={'name': name, 'color': color})
+    tags = list(Tag.objects.order_by('id').values_list('id', 'bit'))
+    now = timezone.now()
+
+    def marked_at():
+        return connection.ops.adapt_datetimefield_value(
+            now - MARKS_PERIOD * rng.random())
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        first_user = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        first_index = User.objects.filter(
+            username__startswith=USERNAME_PREFIX).count()
+        user_ids = list(range(first_user, first_user + users))
+        # Несколько авторов пишут большую часть рецептов.
+        authors = user_ids[:max(1, users // 5)]
+        first_recipe = (Recipe.objects.aggregate(
+            last=Max('id'))['last'] or 0) + 1
+        recipe_ids = list(range(first_recipe, first_recipe + recipes))
+
+        principal = user_ids[0]
+        recipe_ranked = rng.sample(recipe_ids, len(recipe_ids))
+        recipe_weights = _zipf_weights(len(recipe_ranked), exponent)
+        author_ranked = rng.sample(authors, len(authors))
+        author_weights = _zipf_weights(len(author_ranked), exponent)
+        favorites = _marks(rng, user_ids, recipe_ranked, recipe_weights,
+                           FAVORITES_PER_USER)
+        carts = _marks(rng, user_ids, recipe_ranked, recipe_weights,
+                       CARTS_PER_USER)
+        subscriptions = _marks(rng, user_ids, author_ranked, author_weights,
+                               SUBSCRIPTIONS_PER_USER)
+        favorites.update((principal, recipe_id)
+                         for recipe_id in _sample(rng, recipe_ids, 100))
+        carts.update((principal, recipe_id)
+                     for recipe_id in _sample(rng, recipe_ids, 30))
+        subscriptions.update((principal, author)
+                             for author in _sample(rng, authors[1:], 50))
+
+        password = make_password(PASSWORD)
+        with _Inserter(cursor, User, (
+                'id', 'username', 'email', 'first_name', 'last_name',
+                'password')) as table:
+            for index, user_id in enumerate(user_ids, first_index):
+                table.add(user_id, f'{USERNAME_PREFIX}{index}',
+                          f'{USERNAME_PREFIX}{index}@example.com', 'Имя',
+                          f'Фамилия {index}', password)
+
+        favorite_counts = Counter(recipe for _, recipe in favorites)
+        cart_counts = Counter(recipe for _, recipe in carts)
+        carted_by = defaultdict(list)
+        for user_id, recipe_id in carts:
+            carted_by[recipe_id].append(user_id)
+        cart_totals = defaultdict(int)
+        recipes_of = defaultdict(list)
+        with _Inserter(cursor, Recipe, (
+                'id', 'author_id', 'name', 'text', 'cooking_time', 'image',
+                'image_derivatives_for', 'favorites_count',
+                'shopping_cart_count', 'tag_mask')) as recipe_table, \
+                _Inserter(cursor, Recipe.tags.through,
+                          ('recipe_id', 'tag_id')) as tag_table, \
+                _Inserter(cursor, IngredientInRecipe, (
+                    'recipe_id', 'ingredient_id', 'amount')) as amounts:
+            for number, recipe_id in enumerate(recipe_ids, 1):
+                author = rng.choices(author_ranked,
+                                     cum_weights=author_weights)[0]
+                recipes_of[author].append(recipe_id)
+                mask = 0
+                for tag_id, bit in rng.sample(tags, rng.randint(1, 3)):
+                    tag_table.add(recipe_id, tag_id)
+                    if bit is not None:
+                        mask |= 1 << bit
+                recipe_table.add(
+                    recipe_id, author,
+                    f'{rng.choice(ADJECTIVES).capitalize()} '
+                    f'{rng.choice(DISHES)} №{recipe_id - first_recipe}',
+                    ' '.join(rng.sample(SENTENCES, 3)), rng.randint(5, 180),
+                    PLACEHOLDER_IMAGE, derivatives_for,
+                    favorite_counts[recipe_id], cart_counts[recipe_id], mask)
+                holders = carted_by.get(recipe_id, ())
+                for ingredient in _zipf_distinct(
+                        rng, ingredient_ranked, ingredient_weights,
+                        rng.randint(3, 10)):
+                    amount = int(rng.random() * 500) + 1
+                    amounts.add(recipe_id, ingredient, amount)
+                    for user_id in holders:
+                        cart_totals[(user_id, ingredient)] += amount
+                if stdout is not None and number % PROGRESS_EVERY == 0:
+                    stdout.write(f'Рецептов: {number}')
+
+        followers_count = Counter(author for _, author in subscriptions)
+        with _Inserter(cursor, Profile, (
+                'user_id', 'recipes_count', 'followers_count',
+                'cart_version')) as table:
+            for user_id in user_ids:
+                table.add(user_id, len(recipes_of.get(user_id, ())),
+                          followers_count[user_id], 0)
+        for model, pairs in ((Favorite, favorites), (ShoppingList, carts)):
+            with _Inserter(cursor, model,
+                           ('user_id', 'recipe_id', 'created')) as table:
+                for user_id, recipe_id in sorted(pairs):
+                    table.add(user_id, recipe_id, marked_at())
+        with _Inserter(cursor, Subscriptions,
+                       ('user_id', 'author_id')) as table:
+            for user_id, author in sorted(subscriptions):
+                table.add(user_id, author)
+        with _Inserter(cursor, ShoppingCartIngredient,
+                       ('user_id', 'ingredient_id', 'amount')) as table:
+            for (user_id, ingredient), amount in sorted(cart_totals.items()):
+                table.add(user_id, ingredient, amount)
+        following = defaultdict(list)
+        for user_id, author in subscriptions:
+            following[user_id].append(author)
+        with _Inserter(cursor, TimelineEntry,
+                       ('user_id', 'recipe_id')) as table:
+            for user_id, followed in sorted(following.items()):
+                # Рецепты каждого автора идут по возрастанию id, лента -
+                # FEED_LENGTH самых новых из всех.
+                newest = heapq.merge(
+                    *(reversed(recipes_of[author]) for author in followed),
+                    reverse=True)
+                for recipe_id in islice(newest, FEED_LENGTH):
+                    table.add(user_id, recipe_id)
+        # Идентификаторы заданы явно: счётчики PostgreSQL нужно сдвинуть.
+        for sql in connection.ops.sequence_reset_sql(no_style(),
+                                                     [User, Recipe]):
+            cursor.execute(sql)
+
+        update_recipe_scores()
+    # Строки записаны мимо моделей и сигналов, кэши сбрасываются явно.
+    bump_data_version()
+    invalidate_snapshot()
+
+    if stdout is not None:
+        stdout.write(
+            f'Создано: пользователей {users}, рецептов {len(recipe_ids)}, '
+            f'связей с ингредиентами {amounts.written}, '
+            f'избранного {len(favorites)}, покупок {len(carts)}, '
+            f'подписок {len(subscriptions)}')
+    return User.objects.get(id=principal)
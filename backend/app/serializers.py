@@ -1,9 +1,13 @@
-from django.db.models import F
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.fields import IntegerField
 
+from app.images import RecipeImagesField
 from app.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from app.pantry_index import MAX_PANTRY
+from app.shopping_cart import restore_recipe, withdraw_recipe
+from app.tag_masks import mask_of
 from users.serializers import CustomUserSerializer
 
 MINVALUE = 1
@@ -36,10 +40,11 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class RecipeReadSerializer(serializers.ModelSerializer):
-    author = CustomUserSerializer(read_only=True)
+    author = serializers.SerializerMethodField()
     ingredients = serializers.SerializerMethodField()
     tags = serializers.SerializerMethodField()
     image = Base64ImageField()
+    images = RecipeImagesField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     cooking_time = serializers.IntegerField(max_value=MAXVALUE,
@@ -54,37 +59,52 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'ingredients',
             'is_favorited',
             'is_in_shopping_cart',
+            'favorites_count',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
         )
 
+    def get_author(self, obj):
+        author = obj.author
+        if author is None:
+            return None
+        if hasattr(obj, 'author_is_subscribed'):
+            author.is_subscribed = obj.author_is_subscribed
+        return CustomUserSerializer(author, context=self.context).data
+
     def get_tags(self, obj):
         return TagSerializer(
             obj.tags.all(),
             many=True,).data
 
     def get_ingredients(self, obj):
-        recipe = obj
-        ingredients = recipe.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('ingredientinrecipe__amount')
-        )
-        return ingredients
+        return [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in obj.ingredient_list.all()
+        ]
 
     def get_is_favorited(self, obj):
-        request = self.context['request']
-        user = request.user
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        user = self.context['request'].user
         if not user.is_authenticated:
             return False
         return obj.favorites.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context['request']
-        user = request.user
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        user = self.context['request'].user
+        if not user.is_authenticated:
+            return False
         return obj.recipe_shopping.filter(user=user).exists()
 
 
@@ -100,6 +120,7 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
 class RecipeCreateSerializer(serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     ingredients = IngredientInRecipeSerializer(many=True)
+    tags = serializers.ListField(child=serializers.IntegerField())
     image = Base64ImageField()
 
     class Meta:
@@ -116,69 +137,147 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
 
     def validate_ingredients(self, value):
-        ingredients = set()
-        for item in value:
-            ingredient = Ingredient.objects.get(id=item['id'])
-            if ingredient in ingredients:
-                raise serializers.ValidationError({
-                    'Ингридиенты повторятюся'})
-            ingredients.add(ingredient)
+        ids = [item['id'] for item in value]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError({
+                'Ингридиенты повторятюся'})
+        missing = set(ids) - Ingredient.objects.in_bulk(ids).keys()
+        if missing:
+            raise serializers.ValidationError(
+                'Нет ингредиентов с id: '
+                + ', '.join(map(str, sorted(missing))))
         return value
 
     def validate_tags(self, value):
-        tags = set()
-        for tag in value:
-            if tag in tags:
-                raise serializers.ValidationError(
-                    {'Теги повторятюся'})
-            tags.add(tag)
-        return value
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError(
+                {'Теги повторятюся'})
+        tags = Tag.objects.in_bulk(value)
+        missing = set(value) - tags.keys()
+        if missing:
+            raise serializers.ValidationError(
+                'Нет тегов с id: ' + ', '.join(map(str, sorted(missing))))
+        return [tags[tag_id] for tag_id in value]
 
     def create_ingredients(self, ingredients, recipe):
-        ingredients_list = []
-        for item in ingredients:
-            ingredient_id = item.get('id')
-            ingredient = Ingredient.objects.get(
-                id=ingredient_id)
-            ingredients_list.append(
-                IngredientInRecipe(
-                    ingredient=ingredient,
-                    amount=item.get('amount'),
-                    recipe=recipe,
-                )
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                ingredient_id=item['id'],
+                amount=item['amount'],
+                recipe=recipe,
             )
-        IngredientInRecipe.objects.bulk_create(ingredients_list)
-
+            for item in ingredients
+        ])
+
+    def create_tags(self, tags, recipe):
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tag) for tag in tags
+        ])
+
+    def update_ingredients(self, ingredients, recipe):
+        """ Меняет только добавленные, изменённые и удалённые строки """
+        current = {row.ingredient_id: row
+                   for row in recipe.ingredient_list.all()}
+        wanted = {item['id']: item['amount'] for item in ingredients}
+        removed = [row.id for ingredient_id, row in current.items()
+                   if ingredient_id not in wanted]
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = wanted.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        added = [{'id': ingredient_id, 'amount': amount}
+                 for ingredient_id, amount in wanted.items()
+                 if ingredient_id not in current]
+        if not (removed or changed or added):
+            return
+        withdraw_recipe(recipe.id)
+        if removed:
+            IngredientInRecipe.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ('amount',))
+        if added:
+            self.create_ingredients(added, recipe)
+        restore_recipe(recipe.id)
+
+    def update_tags(self, tags, recipe):
+        current = {tag.id for tag in recipe.tags.all()}
+        wanted = {tag.id for tag in tags}
+        if current - wanted:
+            Recipe.tags.through.objects.filter(
+                recipe=recipe, tag_id__in=current - wanted).delete()
+        self.create_tags([tag for tag in tags if tag.id not in current],
+                         recipe)
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
-        self.create_ingredients(recipe=recipe, ingredients=ingredients)
+        recipe = Recipe.objects.create(
+            tag_mask=mask_of(tag.bit for tag in tags), **validated_data)
+        self.create_tags(tags, recipe)
+        self.create_ingredients(ingredients, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients(recipe=instance,
-                                ingredients=ingredients)
-        instance.save()
-        return instance
+        self.update_tags(tags, instance)
+        self.update_ingredients(ingredients, instance)
+        instance.tag_mask = mask_of(tag.bit for tag in tags)
+        return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        instance = Recipe.objects.with_details(request.user).get(
+            pk=instance.pk)
         return RecipeReadSerializer(instance, context=context).data
 
 
+class PantrySerializer(serializers.Serializer):
+    """ Ингредиенты, которые есть у пользователя """
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_PANTRY,
+    )
+
+
+class PantryRecipeSerializer(RecipeReadSerializer):
+    """ Рецепт в поиске по ингредиентам: покрытие и чего не хватает """
+
+    coverage = serializers.SerializerMethodField()
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + (
+            'coverage', 'missing_ingredients')
+
+    def get_coverage(self, obj):
+        matched, size = self.context['matches'][obj.id]
+        return round(matched / size, 3)
+
+    def get_missing_ingredients(self, obj):
+        pantry = self.context['pantry']
+        return [
+            {'id': item.ingredient.id,
+             'name': item.ingredient.name,
+             'measurement_unit': item.ingredient.measurement_unit,
+             'amount': item.amount}
+            for item in obj.ingredient_list.all()
+            if item.ingredient_id not in pantry
+        ]
+
+
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Серилизатор для краткого вывода рецептов."""
 
     image = Base64ImageField(required=True, allow_null=False)
+    images = RecipeImagesField()
 
     class Meta:
         model = Recipe
@@ -186,6 +285,7 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'images',
             'cooking_time',
         )
 
@@ -0,0 +1,236 @@
+import csv
+import hashlib
+import json
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+
+from app.counters import shift_recipe
+from app.models import (IngredientInRecipe, ShoppingCartIngredient,
+                        ShoppingList)
+from users.models import Profile
+
+CHUNK_SIZE = 2000
+BATCH_SIZE = 1000
+FILENAME = 'shopping_cart_list'
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+
+
+CART = ShoppingCartIngredient._meta.db_table
+RECIPE_INGREDIENTS = IngredientInRecipe._meta.db_table
+SHOPPING_LIST = ShoppingList._meta.db_table
+PROFILE = Profile._meta.db_table
+
+# Держатели рецепта в списке покупок: все или один пользователь.
+ALL_HOLDERS = f'SELECT user_id FROM {SHOPPING_LIST} WHERE recipe_id = %s'
+ONE_HOLDER = ALL_HOLDERS + ' AND user_id = %s'
+
+ADD_SQL = (
+    f'INSERT INTO {CART} (user_id, ingredient_id, amount) '
+    f'SELECT s.user_id, i.ingredient_id, SUM(i.amount) '
+    f'FROM {RECIPE_INGREDIENTS} i '
+    f'JOIN {SHOPPING_LIST} s ON s.recipe_id = i.recipe_id '
+    f'WHERE i.recipe_id = %s AND s.user_id IN ({{holders}}) '
+    f'GROUP BY s.user_id, i.ingredient_id '
+    f'ON CONFLICT (user_id, ingredient_id) '
+    f'DO UPDATE SET amount = {CART}.amount + excluded.amount'
+)
+SUBTRACT_SQL = (
+    f'UPDATE {CART} SET amount = amount - ('
+    f'SELECT SUM(i.amount) FROM {RECIPE_INGREDIENTS} i '
+    f'WHERE i.recipe_id = %s AND i.ingredient_id = {CART}.ingredient_id) '
+    f'WHERE ingredient_id IN ('
+    f'SELECT ingredient_id FROM {RECIPE_INGREDIENTS} WHERE recipe_id = %s) '
+    f'AND user_id IN ({{holders}})'
+)
+CLEANUP_SQL = (
+    f'DELETE FROM {CART} WHERE amount <= 0 AND user_id IN ({{holders}})'
+)
+TOUCH_SQL = (
+    f'UPDATE {PROFILE} SET cart_version = cart_version + 1 '
+    f'WHERE user_id IN ({{holders}})'
+)
+
+
+def _holders(recipe_id, user_id=None):
+    if user_id is None:
+        return ALL_HOLDERS, [recipe_id]
+    return ONE_HOLDER, [recipe_id, user_id]
+
+
+def _add(recipe_id, user_id=None):
+    holders, params = _holders(recipe_id, user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(ADD_SQL.format(holders=holders), [recipe_id] + params)
+        cursor.execute(TOUCH_SQL.format(holders=holders), params)
+
+
+def _subtract(recipe_id, user_id=None):
+    holders, params = _holders(recipe_id, user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(SUBTRACT_SQL.format(holders=holders),
+                       [recipe_id, recipe_id] + params)
+        cursor.execute(CLEANUP_SQL.format(holders=holders), params)
+        cursor.execute(TOUCH_SQL.format(holders=holders), params)
+
+
+def add_to_cart(user, recipe):
+    """
+    Добавляет рецепт в список покупок. Ингредиенты в сумму и счётчик
+    рецепта добавляет сигнал, в той же транзакции.
+    """
+    with transaction.atomic():
+        ShoppingList.objects.create(user=user, recipe=recipe)
+
+
+def remove_from_cart(shopping_list):
+    """ Убирает рецепт из списка покупок, сумму и счётчик правит сигнал """
+    with transaction.atomic():
+        shopping_list.delete()
+
+
+def put_in_cart(shopping_list):
+    """ Учитывает добавленную строку списка покупок в суммах и счётчике """
+    _add(shopping_list.recipe_id, shopping_list.user_id)
+    shift_recipe(shopping_list.recipe_id, 'shopping_cart_count', 1)
+
+
+def take_from_cart(shopping_list):
+    """
+    Вычитает строку списка покупок из сумм и счётчика. Вызывается до
+    удаления строки: вычитание находит держателя по ней.
+    """
+    _subtract(shopping_list.recipe_id, shopping_list.user_id)
+    shift_recipe(shopping_list.recipe_id, 'shopping_cart_count', -1)
+
+
+def withdraw_recipe(recipe_id):
+    """
+    Вычитает ингредиенты рецепта из списков всех, у кого он в покупках.
+    Вызывается перед изменением состава рецепта.
+    """
+    _subtract(recipe_id)
+
+
+def restore_recipe(recipe_id):
+    """ Возвращает в списки покупок ингредиенты рецепта после изменения """
+    _add(recipe_id)
+
+
+def cart_rows(user):
+    """
+    Суммарное количество каждого ингредиента из списка покупок,
+    отсортированное по названию. Строки читаются курсором на стороне
+    сервера порциями по CHUNK_SIZE.
+    """
+    return ShoppingCartIngredient.objects.filter(
+        user=user
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        amount=Sum('amount')
+    ).order_by(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def touch_carts(user_ids):
+    """ Меняет версию выгрузки списка покупок у пользователей """
+    Profile.objects.filter(user_id__in=user_ids).update(
+        cart_version=F('cart_version') + 1)
+
+
+def cart_etag(user, file_format):
+    """
+    ETag выгрузки списка покупок по версии из профиля: она растёт при
+    каждом изменении сумм ингредиентов, их названий или единиц
+    измерения. Проверка стоит одного запроса по первичному ключу.
+    """
+    version = Profile.objects.filter(user=user).values_list(
+        'cart_version', flat=True).first()
+    return hashlib.md5(
+        f'{user.pk}:{file_format}:{version}'.encode()).hexdigest()
+
+
+def sync_cart_totals(fix=True):
+    """
+    Сверяет суммы ингредиентов со списками покупок и, если fix, чинит
+    расхождения. Возвращает число недостающих, неверных и лишних строк.
+    """
+    actual = {
+        (user, ingredient): (pk, amount)
+        for pk, user, ingredient, amount in
+        ShoppingCartIngredient.objects.order_by().values_list(
+            'id', 'user', 'ingredient', 'amount').iterator(
+                chunk_size=CHUNK_SIZE)
+    }
+    expected = IngredientInRecipe.objects.filter(
+        recipe__recipe_shopping__isnull=False
+    ).values_list(
+        'recipe__recipe_shopping__user', 'ingredient'
+    ).annotate(
+        amount=Sum('amount')
+    ).order_by().iterator(chunk_size=CHUNK_SIZE)
+    missing, changed, stale_users = [], [], set()
+    for user, ingredient, amount in expected:
+        pk, stored = actual.pop((user, ingredient), (None, None))
+        if pk is None:
+            missing.append(ShoppingCartIngredient(
+                user_id=user, ingredient_id=ingredient, amount=amount))
+        elif stored != amount:
+            changed.append(ShoppingCartIngredient(id=pk, amount=amount))
+        else:
+            continue
+        stale_users.add(user)
+    extra = [pk for pk, _ in actual.values()]
+    stale_users.update(user for user, _ in actual)
+
+    if fix:
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.bulk_create(
+                missing, batch_size=BATCH_SIZE)
+            ShoppingCartIngredient.objects.bulk_update(
+                changed, ['amount'], batch_size=BATCH_SIZE)
+            for start in range(0, len(extra), BATCH_SIZE):
+                ShoppingCartIngredient.objects.filter(
+                    id__in=extra[start:start + BATCH_SIZE]).delete()
+            stale_users = sorted(stale_users)
+            for start in range(0, len(stale_users), BATCH_SIZE):
+                touch_carts(stale_users[start:start + BATCH_SIZE])
+    return len(missing), len(changed), len(extra)
+
+
+class _Echo:
+    """ Псевдобуфер для csv.writer: возвращает записанное вместо записи """
+
+    def write(self, value):
+        return value
+
+
+def render_txt(rows):
+    for name, unit, amount in rows:
+        yield f'{name}({unit}) - {amount}\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_json(rows):
+    separator = '[\n'
+    for name, unit, amount in rows:
+        yield separator + json.dumps(
+            {'name': name, 'measurement_unit': unit, 'amount': amount},
+            ensure_ascii=False)
+        separator = ',\n'
+    yield '[]\n' if separator == '[\n' else '\n]\n'
+
+
+RENDERERS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'json': render_json,
+}
@@ -0,0 +1,170 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_migrate,
+                                      post_save, pre_delete, pre_save)
+from django.dispatch import receiver
+
+from app.catalog import invalidate_snapshot
+from app.counters import shift_profile, shift_recipe
+from app.feed import follow, publish, unfollow
+from app.images import refresh_recipe_derivatives
+from app.ingredient_index import ingredient_index
+from app.pantry_index import pantry_index
+from app.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                        ShoppingCartIngredient, ShoppingList, Tag)
+from app.recipe_search import ensure_sqlite_triggers
+from app.response_cache import bump_data_version
+from app.shopping_cart import put_in_cart, take_from_cart, touch_carts
+from app.tag_masks import drop_tag_bit, free_bit, sync_tag_masks
+from users.models import Profile, Subscriptions
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_catalog(**kwargs):
+    ingredient_index.invalidate()
+    invalidate_snapshot('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_snapshot(**kwargs):
+    invalidate_snapshot('tags')
+
+
+@receiver(pre_save, sender=Tag)
+def assign_tag_bit(instance, raw=False, **kwargs):
+    if instance.bit is None and not raw:
+        instance.bit = free_bit()
+
+
+@receiver(pre_delete, sender=Tag)
+def drop_deleted_tag_from_masks(instance, **kwargs):
+    drop_tag_bit(instance)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def refresh_tag_masks(instance, action, reverse, pk_set, **kwargs):
+    # Админка и tags.set() меняют связи через менеджер; со стороны тега
+    # clear() не передаёт pk_set, поэтому рецепты запоминаются заранее.
+    if reverse and action == 'pre_clear':
+        instance._cleared_recipes = list(
+            instance.recipes.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            recipe_ids = [instance.pk]
+        elif action == 'post_clear':
+            recipe_ids = instance.__dict__.pop('_cleared_recipes', [])
+        else:
+            recipe_ids = pk_set
+        sync_tag_masks(recipe_ids)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_cached_responses(**kwargs):
+    bump_data_version()
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_cached_responses_on_user_change(update_fields=None, **kwargs):
+    # Вход по токену обновляет только last_login, это не видно в API.
+    if update_fields != frozenset(('last_login',)):
+        bump_data_version()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def refresh_pantry_index(instance, **kwargs):
+    recipe_id = instance.id
+    transaction.on_commit(lambda: pantry_index.invalidate(recipe_id))
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_derivatives(instance, **kwargs):
+    image = instance.image
+    if image and instance.image_derivatives_for != image.name:
+        transaction.on_commit(lambda: refresh_recipe_derivatives(instance))
+
+
+@receiver(post_save, sender=Favorite)
+def count_added_favorite(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        shift_recipe(instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def count_removed_favorite(instance, **kwargs):
+    shift_recipe(instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingList)
+def put_added_recipe_in_cart(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        put_in_cart(instance)
+
+
+# Удаление рецепта или пользователя каскадом удаляет строки списка
+# покупок, и каждая вычитается здесь, пока её ингредиенты на месте.
+@receiver(pre_delete, sender=ShoppingList)
+def take_removed_recipe_from_cart(instance, **kwargs):
+    take_from_cart(instance)
+
+
+# Название и единица измерения попадают в выгрузку списка покупок, а
+# удаление ингредиента каскадом убирает его из сумм.
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def touch_carts_with_ingredient(instance, created=False, raw=False,
+                                **kwargs):
+    if not created and not raw:
+        touch_carts(ShoppingCartIngredient.objects.filter(
+            ingredient=instance).values('user_id'))
+
+
+@receiver(post_save, sender=User)
+def create_profile(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Profile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Subscriptions)
+def count_added_follower(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        shift_profile(instance.author_id, 'followers_count', 1)
+        follow(instance.user_id, instance.author_id)
+
+
+# Удаление пользователя каскадом удаляет его подписки и подписчиков,
+# и каждая подписка вычитается здесь.
+@receiver(post_delete, sender=Subscriptions)
+def count_removed_follower(instance, **kwargs):
+    shift_profile(instance.author_id, 'followers_count', -1)
+    unfollow(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(instance, created, **kwargs):
+    if created:
+        shift_profile(instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_save, sender=Recipe)
+def push_to_feeds(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(
+            lambda: publish(instance.id, instance.author_id))
+
+
+@receiver(pre_delete, sender=Recipe)
+def count_deleted_recipe(instance, **kwargs):
+    shift_profile(instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    if sender.name == 'app':
+        ensure_sqlite_triggers(using)
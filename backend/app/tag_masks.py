@@ -0,0 +1,92 @@
+from collections import defaultdict
+
+from django.db.models import F
+
+from app.models import Recipe, Tag
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 2000
+# Маска хранится в знаковом BigIntegerField: старший бит не занимаем.
+MASK_BITS = 63
+
+
+def mask_of(bits):
+    """ Маска из номеров битов; теги без бита в маску не входят """
+    mask = 0
+    for bit in bits:
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
+
+
+def free_bit():
+    """ Младший свободный бит или None, если все MASK_BITS заняты """
+    used = set(Tag.objects.exclude(bit=None).values_list('bit', flat=True))
+    return next((bit for bit in range(MASK_BITS) if bit not in used), None)
+
+
+def tag_bits(slugs):
+    """
+    {слаг: бит} тегов из slugs. Читается из базы при каждом вызове:
+    тег, созданный или удалённый в другом процессе, сразу виден, и
+    освобождённый бит не приписывается прежнему тегу.
+    """
+    return dict(Tag.objects.filter(slug__in=slugs).values_list('slug', 'bit'))
+
+
+def with_tag_bits(queryset, mask, name='tag_bits'):
+    """ Добавляет псевдоним name: общие биты маски рецепта и mask """
+    return queryset.alias(**{name: F('tag_mask').bitand(mask)})
+
+
+def _actual_masks(recipe_ids=None):
+    links = Recipe.tags.through.objects.exclude(tag__bit=None).order_by()
+    if recipe_ids is not None:
+        links = links.filter(recipe_id__in=recipe_ids)
+    masks = defaultdict(int)
+    for recipe_id, bit in links.values_list('recipe_id', 'tag__bit').iterator(
+            chunk_size=CHUNK_SIZE):
+        masks[recipe_id] |= 1 << bit
+    return masks
+
+
+def assign_tag_bits():
+    """ Выдаёт биты тегам, у которых их нет; возвращает число таких """
+    assigned = 0
+    for tag in Tag.objects.filter(bit=None).order_by('id'):
+        tag.bit = free_bit()
+        if tag.bit is None:
+            break
+        tag.save(update_fields=['bit'])
+        assigned += 1
+    return assigned
+
+
+def sync_tag_masks(recipe_ids=None, fix=True):
+    """
+    Сверяет маски тегов рецептов (всех, если recipe_ids не задан) с
+    таблицей связей рецептов и тегов и, если fix, записывает только
+    неверные. Возвращает число расхождений.
+    """
+    masks = _actual_masks(recipe_ids)
+    recipes = Recipe.objects.order_by()
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+    stale = [
+        Recipe(id=recipe_id, tag_mask=masks.get(recipe_id, 0))
+        for recipe_id, mask in recipes.values_list(
+            'id', 'tag_mask').iterator(chunk_size=CHUNK_SIZE)
+        if mask != masks.get(recipe_id, 0)
+    ]
+    if fix and stale:
+        Recipe.objects.bulk_update(stale, ['tag_mask'], batch_size=BATCH_SIZE)
+    return len(stale)
+
+
+def drop_tag_bit(tag):
+    """ Снимает бит удаляемого тега с масок рецептов одним UPDATE """
+    if tag.bit is None:
+        return
+    bit = 1 << tag.bit
+    with_tag_bits(Recipe.objects.all(), bit).filter(tag_bits=bit).update(
+        tag_mask=F('tag_mask') - bit)
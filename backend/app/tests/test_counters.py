@@ -0,0 +1,127 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from app.counters import (add_favorite, remove_favorite, subscribe,
+                          sync_counters)
+from app.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                        ShoppingCartIngredient, ShoppingList, Tag)
+from app.response_cache import VERSION_KEY
+from app.shopping_cart import add_to_cart, sync_cart_totals
+from users.models import Profile, Subscriptions
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    """ Счётчики и суммы покупок верны при любом пути записи """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'cook', 'cook@example.com', 'password')
+        cls.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        cls.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                     slug='lunch')
+        cls.flour = Ingredient.objects.create(name='мука',
+                                              measurement_unit='г')
+        cls.milk = Ingredient.objects.create(name='молоко',
+                                             measurement_unit='мл')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Блины', text='Смешать и пожарить.',
+            cooking_time=10, image='recipes/test.jpg')
+        cls.recipe.tags.add(cls.tag)
+        IngredientInRecipe.objects.create(recipe=cls.recipe,
+                                          ingredient=cls.flour, amount=200)
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        missing, stale = sync_counters(fix=False)
+        self.assertEqual((missing, sum(stale.values())), (0, 0))
+        self.assertEqual(sync_cart_totals(fix=False), (0, 0, 0))
+
+    def counters(self):
+        return Recipe.objects.values_list(
+            'favorites_count', 'shopping_cart_count').get(pk=self.recipe.pk)
+
+    def test_favorite_changes_count_and_data_version(self):
+        client = APIClient()
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertEqual(client.get(url).data['favorites_count'], 0)
+        add_favorite(self.user, self.recipe)
+        self.assertEqual(client.get(url).data['favorites_count'], 1)
+        version = cache.get(VERSION_KEY)
+        remove_favorite(Favorite.objects.get(user=self.user))
+        self.assertNotEqual(cache.get(VERSION_KEY), version)
+        self.assertEqual(client.get(url).data['favorites_count'], 0)
+
+    def test_queryset_deletes_keep_counters(self):
+        add_favorite(self.user, self.recipe)
+        add_favorite(self.author, self.recipe)
+        add_to_cart(self.user, self.recipe)
+        add_to_cart(self.author, self.recipe)
+        self.assertEqual(self.counters(), (2, 2))
+        Favorite.objects.filter(user=self.user).delete()
+        ShoppingList.objects.filter(user=self.user).delete()
+        self.assertEqual(self.counters(), (1, 1))
+        self.assertFalse(ShoppingCartIngredient.objects.filter(
+            user=self.user).exists())
+
+    def test_user_delete_keeps_counters(self):
+        add_favorite(self.user, self.recipe)
+        add_to_cart(self.user, self.recipe)
+        self.user.delete()
+        self.assertEqual(self.counters(), (0, 0))
+
+    def followers(self, user):
+        return Profile.objects.get(user=user).followers_count
+
+    def test_subscription_deletes_keep_followers_count(self):
+        subscribe(self.user, self.author)
+        subscribe(self.admin, self.author)
+        subscribe(self.author, self.user)
+        self.assertEqual(self.followers(self.author), 2)
+        Subscriptions.objects.filter(user=self.user).delete()
+        self.assertEqual(self.followers(self.author), 1)
+        self.admin.delete()
+        self.assertEqual(self.followers(self.author), 0)
+        self.assertEqual(self.followers(self.user), 1)
+        self.author.delete()
+        self.assertEqual(self.followers(self.user), 0)
+
+    def test_recipe_delete_empties_carts(self):
+        add_to_cart(self.user, self.recipe)
+        add_favorite(self.user, self.recipe)
+        self.recipe.delete()
+        self.assertFalse(ShoppingCartIngredient.objects.exists())
+
+    def test_admin_inline_updates_cart_totals(self):
+        add_to_cart(self.user, self.recipe)
+        row = self.recipe.ingredient_list.get()
+        client = APIClient()
+        client.force_login(self.admin)
+        prefix = 'ingredient_list'
+        response = client.post(
+            f'/admin/app/recipe/{self.recipe.id}/change/', {
+                'author': self.author.id, 'name': 'Блины',
+                'text': 'Тонкие.', 'cooking_time': 15,
+                'tags': [self.tag.id],
+                f'{prefix}-TOTAL_FORMS': 2,
+                f'{prefix}-INITIAL_FORMS': 1,
+                f'{prefix}-0-id': row.id,
+                f'{prefix}-0-recipe': self.recipe.id,
+                f'{prefix}-0-ingredient': self.flour.id,
+                f'{prefix}-0-amount': 150,
+                f'{prefix}-1-recipe': self.recipe.id,
+                f'{prefix}-1-ingredient': self.milk.id,
+                f'{prefix}-1-amount': 300,
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(dict(ShoppingCartIngredient.objects.values_list(
+            'ingredient__name', 'amount')), {'мука': 150, 'молоко': 300})
@@ -0,0 +1,136 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+
+from app import feed
+from app.models import Recipe, TimelineEntry
+from users.models import Subscriptions
+
+User = get_user_model()
+
+
+def create_recipe(author, name):
+    return Recipe.objects.create(
+        author=author, name=name, text='Приготовить.', cooking_time=10,
+        image='recipes/test.jpg')
+
+
+class FeedTests(TestCase):
+    """ Лента подписок: раскладка, подписка, отписка, обрезка, курсор """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        cls.reader = User.objects.create_user(
+            'reader', 'reader@example.com', 'password')
+        cls.stranger = User.objects.create_user(
+            'stranger', 'stranger@example.com', 'password')
+        cls.old = [create_recipe(cls.author, f'Старый {number}')
+                   for number in range(1, 4)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def subscribe(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+
+    def feed_names(self):
+        response = self.client.get('/api/recipes/feed/?limit=100')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_subscribe_backfills_and_unsubscribe_clears(self):
+        self.assertEqual(self.feed_names(), [])
+        self.subscribe()
+        self.assertEqual(self.feed_names(),
+                         ['Старый 3', 'Старый 2', 'Старый 1'])
+        self.assertEqual(self.client.delete(
+            f'/api/users/{self.author.id}/subscribe/').status_code, 204)
+        self.assertEqual(self.feed_names(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_new_recipe_reaches_followers_only(self):
+        self.subscribe()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(self.author, 'Новый')
+        self.assertEqual(self.feed_names()[0], 'Новый')
+        self.client.force_authenticate(self.stranger)
+        self.assertEqual(self.feed_names(), [])
+
+    def test_feed_is_trimmed_to_its_length(self):
+        Subscriptions.objects.create(user=self.reader, author=self.author)
+        feed.follow(self.reader.id, self.author.id, length=2)
+        self.assertEqual(self.feed_names(), ['Старый 3', 'Старый 2'])
+        with mock.patch.object(feed.trim, '__defaults__', (2,)):
+            with self.captureOnCommitCallbacks(execute=True):
+                create_recipe(self.author, 'Новый')
+        self.assertEqual(self.feed_names(), ['Новый', 'Старый 3'])
+
+    def test_cursor_pages_follow_feed_order(self):
+        self.subscribe()
+        for number in range(1, 4):
+            create_recipe(self.author, f'Новый {number}')
+        feed.follow(self.reader.id, self.author.id)
+        names, url = [], '/api/recipes/feed/?limit=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 6)
+            self.assertLessEqual(len(response.data['results']), 2)
+            names += [recipe['name'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(names, [
+            'Новый 3', 'Новый 2', 'Новый 1',
+            'Старый 3', 'Старый 2', 'Старый 1'])
+
+
+class FeedFanoutTests(TransactionTestCase):
+    """ Подписчики сверх пачки запроса получают рецепт из потока """
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        self.readers = [
+            User.objects.create_user(
+                f'reader{number}', f'reader{number}@example.com', 'password')
+            for number in range(5)]
+        Subscriptions.objects.bulk_create([
+            Subscriptions(user=reader, author=self.author)
+            for reader in self.readers])
+        self.pushers = []
+
+        def publish(recipe_id, author_id):
+            pusher = feed.publish(recipe_id, author_id)
+            self.pushers.append(pusher)
+            return pusher
+
+        for patcher in (mock.patch('app.signals.publish', publish),
+                        mock.patch.object(feed, 'FANOUT_BATCH', 2)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_rest_of_followers_is_pushed_in_background(self):
+        recipe = create_recipe(self.author, 'Новый')
+        pusher, = self.pushers
+        self.assertIsNotNone(pusher)
+        pusher.join(10)
+        self.assertFalse(pusher.is_alive())
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True)),
+            {reader.id for reader in self.readers})
+
+    def test_small_fanout_stays_in_request(self):
+        Subscriptions.objects.filter(user__in=self.readers[1:]).delete()
+        recipe = create_recipe(self.author, 'Новый')
+        self.assertEqual(self.pushers, [None])
+        self.assertEqual(list(TimelineEntry.objects.filter(
+            recipe=recipe).values_list('user_id', flat=True)),
+            [self.readers[0].id])
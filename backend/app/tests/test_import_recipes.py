@@ -0,0 +1,133 @@
+import base64
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from app.models import ImportProgress, Ingredient, Recipe
+from app.recipe_import import import_batch
+
+User = get_user_model()
+
+IMAGE = 'data:image/gif;base64,' + base64.b64encode(
+    b'GIF89a\x01\x00\x01\x00\x00\x00\x00;').decode()
+
+
+class ImportFileMixin:
+    """ Файл импорта и картинки во временной MEDIA_ROOT """
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.path = os.path.join(self.media, 'recipes.ndjson')
+
+    def write(self, authors):
+        with open(self.path, 'w') as file:
+            for number, author in enumerate(authors, 1):
+                file.write(json.dumps({
+                    'author': author, 'name': f'Рецепт {number}',
+                    'text': 'Смешать.', 'cooking_time': 10, 'image': IMAGE,
+                    'ingredients': [{'name': 'мука',
+                                     'measurement_unit': 'г',
+                                     'amount': number}],
+                }, ensure_ascii=False) + '\n')
+
+    def images(self):
+        folder = os.path.join(self.media, 'recipes')
+        return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+    def run_import(self, *args):
+        call_command('import_recipes', self.path, '--batch-size', '2',
+                     *args, stdout=StringIO(), stderr=StringIO())
+
+
+class ImportRecipesTests(ImportFileMixin, TestCase):
+    """ Продолжение импорта после сбоя и картинки непринятых строк """
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('author', 'author@example.com', 'password')
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+
+    def test_failed_batch_is_retried_and_its_images_removed(self):
+        self.write(['author'] * 5)
+        calls = []
+
+        def fail_second(recipes):
+            calls.append(len(recipes))
+            if len(calls) == 2:
+                raise DatabaseError('disk I/O error')
+            return import_batch(recipes)
+
+        with mock.patch(
+                'app.management.commands.import_recipes.import_batch',
+                fail_second):
+            with self.assertRaises(CommandError):
+                self.run_import()
+        progress = ImportProgress.objects.get()
+        self.assertEqual((progress.line, progress.imported), (2, 2))
+        self.assertEqual(len(self.images()), 2)
+
+        self.run_import()
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('name', flat=True)),
+            [f'Рецепт {number}' for number in range(1, 6)])
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('image', flat=True)),
+            [f'recipes/{name}' for name in self.images()])
+        progress.refresh_from_db()
+        self.assertEqual((progress.line, progress.imported), (5, 5))
+
+    def test_rejected_rows_leave_no_images(self):
+        self.write(['author', 'nobody', 'author'])
+        self.run_import()
+        self.assertEqual(Recipe.objects.count(), 2)
+        self.assertEqual(len(self.images()), 2)
+        self.assertEqual(ImportProgress.objects.get().rejected, 1)
+
+    def test_restart_imports_from_the_beginning(self):
+        self.write(['author'] * 3)
+        self.run_import()
+        self.run_import()
+        self.assertEqual(Recipe.objects.count(), 3)
+        self.run_import('--restart')
+        self.assertEqual(Recipe.objects.count(), 6)
+        self.assertEqual(ImportProgress.objects.get().imported, 3)
+
+
+class ImportAfterCommitTests(ImportFileMixin, TransactionTestCase):
+    """ Сбой после фиксации пачки не удаляет её картинки """
+
+    def setUp(self):
+        super().setUp()
+        User.objects.create_user('author', 'author@example.com', 'password')
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+
+    def test_failing_on_commit_hook_keeps_committed_images(self):
+        self.write(['author'] * 3)
+        with mock.patch('app.recipe_import.pantry_index.invalidate_many',
+                        side_effect=RuntimeError('index is gone')):
+            with self.assertRaises(RuntimeError):
+                self.run_import()
+        progress = ImportProgress.objects.get()
+        self.assertEqual((progress.line, progress.imported), (2, 2))
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('image', flat=True)),
+            [f'recipes/{name}' for name in self.images()])
+
+        self.run_import()
+        self.assertEqual(Recipe.objects.count(), 3)
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('image', flat=True)),
+            [f'recipes/{name}' for name in self.images()])
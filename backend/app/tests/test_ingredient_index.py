@@ -0,0 +1,51 @@
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from app.ingredient_index import REFRESH_INTERVAL, IngredientIndex, _Snapshot
+
+
+def catalog(*names):
+    return _Snapshot([(number, name, 'г')
+                      for number, name in enumerate(names, 1)], {})
+
+
+class IngredientIndexRefreshTests(SimpleTestCase):
+    """ Устаревший индекс пересобирается в фоне, не в потоке запроса """
+
+    def setUp(self):
+        self.index = IngredientIndex()
+        self.index._snapshot = catalog('мука')
+        self.index._snapshot.built_at -= REFRESH_INTERVAL + 1
+        self.release = threading.Event()
+
+    def build(self, *names):
+        def build():
+            self.release.wait(5)
+            return catalog(*names)
+        return mock.patch.object(self.index, '_build', build)
+
+    def names(self, query):
+        return [record['name'] for record in self.index.search(query)]
+
+    def test_stale_index_answers_while_rebuilt_in_background(self):
+        with self.build('мука', 'мускат'):
+            self.assertEqual(self.names('му'), ['мука'])
+            refresher = self.index._refresher
+            self.assertEqual(self.names('му'), ['мука'])
+            self.assertIs(self.index._refresher, refresher)
+            self.release.set()
+            refresher.join(5)
+        self.assertEqual(self.names('му'), ['мука', 'мускат'])
+        self.assertIsNone(self.index._refresher)
+
+    def test_invalidate_wins_over_older_background_build(self):
+        with self.build('мука', 'мускат'):
+            self.names('му')
+            refresher = self.index._refresher
+            self.index.invalidate()
+            self.index._snapshot = catalog('мука', 'мёд')
+            self.release.set()
+            refresher.join(5)
+        self.assertEqual(self.names('м'), ['мёд', 'мука'])
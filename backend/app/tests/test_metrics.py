@@ -0,0 +1,105 @@
+import re
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template.response import SimpleTemplateResponse
+from django.test import TestCase, override_settings
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from app.models import Recipe
+from app.serializers import RecipeReadSerializer
+
+User = get_user_model()
+
+PAUSE = 0.02
+
+
+def slowed(method):
+    def slow(*args, **kwargs):
+        time.sleep(PAUSE)
+        return method(*args, **kwargs)
+    return slow
+
+
+def timings(response):
+    return {name: float(duration) for name, duration in re.findall(
+        r'(\w+);dur=([\d.]+)', response['Server-Timing'])}
+
+
+@override_settings(METRICS_DIR='', METRICS_TOKEN='')
+class RequestMetricsTests(TestCase):
+    """ Server-Timing по фазам запроса и гистограммы на /metrics """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'cook', 'cook@example.com', 'password')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Блины', text='Пожарить.', cooking_time=10,
+            image='recipes/test.jpg')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def check_phases(self, client):
+        with mock.patch.object(
+                RecipeReadSerializer, 'to_representation',
+                slowed(RecipeReadSerializer.to_representation)):
+            serialized = timings(client.get(self.url))
+        cache.clear()
+        with mock.patch.object(JSONRenderer, 'render',
+                               slowed(JSONRenderer.render)):
+            response = client.get(self.url)
+        rendered = timings(response)
+        self.assertGreaterEqual(serialized['ser'], PAUSE * 1000)
+        self.assertLess(serialized['render'], PAUSE * 1000)
+        self.assertGreaterEqual(rendered['render'], PAUSE * 1000)
+        self.assertLess(rendered['ser'], PAUSE * 1000)
+        self.assertGreaterEqual(rendered['total'],
+                                rendered['ser'] + rendered['render'])
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* SQL"')
+
+    def test_phases_of_rendered_and_cached_responses(self):
+        self.check_phases(self.client)
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.check_phases(self.client)
+
+    def test_library_classes_are_not_patched(self):
+        self.client.get(self.url)
+        for owner, attribute in (
+                (serializers.Serializer, 'data'),
+                (serializers.ListSerializer, 'data'),
+                (SimpleTemplateResponse, 'rendered_content'),
+                (Response, 'rendered_content')):
+            self.assertEqual(owner.__dict__[attribute].fget.__module__,
+                             owner.__module__)
+
+    def test_metrics_endpoint_reports_route(self):
+        self.client.get(self.url)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertRegex(
+            text, r'http_requests_total\{route="recipes-detail",'
+                  r'method="GET",status="200"\} [1-9]')
+        self.assertRegex(
+            text, r'http_request_db_queries_count\{route="recipes-detail",'
+                  r'method="GET"\} [1-9]')
+        self.assertIn('http_request_render_seconds_bucket{'
+                      'route="recipes-detail",method="GET",le="+Inf"}', text)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
@@ -0,0 +1,94 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from app.models import Ingredient, IngredientInRecipe, Recipe
+from app.pantry_index import PantryIndex
+from app.recipe_import import ParsedRecipe, import_batch
+
+User = get_user_model()
+
+
+class PantryIndexTests(TestCase):
+    """ Индекс подхватывает рецепты из импорта и изменения при сборке """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        cls.flour = Ingredient.objects.create(name='мука',
+                                              measurement_unit='г')
+        cls.recipe(1)
+
+    @classmethod
+    def recipe(cls, amount):
+        recipe = Recipe.objects.create(
+            author=cls.author, name=f'Хлеб {amount}', text='Испечь.',
+            cooking_time=10, image='recipes/test.jpg')
+        IngredientInRecipe.objects.create(recipe=recipe,
+                                          ingredient=cls.flour, amount=amount)
+        return recipe
+
+    def setUp(self):
+        self.index = PantryIndex()
+        for target in ('app.recipe_import.pantry_index',
+                       'app.views.pantry_index'):
+            patcher = mock.patch(target, self.index)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def found(self):
+        matches = self.index.search({self.flour.id})
+        return {recipe_id for recipe_id, _, _ in matches[:len(matches)]}
+
+    def parsed(self, name):
+        recipe = ParsedRecipe()
+        recipe.author, recipe.name, recipe.text = 'author', name, '.'
+        recipe.cooking_time, recipe.image = 5, 'recipes/test.jpg'
+        recipe.tags, recipe.ingredients = [], [(self.flour.id, 100)]
+        return recipe
+
+    def test_import_batch_invalidates_index(self):
+        self.index.warm()
+        with self.captureOnCommitCallbacks(execute=True):
+            import_batch([self.parsed('Лепёшка')])
+        self.assertEqual(self.found(), set(
+            Recipe.objects.values_list('id', flat=True)))
+
+    def test_pantry_finds_whole_imported_batch(self):
+        self.index.warm()
+        names = ['Лепёшка', 'Оладьи', 'Пирог']
+        with self.captureOnCommitCallbacks(execute=True):
+            import_batch([self.parsed(name) for name in names])
+        response = APIClient().post(
+            '/api/recipes/pantry/?limit=10',
+            {'ingredients': [self.flour.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {recipe['name'] for recipe in response.data['results']},
+            {'Хлеб 1', *names})
+
+    def test_change_marked_during_rebuild_is_applied_next_time(self):
+        rows = PantryIndex._rows
+        added = []
+
+        def rows_with_concurrent_change(recipe_ids=None):
+            result = [list(iterator) for iterator in rows(recipe_ids)]
+            if not added:
+                added.append(self.recipe(2))
+                self.index.invalidate(added[0].id)
+            return result
+
+        with mock.patch.object(PantryIndex, '_rows',
+                               staticmethod(rows_with_concurrent_change)):
+            self.index.warm()
+        self.assertEqual(self.found(), set(
+            Recipe.objects.values_list('id', flat=True)))
+
+    def test_reset_rebuilds_index(self):
+        self.index.warm()
+        self.index.invalidate()
+        recipe = self.recipe(3)
+        self.assertIn(recipe.id, self.found())
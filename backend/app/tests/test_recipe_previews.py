@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from app.counters import subscribe
+from app.models import Recipe
+from users.serializers import DEFAULT_RECIPES_LIMIT
+
+User = get_user_model()
+
+
+class RecipePreviewsTests(TestCase):
+    """ Рецепты в карточках авторов ограничены и без recipes_limit """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            'reader', 'reader@example.com', 'password')
+        cls.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}', text='.',
+                cooking_time=10, image='recipes/test.jpg')
+            for number in range(DEFAULT_RECIPES_LIMIT + 2)]
+        subscribe(cls.reader, cls.author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def previews(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        card = data['results'][0] if 'results' in data else data
+        self.assertEqual(card['recipes_count'], len(self.recipes))
+        return [recipe['id'] for recipe in card['recipes']]
+
+    def test_default_limit(self):
+        newest = [recipe.id for recipe in reversed(self.recipes)]
+        for url in ('/api/users/subscriptions/',
+                    f'/api/users/{self.author.id}/',
+                    '/api/users/subscriptions/?recipes_limit=abc'):
+            self.assertEqual(self.previews(url),
+                             newest[:DEFAULT_RECIPES_LIMIT])
+
+    def test_explicit_limit(self):
+        self.assertEqual(
+            len(self.previews('/api/users/subscriptions/?recipes_limit=1')),
+            1)
+        self.assertEqual(len(self.previews(
+            f'/api/users/{self.author.id}/?recipes_limit=10')),
+            len(self.recipes))
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from app.models import Recipe
+
+User = get_user_model()
+
+
+class RecipeSearchPaginationTests(TestCase):
+    """ Поиск по тексту сохраняет порядок по релевантности """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        for name, text in (('Блины', 'Пожарить.'),
+                           ('Оладьи', 'Как блины, только толще.'),
+                           ('Суп', 'Сварить.')):
+            Recipe.objects.create(author=author, name=name, text=text,
+                                  cooking_time=10, image='recipes/test.jpg',
+                                  popular_rank=Recipe.objects.count() + 1)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, query):
+        return self.client.get(f'/api/recipes/?search=блины&{query}')
+
+    def test_search_pages_keep_relevance_order(self):
+        response = self.get('limit=10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['name'] for recipe in response.data['results']],
+            ['Блины', 'Оладьи'])
+
+    def test_cursor_with_search_is_rejected(self):
+        for query in ('cursor=', 'cursor=&ordering=unknown'):
+            response = self.get(query)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('cursor', response.data)
+
+    def test_cursor_with_search_and_explicit_ordering(self):
+        response = self.get('cursor=&ordering=popular')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(self.client.get(
+            '/api/recipes/?cursor=&limit=2').status_code, 200)
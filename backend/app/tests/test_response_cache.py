@@ -0,0 +1,69 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.permissions import BasePermission
+from rest_framework.test import APIClient
+from rest_framework.throttling import AnonRateThrottle
+
+from app.models import Recipe
+from app.views import RecipeViewSet
+
+User = get_user_model()
+
+
+class TwoPerMinute(AnonRateThrottle):
+    rate = '2/min'
+
+
+class DenyAll(BasePermission):
+    def has_permission(self, request, view):
+        return False
+
+
+class AnonymousResponseCacheTests(TestCase):
+    """ Кэш ответов не обходит права и ограничения частоты """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Блины', text='Пожарить.', cooking_time=10,
+            image='recipes/test.jpg')
+        cls.url = f'/api/recipes/{cls.recipe.id}/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second['Vary'], first['Vary'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+    def test_cached_and_not_modified_responses_are_throttled(self):
+        with mock.patch.object(RecipeViewSet, 'throttle_classes',
+                               [TwoPerMinute]):
+            etag = self.client.get(self.url)['ETag']
+            self.assertEqual(self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(self.url).status_code, 429)
+            self.assertEqual(self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=etag).status_code, 429)
+
+    def test_cached_response_checks_permissions(self):
+        etag = self.client.get(self.url)['ETag']
+        with mock.patch.object(RecipeViewSet, 'permission_classes',
+                               [DenyAll]):
+            self.assertEqual(self.client.get(self.url).status_code, 401)
+            self.assertEqual(self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=etag).status_code, 401)
@@ -0,0 +1,189 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from app.models import (Ingredient, IngredientInRecipe, Recipe,
+                        ShoppingCartIngredient, ShoppingList, Tag)
+from app.shopping_cart import (add_to_cart, cart_etag, remove_from_cart,
+                               sync_cart_totals)
+
+User = get_user_model()
+
+
+class ShoppingCartFixture(TestCase):
+    """ Два пользователя, три ингредиента и два рецепта с общими """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'cook', 'cook@example.com', 'password')
+        cls.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        cls.tag = Tag.objects.create(name='Завтрак', color='#E26C2D',
+                                     slug='breakfast')
+        cls.flour = Ingredient.objects.create(name='мука',
+                                              measurement_unit='г')
+        cls.milk = Ingredient.objects.create(name='молоко',
+                                             measurement_unit='мл')
+        cls.egg = Ingredient.objects.create(name='яйца',
+                                            measurement_unit='шт')
+        cls.pancakes = cls.recipe(
+            'Блины', {cls.flour: 200, cls.milk: 500, cls.egg: 2})
+        cls.omelette = cls.recipe('Омлет', {cls.milk: 100, cls.egg: 3})
+
+    @classmethod
+    def recipe(cls, name, ingredients):
+        recipe = Recipe.objects.create(
+            author=cls.author, name=name, text='Смешать и пожарить.',
+            cooking_time=10, image='recipes/test.jpg')
+        recipe.tags.add(cls.tag)
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                               amount=amount)
+            for ingredient, amount in ingredients.items()
+        ])
+        return recipe
+
+    def totals(self, user=None):
+        return dict(ShoppingCartIngredient.objects.filter(
+            user=user or self.user).values_list('ingredient__name', 'amount'))
+
+
+class ShoppingCartTotalsTests(ShoppingCartFixture):
+    """ Суммы ингредиентов меняются вместе со списком покупок и рецептами """
+
+    def tearDown(self):
+        self.assertEqual(sync_cart_totals(fix=False), (0, 0, 0))
+
+    def test_add_sums_shared_ingredients(self):
+        add_to_cart(self.user, self.pancakes)
+        add_to_cart(self.user, self.omelette)
+        self.assertEqual(self.totals(),
+                         {'мука': 200, 'молоко': 600, 'яйца': 5})
+
+    def test_remove_subtracts_and_drops_empty_rows(self):
+        add_to_cart(self.user, self.pancakes)
+        add_to_cart(self.user, self.omelette)
+        remove_from_cart(ShoppingList.objects.get(user=self.user,
+                                                  recipe=self.pancakes))
+        self.assertEqual(self.totals(), {'молоко': 100, 'яйца': 3})
+        remove_from_cart(ShoppingList.objects.get(user=self.user,
+                                                  recipe=self.omelette))
+        self.assertEqual(self.totals(), {})
+
+    def test_carts_of_other_users_are_independent(self):
+        add_to_cart(self.user, self.pancakes)
+        add_to_cart(self.author, self.omelette)
+        self.assertEqual(self.totals(),
+                         {'мука': 200, 'молоко': 500, 'яйца': 2})
+        self.assertEqual(self.totals(self.author),
+                         {'молоко': 100, 'яйца': 3})
+
+    def test_recipe_update_changes_totals_of_every_holder(self):
+        add_to_cart(self.user, self.pancakes)
+        add_to_cart(self.user, self.omelette)
+        add_to_cart(self.author, self.pancakes)
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.patch(
+            f'/api/recipes/{self.pancakes.id}/', {
+                'name': 'Блины', 'text': 'Тонкие.', 'cooking_time': 15,
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.flour.id, 'amount': 150},
+                                {'id': self.egg.id, 'amount': 2}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.totals(),
+                         {'мука': 150, 'молоко': 100, 'яйца': 5})
+        self.assertEqual(self.totals(self.author), {'мука': 150, 'яйца': 2})
+
+    def test_recipe_delete_withdraws_it_from_carts(self):
+        add_to_cart(self.user, self.pancakes)
+        add_to_cart(self.user, self.omelette)
+        self.pancakes.delete()
+        self.assertEqual(self.totals(), {'молоко': 100, 'яйца': 3})
+
+    def test_sync_repairs_drifted_totals(self):
+        add_to_cart(self.user, self.pancakes)
+        ShoppingCartIngredient.objects.filter(
+            user=self.user, ingredient=self.milk).update(amount=1)
+        ShoppingCartIngredient.objects.filter(
+            user=self.user, ingredient=self.egg).delete()
+        ShoppingCartIngredient.objects.create(
+            user=self.author, ingredient=self.flour, amount=5)
+        self.assertEqual(sync_cart_totals(), (1, 1, 1))
+        self.assertEqual(self.totals(),
+                         {'мука': 200, 'молоко': 500, 'яйца': 2})
+        self.assertEqual(self.totals(self.author), {})
+
+
+class ShoppingCartEtagTests(ShoppingCartFixture):
+    """ ETag выгрузки меняется при любом изменении её содержимого """
+
+    def etag(self, user=None):
+        return cart_etag(user or self.user, 'txt')
+
+    def test_cart_changes_change_tag_in_one_query(self):
+        tags = [self.etag()]
+        add_to_cart(self.user, self.pancakes)
+        tags.append(self.etag())
+        add_to_cart(self.user, self.omelette)
+        tags.append(self.etag())
+        remove_from_cart(ShoppingList.objects.get(
+            user=self.user, recipe=self.omelette))
+        with self.assertNumQueries(1):
+            tags.append(self.etag())
+        self.assertEqual(len(set(tags)), 4)
+
+    def test_other_cart_changes_keep_tag(self):
+        add_to_cart(self.user, self.pancakes)
+        before = self.etag()
+        add_to_cart(self.author, self.omelette)
+        self.assertEqual(self.etag(), before)
+        self.assertNotEqual(self.etag(self.author), self.etag())
+
+    def test_ingredient_changes_change_tag(self):
+        add_to_cart(self.user, self.omelette)
+        tags = [self.etag()]
+        self.flour.name = 'мука высшего сорта'
+        self.flour.save()
+        self.assertEqual(self.etag(), tags[0])
+        self.milk.name = 'кефир'
+        self.milk.save()
+        tags.append(self.etag())
+        self.milk.measurement_unit = 'г'
+        self.milk.save()
+        tags.append(self.etag())
+        self.egg.delete()
+        tags.append(self.etag())
+        self.assertEqual(len(set(tags)), 4)
+
+    def test_repaired_totals_change_tag(self):
+        add_to_cart(self.user, self.pancakes)
+        before = self.etag()
+        ShoppingCartIngredient.objects.filter(
+            user=self.user, ingredient=self.egg).delete()
+        sync_cart_totals()
+        self.assertNotEqual(self.etag(), before)
+
+    def test_tag_depends_on_format(self):
+        add_to_cart(self.user, self.pancakes)
+        self.assertNotEqual(cart_etag(self.user, 'txt'),
+                            cart_etag(self.user, 'csv'))
+
+    def test_download_revalidates_with_if_none_match(self):
+        add_to_cart(self.user, self.pancakes)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = '/api/recipes/download_shopping_cart/'
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                         'молоко(мл) - 500\nмука(г) - 200\nяйца(шт) - 2\n')
+        etag = response['ETag']
+        self.assertEqual(
+            client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        add_to_cart(self.user, self.omelette)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
@@ -0,0 +1,93 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from app.models import Recipe, Tag
+from app.tag_masks import sync_tag_masks
+
+User = get_user_model()
+
+
+class TagMaskTests(TestCase):
+    """ Фильтры tags и tags_all по маске и её синхронизация со связями """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            'author', 'author@example.com', 'password')
+        cls.breakfast, cls.lunch, cls.dinner = (
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ('Завтрак', '#E26C2D', 'breakfast'),
+                ('Обед', '#49B64E', 'lunch'),
+                ('Ужин', '#8775D2', 'dinner')))
+        cls.porridge = cls.recipe('Каша', cls.breakfast)
+        cls.soup = cls.recipe('Суп', cls.lunch, cls.dinner)
+        cls.salad = cls.recipe('Салат', cls.breakfast, cls.lunch)
+
+    @classmethod
+    def recipe(cls, name, *tags):
+        recipe = Recipe.objects.create(
+            author=cls.author, name=name, text='Приготовить.',
+            cooking_time=10, image='recipes/test.jpg')
+        recipe.tags.add(*tags)
+        return recipe
+
+    def tearDown(self):
+        self.assertEqual(sync_tag_masks(fix=False), 0)
+
+    def names(self, query):
+        response = APIClient().get(f'/api/recipes/?{query}&limit=100')
+        self.assertEqual(response.status_code, 200)
+        return {recipe['name'] for recipe in response.data['results']}
+
+    def test_any_tags(self):
+        self.assertEqual(self.names('tags=breakfast'), {'Каша', 'Салат'})
+        self.assertEqual(self.names('tags=breakfast&tags=dinner'),
+                         {'Каша', 'Суп', 'Салат'})
+        self.assertEqual(self.names('tags=breakfast&tags=unknown'),
+                         {'Каша', 'Салат'})
+        self.assertEqual(self.names('tags=unknown'), set())
+
+    def test_all_tags(self):
+        self.assertEqual(self.names('tags_all=breakfast&tags_all=lunch'),
+                         {'Салат'})
+        self.assertEqual(self.names('tags_all=lunch&tags_all=unknown'),
+                         set())
+
+    def test_tag_without_bit_is_matched_through_links(self):
+        Tag.objects.filter(pk=self.dinner.pk).update(bit=None)
+        Recipe.objects.filter(pk=self.soup.pk).update(
+            tag_mask=1 << self.lunch.bit)
+        self.assertEqual(self.names('tags=dinner'), {'Суп'})
+        self.assertEqual(self.names('tags_all=lunch&tags_all=dinner'),
+                         {'Суп'})
+
+    def test_new_tag_is_seen_without_invalidation(self):
+        brunch = Tag.objects.create(name='Бранч', color='#FFD700',
+                                    slug='brunch')
+        self.porridge.tags.add(brunch)
+        self.assertEqual(self.names('tags=brunch'), {'Каша'})
+
+    def test_freed_bit_is_not_matched_for_old_tag(self):
+        bit = self.dinner.bit
+        self.dinner.delete()
+        supper = Tag.objects.create(name='Поздний ужин', color='#000000',
+                                    slug='supper')
+        self.assertEqual(supper.bit, bit)
+        self.assertEqual(self.names('tags=dinner'), set())
+        self.assertEqual(self.names('tags=supper'), set())
+
+    def test_m2m_changes_update_masks(self):
+        self.porridge.tags.add(self.dinner)
+        self.assertEqual(self.names('tags=dinner'), {'Суп', 'Каша'})
+        self.porridge.tags.remove(self.breakfast)
+        self.assertEqual(self.names('tags=breakfast'), {'Салат'})
+        self.lunch.recipes.remove(self.salad)
+        self.assertEqual(self.names('tags_all=breakfast&tags_all=lunch'),
+                         set())
+        self.breakfast.recipes.clear()
+        self.assertEqual(self.names('tags=breakfast'), set())
+        self.soup.tags.set([self.breakfast])
+        self.assertEqual(self.names('tags=breakfast'), {'Суп'})
+        self.assertEqual(self.names('tags=lunch'), set())
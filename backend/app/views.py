@@ -1,53 +1,84 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
+from django.db.models import F
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from app.filters import RecipeFilter, IngredientFilter
-from app.models import (Favorite, Ingredient,
-                        IngredientInRecipe, Recipe,
+from app.catalog import CatalogSnapshotMixin
+from app.counters import add_favorite, remove_favorite
+from app.filters import (IngredientFilter, RecipeFilter,
+                         RecipeOrderingFilter)
+from app.ingredient_index import (MAX_SEARCH_LIMIT, SEARCH_LIMIT,
+                                  ingredient_index)
+from app.models import (Favorite, Ingredient, Recipe,
                         ShoppingList, Tag)
-from app.pagination import CustomLimitPagination
+from app.pagination import (CustomLimitPagination, FeedPagination,
+                            ListPagination)
+from app.pantry_index import pantry_index
 from app.permission import IsAuthorOrReadOnly, IsAdminOrReadOnly
+from app.renderers import (CSVRenderer, JSONDownloadRenderer,
+                           PlainTextRenderer)
+from app.response_cache import AnonymousResponseCacheMixin
 from app.serializers import (TagSerializer, IngredientSerializer,
                              RecipeReadSerializer, RecipeCreateSerializer,
                              ShortRecipeSerializer, FavoriteSerializer,
-                             ShoppingCartSerializer)
+                             ShoppingCartSerializer, PantrySerializer,
+                             PantryRecipeSerializer)
+from app.shopping_cart import (FILENAME, RENDERERS, add_to_cart, cart_etag,
+                               cart_rows, remove_from_cart)
 
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(CatalogSnapshotMixin, AnonymousResponseCacheMixin,
+                 viewsets.ModelViewSet):
     """ Отображение тегов """
+    snapshot_name = 'tags'
+    cached_actions = ('retrieve',)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CatalogSnapshotMixin, viewsets.ModelViewSet):
     """ Отображение ингредиентов """
+    snapshot_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly,)
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = int(request.query_params.get('limit', SEARCH_LIMIT))
+        except ValueError:
+            limit = SEARCH_LIMIT
+        limit = min(max(limit, 1), MAX_SEARCH_LIMIT)
+        return Response(ingredient_index.search(name, limit))
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     """ Отображение и создание рецептов """
     queryset = Recipe.objects.all()
     serializer_class = RecipeCreateSerializer
     permission_classes = (IsAuthorOrReadOnly | IsAdminOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
     pagination_class = CustomLimitPagination
 
+    def get_queryset(self):
+        return Recipe.objects.with_details(self.request.user)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -56,6 +87,48 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return RecipeReadSerializer
         return RecipeCreateSerializer
 
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
+        filter_backends=()
+    )
+    def feed(self, request):
+        recipes = self.get_queryset().filter(
+            timeline_entries__user=request.user
+        ).annotate(feed_position=F('timeline_entries__recipe_id'))
+        page = self.paginate_queryset(recipes)
+        serializer = RecipeReadSerializer(
+            page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['post'],
+        permission_classes=[AllowAny],
+        pagination_class=ListPagination,
+        filter_backends=()
+    )
+    def pantry(self, request):
+        serializer = PantrySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pantry = set(serializer.validated_data['ingredients'])
+        author = request.query_params.get('author')
+        if author is not None:
+            author = int(author) if author.isdigit() else 0
+        page = self.paginate_queryset(pantry_index.search(
+            pantry, request.query_params.getlist('tags'), author))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        serializer = PantryRecipeSerializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page
+             if recipe_id in recipes],
+            many=True,
+            context={**self.get_serializer_context(), 'pantry': pantry,
+                     'matches': {recipe_id: (matched, size)
+                                 for recipe_id, matched, size in page}})
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -68,20 +141,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
                                                       'pk': pk})
             serializers.is_valid(raise_exception=True)
             recipe = get_object_or_404(Recipe, id=pk)
-            Favorite.objects.create(user=request.user, recipe=recipe)
+            add_favorite(request.user, recipe)
             serializers = ShortRecipeSerializer(recipe)
             return Response(
                 {'message': 'Рецепт добавлен в избранное.',
                  'data': serializers.data},
                 status=status.HTTP_201_CREATED
             )
-        get_object_or_404(
+        remove_favorite(get_object_or_404(
             Favorite, user=self.request.user,
-            recipe=get_object_or_404(Recipe, pk=pk)).delete()
-        return Response(
-            {'message': 'Рецепт успешно удален из избранного'},
-            status=status.HTTP_204_NO_CONTENT
-        )
+            recipe=get_object_or_404(Recipe, pk=pk)))
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=True,
@@ -95,39 +165,34 @@ class RecipeViewSet(viewsets.ModelViewSet):
                                                           'pk': pk})
             serializers.is_valid(raise_exception=True)
             recipe = get_object_or_404(Recipe, id=pk)
-            ShoppingList.objects.create(user=request.user, recipe=recipe)
+            add_to_cart(request.user, recipe)
             serializers = ShortRecipeSerializer(recipe)
             return Response(
                 {'message': 'Список покупок добавлен.',
                  'data': serializers.data},
                 status=status.HTTP_201_CREATED
             )
-        get_object_or_404(
+        remove_from_cart(get_object_or_404(
             ShoppingList, user=self.request.user,
-            recipe=get_object_or_404(Recipe, pk=pk)).delete()
-        return Response(
-            {'message': 'Список покупок удален'},
-            status=status.HTTP_204_NO_CONTENT
-        )
+            recipe=get_object_or_404(Recipe, pk=pk)))
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=False,
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[PlainTextRenderer, CSVRenderer,
+                          JSONDownloadRenderer]
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        recipe = (ShoppingList.objects.filter(user=user)).values_list('recipe')
-        recipe = IngredientInRecipe.objects.filter(recipe__in=recipe).values(
-            'ingredient__name', 'ingredient__measurement_unit').annotate(
-                amount=Sum('amount'))
-        shopping_cart_list = ''
-        for value in recipe:
-            shopping_cart_list += (f"{value['ingredient__name']}"
-                                   f"({value['ingredient__measurement_unit']})"
-                                   f" - {value['amount']}\n")
-
-        response = HttpResponse(shopping_cart_list, headers={
-            'Content-Type': 'text/plain',
-            'Content-Disposition':
-            'attachment; filename="shopping_cart_list.txt"'})
+        renderer = request.accepted_renderer
+        etag = quote_etag(cart_etag(request.user, renderer.format))
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers={'ETag': etag})
+        response = StreamingHttpResponse(
+            RENDERERS[renderer.format](cart_rows(request.user)),
+            content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = (
+            f'attachment; filename="{FILENAME}.{renderer.format}"')
+        response['ETag'] = etag
         return response
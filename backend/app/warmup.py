@@ -0,0 +1,20 @@
+from django.db import DatabaseError
+
+from app.catalog import CATALOGS, get_snapshot
+from app.ingredient_index import ingredient_index
+from app.pantry_index import pantry_index
+
+
+def warm_up():
+    """
+    Строит индексы ингредиентов и поиска по продуктам и слепки
+    каталогов при старте воркера, а не на первом запросе пользователя.
+    Без доступной базы (сборка образа, миграции) ничего не делает.
+    """
+    try:
+        ingredient_index.warm()
+        pantry_index.warm()
+        for name in CATALOGS:
+            get_snapshot(name)
+    except DatabaseError:
+        pass
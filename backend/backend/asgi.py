@@ -9,8 +9,45 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+from app.warmup import warm_up  # noqa: E402
+
+URLCONF = 'backend.asgi_urls'
+
+
+class Handler(ASGIHandler):
+    """
+    Обработчик Django с маршрутами backend.asgi_urls, где горячие
+    эндпоинты - асинхронные представления, и с протоколом lifespan:
+    на старте воркера строятся индексы и слепки каталогов. Импорт
+    модуля uvicorn выполняет уже в цикле событий, где ORM недоступен,
+    поэтому прогрев идёт через поток thread_sensitive.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await sync_to_async(warm_up, thread_sensitive=True)()
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        await super().__call__(scope, receive, send)
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = URLCONF
+        return request, error_response
+
+
+application = Handler()
@@ -0,0 +1,14 @@
+from django.urls import include, path
+
+from app import urls as app_urls
+from app.async_views import async_patterns
+from backend.urls import urlpatterns as sync_urlpatterns
+
+# Маршруты для backend.asgi: те же, что в backend.urls, но API рецептов,
+# тегов и ингредиентов - с асинхронными представлениями горячих
+# эндпоинтов.
+urlpatterns = [
+    path('api/', include(async_patterns(app_urls.router.urls)))
+    if getattr(pattern, 'urlconf_name', None) is app_urls else pattern
+    for pattern in sync_urlpatterns
+]
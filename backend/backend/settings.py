@@ -29,6 +29,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +71,34 @@ DATABASES = {
     }
 }
 
+if os.getenv('USE_SQLITE', 'False') == 'True':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+# Кэш хранит версию данных и ответы API для анонимных запросов.
+# При нескольких процессах gunicorn нужен общий кэш, например
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# и CACHE_LOCATION=/var/tmp/foodgram_cache.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Метрики запросов для /metrics. При нескольких процессах gunicorn
+# каждый воркер пишет свои гистограммы в METRICS_DIR, например
+# /var/tmp/foodgram_metrics, а /metrics складывает их. Без METRICS_DIR
+# /metrics показывает только свой процесс. С METRICS_TOKEN эндпоинт
+# требует заголовок Authorization: Bearer <токен>.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Индексы и слепки каталогов строятся при старте каждого воркера.
+from app.warmup import warm_up  # noqa: E402
+
+warm_up()
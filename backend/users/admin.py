@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 
+from users.models import Profile
+
 User = get_user_model
 
 
@@ -14,3 +16,11 @@ class UserAdmin(admin.ModelAdmin):
         'password',
     )
     search_fields = ('email', 'username')
+
+
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'recipes_count', 'followers_count')
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'user__email')
+    readonly_fields = ('recipes_count', 'followers_count', 'cart_version')
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.16 on 2026-10-18 11:04
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def _count(model, reference):
+    return Coalesce(Subquery(
+        model.objects.filter(**{reference: OuterRef('pk')}).order_by()
+        .values(reference).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+def create_profiles(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    Profile = apps.get_model('users', 'Profile')
+    Profile.objects.bulk_create(
+        [Profile(user_id=pk) for pk in User.objects.values_list(
+            'pk', flat=True).iterator()],
+        batch_size=1000)
+    Profile.objects.update(
+        recipes_count=_count(apps.get_model('app', 'Recipe'), 'author'),
+        followers_count=_count(
+            apps.get_model('users', 'Subscriptions'), 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0002_alter_subscriptions_options'),
+        ('app', '0011_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profile', serialize=False, to='auth.user', verbose_name='Пользователь')),
+                ('recipes_count', models.IntegerField(default=0, verbose_name='Рецептов')),
+                ('followers_count', models.IntegerField(default=0, verbose_name='Подписчиков')),
+            ],
+            options={
+                'verbose_name': 'Профиль',
+                'verbose_name_plural': 'Профили',
+            },
+        ),
+        migrations.RunPython(create_profiles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='cart_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия списка покупок'),
+        ),
+    ]
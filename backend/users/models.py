@@ -32,3 +32,38 @@ class Subscriptions(models.Model):
 
     def __str__(self):
         return f'{self.user}, {self.author}'
+
+
+class Profile(models.Model):
+    """
+    Счётчики пользователя для карточек и админки. Меняются через F()
+    вместе с рецептами и подписками, сверяются командой check_counters.
+    cart_version растёт при каждом изменении выгрузки списка покупок и
+    служит её ETag.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='profile',
+        verbose_name='Пользователь'
+    )
+    recipes_count = models.IntegerField(
+        default=0,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.IntegerField(
+        default=0,
+        verbose_name='Подписчиков'
+    )
+    cart_version = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Версия списка покупок'
+    )
+
+    class Meta:
+        verbose_name = 'Профиль'
+        verbose_name_plural = 'Профили'
+
+    def __str__(self):
+        return f'{self.user}'
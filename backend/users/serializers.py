@@ -3,11 +3,24 @@ from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from app.images import RecipeImagesField
 from app.models import Recipe
 from users.models import Subscriptions
 
 User = get_user_model()
 
+# Столько рецептов автора показывает фронтенд, если recipes_limit нет.
+DEFAULT_RECIPES_LIMIT = 3
+
+
+def recipes_limit(request):
+    """ recipes_limit из запроса, без него или с неверным - по умолчанию """
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return DEFAULT_RECIPES_LIMIT
+    return limit if limit >= 0 else DEFAULT_RECIPES_LIMIT
+
 
 class CustomCreateUserSerializer(UserCreateSerializer):
     """Сериализатор регистрации юзера"""
@@ -44,8 +57,12 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context['request']
         user = request.user
+        if not user.is_authenticated:
+            return False
         return (obj.author.filter(user=user)).exists()
 
 
@@ -53,6 +70,7 @@ class SubscriptionsRecipeSerializer(serializers.ModelSerializer):
     """Серилизатор для краткого вывода рецептов."""
 
     image = Base64ImageField(required=True, allow_null=False)
+    images = RecipeImagesField()
 
     class Meta:
         model = Recipe
@@ -60,6 +78,7 @@ class SubscriptionsRecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'images',
             'cooking_time',
         )
 
@@ -68,10 +87,11 @@ class SubscriptionsSerializer(CustomUserSerializer):
 
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
+    followers_count = serializers.SerializerMethodField()
 
     class Meta(CustomUserSerializer.Meta):
         fields = (CustomUserSerializer.Meta.fields
-                  + ('recipes', 'recipes_count'))
+                  + ('recipes', 'recipes_count', 'followers_count'))
         read_only_fields = ('email', 'username')
 
     def validate(self, attrs):
@@ -85,16 +105,22 @@ class SubscriptionsSerializer(CustomUserSerializer):
         return attrs
 
     def get_recipes(self, obj):
-        request = self.context['request']
-        recipes = obj.recipes.all()
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
-            recipes_limit = int(recipes_limit)
-            recipes = recipes[:recipes_limit]
+        if hasattr(obj, 'recipe_previews'):
+            recipes = obj.recipe_previews
+        else:
+            recipes = obj.recipes.all()[
+                :recipes_limit(self.context['request'])]
         serializer = SubscriptionsRecipeSerializer(
             recipes, many=True, read_only=True)
         return serializer.data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         recipes = obj.recipes.all()
         return recipes.count()
+
+    def get_followers_count(self, obj):
+        if hasattr(obj, 'followers_count'):
+            return obj.followers_count
+        return obj.author.count()
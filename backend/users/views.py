@@ -1,3 +1,7 @@
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Value, Window, prefetch_related_objects)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, RowNumber
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -5,9 +9,48 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from app.counters import subscribe, unsubscribe
+from app.models import Recipe
 from app.pagination import CustomLimitPagination
 from users.models import Subscriptions, User
-from users.serializers import SubscriptionsSerializer
+from users.serializers import SubscriptionsSerializer, recipes_limit
+
+DETAILED_ACTIONS = ('list', 'retrieve', 'subscriptions')
+
+
+def annotate_authors(queryset, user, subscribed=None):
+    """ Счётчики из профиля и подписка текущего пользователя без N+1 """
+    if subscribed is None and user.is_authenticated:
+        subscribed = Exists(Subscriptions.objects.filter(
+            user=user, author=OuterRef('pk')))
+    elif not isinstance(subscribed, Exists):
+        subscribed = Value(bool(subscribed), output_field=BooleanField())
+    return queryset.annotate(
+        recipes_count=Coalesce(F('profile__recipes_count'), 0),
+        followers_count=Coalesce(F('profile__followers_count'), 0),
+        is_subscribed=subscribed)
+
+
+def prefetch_recipe_previews(authors, limit):
+    """
+    Кладёт в recipe_previews первые limit рецептов каждого автора
+    (все, если limit не задан) одним запросом. Отбор делает оконная
+    функция в базе, поэтому лишние рецепты не читаются.
+    """
+    recipes = Recipe.objects.order_by('-id')
+    if limit is not None:
+        ranked = Recipe.objects.filter(
+            author__in=[author.pk for author in authors]).annotate(
+                row_number=Window(RowNumber(), partition_by=[F('author_id')],
+                                  order_by=F('id').desc()),
+        ).order_by().values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        recipes = recipes.filter(id__in=RawSQL(
+            f'SELECT id FROM ({sql}) ranked WHERE row_number <= %s',
+            (*params, limit)))
+    prefetch_related_objects(
+        authors, Prefetch('recipes', queryset=recipes,
+                          to_attr='recipe_previews'))
 
 
 class CustomUserViewSet(UserViewSet):
@@ -16,6 +59,25 @@ class CustomUserViewSet(UserViewSet):
     serializer_class = SubscriptionsSerializer
     pagination_class = CustomLimitPagination
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = annotate_authors(
+                queryset, self.request.user).order_by('id')
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None and self.action in DETAILED_ACTIONS:
+            prefetch_recipe_previews(page, recipes_limit(self.request))
+        return page
+
+    def get_object(self):
+        instance = super().get_object()
+        if self.action == 'retrieve':
+            prefetch_recipe_previews([instance], recipes_limit(self.request))
+        return instance
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -31,16 +93,13 @@ class CustomUserViewSet(UserViewSet):
                                                  context={'request': request,
                                                           'author': author})
             if serializer.is_valid(raise_exception=True):
-                Subscriptions.objects.create(user=user, author=author)
+                subscribe(user, author)
                 return Response(serializer.data,
                                 status=status.HTTP_201_CREATED)
-        get_object_or_404(
+        unsubscribe(get_object_or_404(
             Subscriptions, user=self.request.user,
-            author=author_id).delete()
-        return Response(
-            {'message': ' Подписка удалена '},
-            status=status.HTTP_204_NO_CONTENT
-        )
+            author=author_id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=False,
@@ -49,7 +108,9 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         user = request.user
-        users = User.objects.filter(author__user=user)
+        users = annotate_authors(
+            User.objects.filter(author__user=user), user,
+            subscribed=True).order_by('-id')
         pages = self.paginate_queryset(users)
         serializer = SubscriptionsSerializer(
             pages, many=True, context={'request': request})